@@ -1,16 +1,47 @@
 """
 Примеры использования Dedoc REST API
+
+Входные файлы и результаты - в локальных папках input/ и output/ или в
+S3/MinIO (INPUT_LOCATION, OUTPUT_LOCATION, см. storage/readme.md). Dedoc
+принимает только загрузку файла, поэтому файлы из S3 сначала параллельно
+скачиваются во временную директорию.
 """
 import requests
-import json
 import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Optional, Dict, Any
 
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "storage"))
+from storage import InputFiles, Storage, open_storage, result_key
+
 
 BASE_URL = "http://localhost:1231"
 INPUT_DIR = Path(__file__).parent / "input"
 OUTPUT_DIR = Path(__file__).parent / "output"
+# Расположение входных файлов и результатов: путь или s3://bucket/префикс
+INPUT_LOCATION = os.getenv("INPUT_LOCATION", str(INPUT_DIR))
+OUTPUT_LOCATION = os.getenv("OUTPUT_LOCATION", str(OUTPUT_DIR))
+# Формат результатов: json (компактный), json-pretty, json.gz, msgpack
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "json")
+# Число одновременных загрузок на сервер
+MAX_WORKERS = int(os.getenv("DEDOC_WORKERS", "8"))
+
+
+def create_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    """
+    Сессия с пулом соединений на pool_size одновременных запросов
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 def check_health() -> bool:
@@ -32,13 +63,21 @@ def check_health() -> bool:
         return True
 
 
-def parse_file(file_path: Path, output_format: Optional[str] = None) -> Dict[str, Any]:
+def parse_file(
+    file_path: Path,
+    output_format: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, Any]:
     """
     Парсинг документа из файла
     
+    Тело запроса отправляется потоково (MultipartEncoder), файл не
+    загружается в память целиком.
+    
     Args:
         file_path: Путь к файлу
         output_format: Формат вывода (опционально)
+        session: Сессия с пулом соединений (по умолчанию - отдельный запрос)
     
     Returns:
         Результат парсинга
@@ -47,30 +86,103 @@ def parse_file(file_path: Path, output_format: Optional[str] = None) -> Dict[str
         raise FileNotFoundError(f"Файл не найден: {file_path}")
     
     url = f"{BASE_URL}/upload"
-    files = {"file": (file_path.name, open(file_path, "rb"), "application/octet-stream")}
     
     params = {}
     if output_format:
         params["output_format"] = output_format
     
-    print(f"Отправка файла: {file_path.name}")
-    response = requests.post(url, files=files, params=params)
-    files["file"][1].close()
+    with open(file_path, "rb") as f:
+        encoder = MultipartEncoder(fields={"file": (file_path.name, f, "application/octet-stream")})
+        response = (session or requests).post(
+            url,
+            data=encoder,
+            headers={"Content-Type": encoder.content_type},
+            params=params,
+        )
     
     response.raise_for_status()
     return response.json()
 
 
-def save_result(result: Dict[str, Any], output_file: Path):
+def process_file(key: str, file_path: Path, session: requests.Session, storage: Storage) -> Dict[str, Any]:
+    """
+    Парсинг файла и сохранение результата сразу по готовности
+    """
+    result = parse_file(file_path, session=session)
+    save_result(result, key, storage, verbose=False)
+    return result
+
+
+def process_files(
+    files: Dict[str, Path],
+    max_workers: int = MAX_WORKERS,
+    storage: Optional[Storage] = None,
+) -> Dict[str, int]:
     """
-    Сохранение результата в файл
+    Параллельная обработка файлов с ограниченным числом запросов в полете
+    
+    Новый файл отправляется, как только завершается один из текущих, поэтому
+    сервер не простаивает между файлами, а в памяти держится не больше
+    max_workers задач.
+    
+    Args:
+        files: Ключ во входном хранилище -> локальный путь файла
+        max_workers: Максимум одновременных загрузок
+        storage: Хранилище результатов (по умолчанию OUTPUT_LOCATION)
+    
+    Returns:
+        Счетчики обработанных и неудачных файлов
     """
-    OUTPUT_DIR.mkdir(exist_ok=True)
+    stats = {"done": 0, "failed": 0}
+    session = create_session(max_workers)
+    storage = storage or open_storage(OUTPUT_LOCATION)
+    files_iter = iter(files.items())
+    start_time = time.time()
     
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+        
+        def submit_next() -> bool:
+            item = next(files_iter, None)
+            if item is None:
+                return False
+            in_flight[executor.submit(process_file, *item, session, storage)] = item[0]
+            return True
+        
+        for _ in range(max_workers):
+            if not submit_next():
+                break
+        
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    stats["done"] += 1
+                    tables = f", таблиц: {len(result['tables'])}" if "tables" in result else ""
+                    print(f"✓ {key} -> {result_key(key, OUTPUT_FORMAT)}{tables}")
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"✗ Ошибка при обработке {key}: {e}")
+                submit_next()
     
-    print(f"Результат сохранен: {output_file}")
+    session.close()
+    elapsed = time.time() - start_time
+    total = stats["done"] + stats["failed"]
+    print(f"Обработано файлов: {total} за {elapsed:.1f} с ({total / elapsed if elapsed else 0:.2f} файлов/с)")
+    return stats
+
+
+def save_result(result: Dict[str, Any], name: str, storage: Optional[Storage] = None, verbose: bool = True):
+    """
+    Сохранение результата для входного файла name в хранилище результатов
+    """
+    storage = storage or open_storage(OUTPUT_LOCATION)
+    key = storage.save_result(name, result, OUTPUT_FORMAT)
+    
+    if verbose:
+        print(f"Результат сохранен: {storage}/{key}")
 
 
 def main():
@@ -89,40 +201,19 @@ def main():
     
     print()
     
-    # Поиск файлов в папке input
-    input_files = list(INPUT_DIR.glob("*"))
-    input_files = [f for f in input_files if f.is_file()]
+    input_storage = open_storage(INPUT_LOCATION)
+    keys = input_storage.list()
     
-    if not input_files:
-        print(f"Файлы не найдены в папке: {INPUT_DIR}")
+    if not keys:
+        print(f"Файлы не найдены: {input_storage}")
         return
     
-    # Обработка каждого файла
-    for file_path in input_files:
-        print(f"\n{'=' * 60}")
-        print(f"Обработка: {file_path.name}")
-        print(f"{'=' * 60}")
-        
-        try:
-            # Парсинг файла
-            result = parse_file(file_path)
-            
-            # Сохранение результата
-            output_file = OUTPUT_DIR / f"{file_path.stem}_result.json"
-            save_result(result, output_file)
-            
-            # Вывод краткой информации
-            if "structure" in result:
-                print(f"Структура документа: {len(result.get('structure', {}).get('subparagraphs', []))} элементов")
-            if "tables" in result:
-                print(f"Найдено таблиц: {len(result.get('tables', []))}")
-            if "metadata" in result:
-                print(f"Метаданные: {result.get('metadata', {})}")
-            
-        except Exception as e:
-            print(f"Ошибка при обработке {file_path.name}: {e}")
-            import traceback
-            traceback.print_exc()
+    # Параллельная обработка файлов
+    print(f"Файлов: {len(keys)}, одновременных загрузок: {MAX_WORKERS}")
+    with InputFiles(input_storage, keys, MAX_WORKERS) as paths:
+        stats = process_files(paths)
+    if stats["failed"]:
+        print(f"Неудачных файлов: {stats['failed']}")
     
     print(f"\n{'=' * 60}")
     print("Обработка завершена")
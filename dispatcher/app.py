@@ -0,0 +1,204 @@
+"""
+Единая точка входа для парсинга документов: выбор между PyMuPDF, Dedoc и Docling
+
+Формат определяется по содержимому файла, для PDF дополнительно оцениваются
+текстовый слой, число страниц и доля сканов. Документ отправляется в самый
+дешевый бэкенд, обеспечивающий запрошенный уровень качества; при заполненной
+очереди бэкенда - в следующий подходящий.
+
+Вместо файла можно передать ссылку (url), например подписанную ссылку на объект
+в S3/MinIO: документ скачивает диспетчер, байты не проходят через клиента.
+"""
+import os
+from contextlib import asynccontextmanager
+from pathlib import PurePosixPath
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+import httpx
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from backends import QUALITY_TIERS, QueueFull, create_backends, select_backends
+from sniff import KIND_PDF, profile_pdf, sniff_format
+
+backends = create_backends()
+
+# Режим ссылок: разрешенные узлы (пусто - выключен), лимит размера документа
+FETCH_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.getenv("FETCH_ALLOWED_HOSTS", "").split(",") if host.strip()
+}
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(200 << 20)))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "60"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.client = httpx.AsyncClient()
+    yield
+    await app.state.client.aclose()
+
+
+app = FastAPI(
+    title="Document Parsing Dispatcher",
+    description="Маршрутизация документов между PyMuPDF, Dedoc и Docling по формату и уровню качества",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+
+
+async def fetch_document(client: httpx.AsyncClient, url: str) -> Tuple[str, bytes]:
+    """
+    Скачивание документа по ссылке (только узлы из FETCH_ALLOWED_HOSTS, без перенаправлений)
+
+    Returns:
+        Имя файла и содержимое
+    """
+    if not FETCH_ALLOWED_HOSTS:
+        raise HTTPException(status_code=403, detail="Загрузка по ссылке отключена: не задан FETCH_ALLOWED_HOSTS")
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise HTTPException(status_code=400, detail="Ссылка должна быть http(s) адресом")
+    if "*" not in FETCH_ALLOWED_HOSTS and parsed.hostname.lower() not in FETCH_ALLOWED_HOSTS:
+        raise HTTPException(status_code=403, detail=f"Узел не разрешен для загрузки: {parsed.hostname}")
+
+    chunks, size = [], 0
+    try:
+        async with client.stream("GET", url, follow_redirects=False, timeout=FETCH_TIMEOUT) as response:
+            if response.status_code != 200:
+                raise HTTPException(status_code=502, detail=f"Не удалось загрузить документ: HTTP {response.status_code}")
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > FETCH_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Документ больше {FETCH_MAX_BYTES} байт")
+                chunks.append(chunk)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Не удалось загрузить документ: {str(e)}")
+    return PurePosixPath(unquote(parsed.path)).name or "document", b"".join(chunks)
+
+
+async def read_document(file: Optional[UploadFile], url: Optional[str]) -> Tuple[str, bytes]:
+    """Имя и содержимое документа из загрузки или по ссылке"""
+    if (file is None) == (url is None):
+        raise HTTPException(status_code=400, detail="Передайте файл (file) или ссылку на него (url)")
+    if file is not None:
+        return file.filename, await file.read()
+    return await fetch_document(app.state.client, url)
+
+
+async def plan(content: bytes, filename: str, tier: str) -> Dict[str, Any]:
+    """Определение формата и выбор бэкендов для документа"""
+    if tier not in QUALITY_TIERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестный уровень качества: {tier}. Доступны: {', '.join(QUALITY_TIERS)}",
+        )
+
+    detected = sniff_format(content, filename)
+    profile: Optional[Dict[str, Any]] = None
+    if detected["kind"] == KIND_PDF:
+        try:
+            profile = await run_in_threadpool(profile_pdf, content)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Не удалось открыть PDF: {str(e)}")
+
+    candidates = select_backends(backends, tier, detected["kind"], detected["format"], profile)
+    if not candidates:
+        raise HTTPException(status_code=415, detail=f"Формат не поддерживается: {detected['format']}")
+
+    return {
+        "format": detected["format"],
+        "kind": detected["kind"],
+        "tier": tier,
+        "profile": profile,
+        "candidates": [backend.name for backend in candidates],
+    }
+
+
+@app.get("/")
+async def root():
+    """Информация о сервисе"""
+    return {
+        "service": "Document Parsing Dispatcher",
+        "version": "1.0.0",
+        "tiers": list(QUALITY_TIERS),
+        "endpoints": {
+            "/parse": "Парсинг документа в выбранном бэкенде",
+            "/route": "Выбор бэкенда без парсинга",
+            "/stats": "Загрузка бэкендов",
+        }
+    }
+
+
+@app.get("/health")
+async def health():
+    """Проверка состояния сервиса"""
+    return {"status": "healthy"}
+
+
+@app.get("/stats")
+async def stats():
+    """Загрузка и счетчики бэкендов"""
+    return {name: backend.stats() for name, backend in backends.items()}
+
+
+@app.post("/route")
+async def route(
+    file: Optional[UploadFile] = File(None),
+    url: Optional[str] = Form(None),
+    tier: str = Form("balanced"),
+):
+    """
+    Выбор бэкенда для документа без отправки на парсинг
+    """
+    filename, content = await read_document(file, url)
+    return await plan(content, filename, tier)
+
+
+@app.post("/parse")
+async def parse(
+    file: Optional[UploadFile] = File(None),
+    url: Optional[str] = Form(None),
+    tier: str = Form("balanced"),
+    backend: Optional[str] = Form(None),
+):
+    """
+    Парсинг документа в самом дешевом бэкенде нужного уровня качества
+
+    Параметр backend позволяет принудительно выбрать бэкенд. Вместо файла можно
+    передать ссылку url (узел из FETCH_ALLOWED_HOSTS).
+    """
+    filename, content = await read_document(file, url)
+    decision = await plan(content, filename, tier)
+
+    names = decision["candidates"]
+    if backend:
+        if backend not in backends:
+            raise HTTPException(status_code=400, detail=f"Неизвестный бэкенд: {backend}")
+        names = [backend]
+
+    for name in names:
+        try:
+            result = await backends[name].run(app.state.client, filename, content)
+        except QueueFull:
+            continue
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(
+                status_code=502,
+                detail=f"Ошибка бэкенда {name}: {e.response.status_code} {e.response.text[:500]}",
+            )
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"Бэкенд {name} недоступен: {str(e)}")
+        return {**decision, "backend": name, "result": result}
+
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Очереди бэкендов заполнены: {', '.join(names)}"},
+        headers={"Retry-After": "5"},
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8080)
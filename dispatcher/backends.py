@@ -0,0 +1,224 @@
+"""
+Бэкенды парсинга (PyMuPDF, Dedoc, Docling) и ограничение параллелизма для каждого
+"""
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+from sniff import KIND_ARCHIVE, KIND_IMAGE, KIND_OFFICE, KIND_PDF, KIND_TEXT
+
+# Уровни качества: бэкенд подходит, если его качество для формата не ниже запрошенного
+QUALITY_TIERS = {"fast": 1, "balanced": 2, "accurate": 3}
+
+
+class QueueFull(Exception):
+    """Очередь бэкенда заполнена или время ожидания слота истекло"""
+
+
+class Backend:
+    """
+    Бэкенд парсинга с ограничением одновременных запросов и очередью
+
+    Args:
+        name: Имя бэкенда
+        url: Базовый URL сервиса
+        cost: Относительная стоимость обработки (меньше - дешевле)
+        concurrency: Максимум одновременных запросов к сервису
+        queue_limit: Максимум запросов, ожидающих слота
+        queue_timeout: Максимальное ожидание слота, секунд
+        timeout: Таймаут запроса к сервису, секунд
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        cost: int,
+        concurrency: int,
+        queue_limit: int,
+        queue_timeout: float,
+        timeout: float,
+    ):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.cost = cost
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, name: str, default_url: str, cost: int, concurrency: int) -> "Backend":
+        """Настройки из переменных окружения <NAME>_URL, <NAME>_CONCURRENCY, <NAME>_QUEUE_LIMIT"""
+        prefix = name.upper()
+        return cls(
+            name=name,
+            url=os.getenv(f"{prefix}_URL", default_url),
+            cost=cost,
+            concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+            queue_limit=int(os.getenv(f"{prefix}_QUEUE_LIMIT", str(concurrency * 4))),
+            queue_timeout=float(os.getenv("QUEUE_TIMEOUT", "30")),
+            timeout=float(os.getenv(f"{prefix}_TIMEOUT", "600")),
+        )
+
+    def quality(self, kind: str, fmt: str, profile: Optional[Dict[str, Any]]) -> int:
+        """Качество обработки формата (0 - формат не поддерживается)"""
+        raise NotImplementedError
+
+    @property
+    def queue_full(self) -> bool:
+        return self._semaphore.locked() and self.waiting >= self.queue_limit
+
+    async def run(self, client: httpx.AsyncClient, filename: str, content: bytes) -> Dict[str, Any]:
+        """
+        Отправка файла в сервис с ожиданием свободного слота
+
+        Raises:
+            QueueFull: Очередь заполнена или слот не освободился за queue_timeout
+        """
+        if self.queue_full:
+            self.rejected += 1
+            raise QueueFull(self.name)
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise QueueFull(self.name)
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            result = await self.send(client, filename, content)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def send(self, client: httpx.AsyncClient, filename: str, content: bytes) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+class PyMuPDFBackend(Backend):
+    """Быстрый разбор PDF с текстовым слоем и электронных книг, которые MuPDF открывает сам"""
+
+    # Форматы с текстовым слоем, кроме PDF (CBZ и изображения без OCR не разбираются)
+    NATIVE = {"epub", "xps", "fb2", "mobi"}
+
+    def quality(self, kind, fmt, profile):
+        if fmt in self.NATIVE:
+            return 2
+        if kind != KIND_PDF or not profile or profile["encrypted"] or not profile["text_layer"]:
+            return 0
+        if profile["scanned_ratio"] > 0.5:
+            return 0
+        # Часть страниц без текстового слоя - допустимо только для fast
+        return 1 if profile["scanned_ratio"] > 0.1 else 2
+
+    async def send(self, client, filename, content):
+        response = await client.post(
+            f"{self.url}/extract_all",
+            files={"file": (filename, content, "application/octet-stream")},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+class DedocBackend(Backend):
+    """Офисные форматы, изображения (OCR), архивы, текст"""
+
+    def quality(self, kind, fmt, profile):
+        if kind == KIND_PDF and profile and profile["encrypted"]:
+            return 0
+        if kind == KIND_TEXT:
+            return 3
+        if kind in (KIND_PDF, KIND_OFFICE, KIND_IMAGE, KIND_ARCHIVE):
+            return 2
+        return 1
+
+    async def send(self, client, filename, content):
+        response = await client.post(
+            f"{self.url}/upload",
+            files={"file": (filename, content, "application/octet-stream")},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+class DoclingBackend(Backend):
+    """Наиболее точный разбор PDF, изображений и OOXML (layout-модели, OCR)"""
+
+    SUPPORTED = {"pdf", "docx", "xlsx", "pptx", "html", "md", "csv", "png", "jpeg", "tiff", "bmp"}
+
+    def quality(self, kind, fmt, profile):
+        if kind == KIND_PDF and profile and profile["encrypted"]:
+            return 0
+        return 3 if fmt in self.SUPPORTED else 0
+
+    async def send(self, client, filename, content):
+        response = await client.post(
+            f"{self.url}/convert/file",
+            files={"files": (filename, content, "application/octet-stream")},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+def create_backends() -> Dict[str, Backend]:
+    """Бэкенды с настройками из окружения"""
+    backends = [
+        PyMuPDFBackend.from_env("pymupdf", "http://host.docker.internal:8000", cost=1, concurrency=16),
+        DedocBackend.from_env("dedoc", "http://host.docker.internal:1231", cost=5, concurrency=4),
+        DoclingBackend.from_env("docling", "http://host.docker.internal:5001/v1", cost=20, concurrency=2),
+    ]
+    return {backend.name: backend for backend in backends}
+
+
+def select_backends(
+    backends: Dict[str, Backend], tier: str, kind: str, fmt: str, profile: Optional[Dict[str, Any]]
+) -> list:
+    """
+    Бэкенды, подходящие по качеству, в порядке возрастания стоимости
+
+    Если ни один бэкенд не достигает запрошенного уровня, возвращаются
+    поддерживающие формат с наилучшим доступным качеством.
+    """
+    required = QUALITY_TIERS[tier]
+    rated = [(backend.quality(kind, fmt, profile), backend) for backend in backends.values()]
+    supported = [(quality, backend) for quality, backend in rated if quality > 0]
+    if not supported:
+        return []
+
+    suitable = [backend for quality, backend in supported if quality >= required]
+    if not suitable:
+        best = max(quality for quality, _ in supported)
+        suitable = [backend for quality, backend in supported if quality == best]
+    return sorted(suitable, key=lambda backend: backend.cost)
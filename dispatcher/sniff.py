@@ -0,0 +1,143 @@
+"""
+Определение формата файла по содержимому и характеристик PDF
+"""
+import io
+import zipfile
+from typing import Any, Dict, Optional
+
+import fitz  # PyMuPDF (импортируется как fitz)
+
+# Категории форматов, по которым выбирается бэкенд
+KIND_PDF = "pdf"
+KIND_OFFICE = "office"
+KIND_IMAGE = "image"
+KIND_TEXT = "text"
+KIND_ARCHIVE = "archive"
+KIND_UNKNOWN = "unknown"
+
+_IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+]
+
+_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp")
+
+_OOXML_PREFIXES = {
+    "word/": "docx",
+    "xl/": "xlsx",
+    "ppt/": "pptx",
+}
+
+_OPENDOCUMENT_FORMATS = {
+    "application/vnd.oasis.opendocument.text": "odt",
+    "application/vnd.oasis.opendocument.spreadsheet": "ods",
+    "application/vnd.oasis.opendocument.presentation": "odp",
+}
+
+_EXTENSION_FORMATS = {
+    ".txt": ("txt", KIND_TEXT),
+    ".csv": ("csv", KIND_TEXT),
+    ".md": ("md", KIND_TEXT),
+    ".html": ("html", KIND_TEXT),
+    ".htm": ("html", KIND_TEXT),
+    ".eml": ("eml", KIND_TEXT),
+    ".rtf": ("rtf", KIND_OFFICE),
+}
+
+
+def _sniff_zip(content: bytes) -> tuple:
+    try:
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            names = archive.namelist()
+            if "mimetype" in names:
+                mimetype = archive.read("mimetype").decode("ascii", "ignore").strip()
+                if mimetype == "application/epub+zip":
+                    return "epub", KIND_OFFICE
+                if mimetype in _OPENDOCUMENT_FORMATS:
+                    return _OPENDOCUMENT_FORMATS[mimetype], KIND_OFFICE
+            for prefix, fmt in _OOXML_PREFIXES.items():
+                if any(name.startswith(prefix) for name in names):
+                    return fmt, KIND_OFFICE
+            if "[Content_Types].xml" in names and any(name.lower().endswith(".fpage") for name in names):
+                return "xps", KIND_OFFICE
+            # Комикс (CBZ): архив только из изображений, текстового слоя нет
+            files = [name for name in names if not name.endswith("/")]
+            if files and all(name.lower().endswith(_IMAGE_EXTENSIONS) for name in files):
+                return "cbz", KIND_IMAGE
+    except zipfile.BadZipFile:
+        pass
+    return "zip", KIND_ARCHIVE
+
+
+def sniff_format(content: bytes, filename: Optional[str] = None) -> Dict[str, str]:
+    """
+    Определение формата по сигнатуре содержимого (расширение - запасной вариант)
+
+    Returns:
+        Словарь с форматом (pdf, docx, png, ...) и категорией (pdf, office, image, ...)
+    """
+    head = content[:1024]
+    if b"%PDF-" in head:
+        fmt, kind = "pdf", KIND_PDF
+    elif head.startswith(b"PK\x03\x04"):
+        fmt, kind = _sniff_zip(content)
+    elif head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        # OLE2 контейнер: doc/xls/ppt
+        fmt, kind = "ole", KIND_OFFICE
+    elif head.startswith(b"Rar!") or head.startswith(b"7z\xbc\xaf\x27\x1c"):
+        fmt, kind = "archive", KIND_ARCHIVE
+    elif head.startswith(b"{\\rtf"):
+        fmt, kind = "rtf", KIND_OFFICE
+    elif content[60:68] == b"BOOKMOBI":
+        fmt, kind = "mobi", KIND_OFFICE
+    elif b"<FictionBook" in head:
+        fmt, kind = "fb2", KIND_OFFICE
+    else:
+        fmt, kind = next(
+            ((fmt, KIND_IMAGE) for signature, fmt in _IMAGE_SIGNATURES if head.startswith(signature)),
+            (None, None),
+        )
+        if fmt is None:
+            suffix = "." + filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else ""
+            fmt, kind = _EXTENSION_FORMATS.get(suffix, ("unknown", KIND_UNKNOWN))
+    return {"format": fmt, "kind": kind}
+
+
+def profile_pdf(content: bytes, sample_pages: int = 20, min_chars: int = 50) -> Dict[str, Any]:
+    """
+    Характеристики PDF: число страниц, наличие текстового слоя, доля сканов
+
+    Для больших документов проверяется равномерная выборка из sample_pages
+    страниц. Страница считается сканом, если текста на ней меньше min_chars
+    символов, а изображения есть.
+
+    Returns:
+        Словарь pages, text_layer, scanned_ratio, encrypted
+    """
+    with fitz.open(stream=content, filetype="pdf") as doc:
+        if doc.needs_pass:
+            return {"pages": len(doc), "text_layer": False, "scanned_ratio": 0.0, "encrypted": True}
+
+        pages = len(doc)
+        step = max(1, pages // sample_pages)
+        sampled = range(0, pages, step)
+        with_text = 0
+        scanned = 0
+        for index in sampled:
+            page = doc[index]
+            if len(page.get_text().strip()) >= min_chars:
+                with_text += 1
+            elif page.get_images():
+                scanned += 1
+        checked = len(sampled) or 1
+        return {
+            "pages": pages,
+            "text_layer": with_text > 0,
+            "scanned_ratio": round(scanned / checked, 3),
+            "encrypted": False,
+        }
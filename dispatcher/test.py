@@ -0,0 +1,139 @@
+"""
+Примеры использования диспетчера парсинга документов
+
+Входные файлы и результаты - в локальных папках input/ и output/ или в
+S3/MinIO (INPUT_LOCATION, OUTPUT_LOCATION, см. storage/readme.md).
+"""
+import requests
+import os
+import sys
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "storage"))
+from storage import InputFiles, map_parallel, open_storage
+
+
+BASE_URL = "http://localhost:8080"
+INPUT_DIR = Path(__file__).parent / "input"
+OUTPUT_DIR = Path(__file__).parent / "output"
+# Расположение входных файлов и результатов: путь или s3://bucket/префикс
+INPUT_LOCATION = os.getenv("INPUT_LOCATION", str(INPUT_DIR))
+OUTPUT_LOCATION = os.getenv("OUTPUT_LOCATION", str(OUTPUT_DIR))
+# Формат результатов: json (компактный), json-pretty, json.gz, msgpack
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "json")
+# 1 - передавать диспетчеру ссылку на файл в хранилище вместо содержимого
+BY_URL = os.getenv("BY_URL", "0") == "1"
+# Число одновременно обрабатываемых файлов
+JOBS = int(os.getenv("CLIENT_JOBS", "4"))
+
+
+def check_health() -> bool:
+    """
+    Проверка доступности сервиса
+    """
+    try:
+        response = requests.get(f"{BASE_URL}/health", timeout=5)
+        response.raise_for_status()
+        print(f"✓ Сервис доступен: {response.json()}")
+        return True
+    except Exception as e:
+        print(f"✗ Сервис недоступен: {e}")
+        print(f"  Убедитесь, что контейнер запущен: docker-compose up -d")
+        return False
+
+
+def parse_file(file_path: Path, tier: str = "balanced", backend: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Парсинг документа через диспетчер
+    
+    Args:
+        file_path: Путь к файлу
+        tier: Уровень качества: fast, balanced, accurate
+        backend: Принудительный выбор бэкенда (pymupdf, dedoc, docling)
+    
+    Returns:
+        Решение диспетчера и результат бэкенда
+    """
+    if not file_path.exists():
+        raise FileNotFoundError(f"Файл не найден: {file_path}")
+    
+    data = {"tier": tier}
+    if backend:
+        data["backend"] = backend
+    
+    with open(file_path, "rb") as f:
+        response = requests.post(
+            f"{BASE_URL}/parse",
+            files={"file": (file_path.name, f, "application/octet-stream")},
+            data=data,
+        )
+    
+    response.raise_for_status()
+    return response.json()
+
+
+def parse_url(url: str, tier: str = "balanced", backend: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Парсинг документа по ссылке: диспетчер скачивает файл сам
+    """
+    data = {"tier": tier, "url": url}
+    if backend:
+        data["backend"] = backend
+    response = requests.post(f"{BASE_URL}/parse", data=data)
+    response.raise_for_status()
+    return response.json()
+
+
+def save_result(result: Dict[str, Any], name: str, storage=None):
+    """
+    Сохранение результата для входного файла name в хранилище результатов
+    """
+    storage = storage or open_storage(OUTPUT_LOCATION)
+    key = storage.save_result(name, result, OUTPUT_FORMAT)
+    print(f"Результат сохранен: {storage}/{key}")
+
+
+def main():
+    """
+    Основная функция с примерами использования
+    """
+    tier = sys.argv[1] if len(sys.argv) > 1 else "balanced"
+    
+    print("=" * 60)
+    print(f"Тестирование диспетчера (уровень качества: {tier})")
+    print("=" * 60)
+    
+    if not check_health():
+        return
+    
+    input_storage = open_storage(INPUT_LOCATION)
+    output_storage = open_storage(OUTPUT_LOCATION)
+    keys = input_storage.list()
+    if not keys:
+        print(f"Файлы не найдены: {input_storage}")
+        return
+    
+    def process(key: str, file_path: Optional[Path] = None):
+        try:
+            url = input_storage.url(key) if BY_URL else None
+            result = parse_url(url, tier) if url else parse_file(file_path, tier)
+            print(f"{key}: {result['format']} -> {result['backend']}")
+            save_result(result, key, output_storage)
+        except Exception as e:
+            print(f"Ошибка при обработке {key}: {e}")
+    
+    if BY_URL and input_storage.url(keys[0]):
+        map_parallel(process, keys, JOBS)
+    else:
+        with InputFiles(input_storage, keys, JOBS) as paths:
+            map_parallel(lambda key: process(key, paths[key]), keys, JOBS)
+    
+    try:
+        print(f"\nЗагрузка бэкендов: {requests.get(f'{BASE_URL}/stats', timeout=5).json()}")
+    except Exception:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 """
 CLI утилита для тестирования Docling API (синхронные и асинхронные запросы)
+
+Результаты (--output) и пакетная обработка (convert-storage) используют
+хранилища: путь или s3://bucket/префикс (INPUT_LOCATION, OUTPUT_LOCATION, см.
+storage/readme.md). Файлы из S3 передаются docling-serve подписанной ссылкой
+(источник http), байты не проходят через клиента.
 """
 import argparse
 import requests
@@ -10,11 +15,21 @@ import sys
 import time
 import base64
 import os
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 from typing import Optional, Dict, Any
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "storage"))
+from storage import Storage, map_parallel, open_storage
+
 
 BASE_URL = "http://localhost:5001/v1"
+# Расположение входных файлов и результатов convert-storage: путь или s3://bucket/префикс
+INPUT_LOCATION = os.getenv("INPUT_LOCATION", str(Path(__file__).parent / "input"))
+OUTPUT_LOCATION = os.getenv("OUTPUT_LOCATION", str(Path(__file__).parent / "output"))
+# Формат результатов: json (компактный), json-pretty, json.gz, msgpack
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "json")
+# Число одновременно обрабатываемых файлов
+JOBS = int(os.getenv("CLIENT_JOBS", "4"))
 HEADERS = {
     "accept": "application/json",
     "Content-Type": "application/json"
@@ -157,6 +172,76 @@ def sync_convert_from_file(file_path: str, output_format: Optional[str] = None)
     return response.json()
 
 
+def storage_source(storage: Storage, key: str) -> Dict[str, Any]:
+    """
+    Источник docling-serve для файла в хранилище
+
+    S3 - подписанная ссылка (сервис скачивает файл сам), локальное хранилище -
+    содержимое в base64.
+    """
+    url = storage.url(key)
+    if url:
+        return {"kind": "http", "url": url}
+    return {
+        "kind": "file",
+        "base64_string": base64.b64encode(storage.read(key)).decode("utf-8"),
+        "filename": PurePosixPath(key).name,
+    }
+
+
+def sync_convert_from_storage(storage: Storage, key: str, output_format: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Синхронная конвертация файла из хранилища
+
+    Args:
+        storage: Входное хранилище
+        key: Ключ файла
+        output_format: Формат вывода (например, "markdown")
+
+    Returns:
+        Результат конвертации
+    """
+    payload = {"sources": [storage_source(storage, key)]}
+    if output_format:
+        payload["options"] = {"output_format": output_format}
+
+    response = requests.post(
+        f"{BASE_URL}/convert/source",
+        headers=HEADERS,
+        json=payload
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def save_output(result: Dict[str, Any], output: str, as_json: bool = False):
+    """
+    Сохранение результата по пути или в хранилище (s3://bucket/префикс/файл)
+
+    Без as_json сохраняется только содержимое документа (markdown, текст или HTML).
+    """
+    output_data = result
+    if not as_json and "document" in result:
+        doc = result.get("document", {})
+        if doc.get("md_content"):
+            output_data = doc["md_content"]
+        elif doc.get("text_content"):
+            output_data = doc["text_content"]
+        elif doc.get("html_content"):
+            output_data = doc["html_content"]
+
+    if isinstance(output_data, str):
+        data = output_data.encode("utf-8")
+    else:
+        data = json.dumps(output_data, indent=2, ensure_ascii=False).encode("utf-8")
+    if output.startswith("s3://"):
+        location, _, key = output.rpartition("/")
+    else:
+        location, key = os.path.split(os.path.abspath(output))
+    open_storage(location).write(key, data)
+    print(f"Результат сохранен в: {output}", file=sys.stderr)
+
+
 def wait_for_task_completion(task_id: str, timeout: int = 300, poll_interval: int = 2, quiet: bool = False) -> Dict[str, Any]:
     """
     Ожидание завершения задачи с периодической проверкой статуса
@@ -408,22 +493,7 @@ def cmd_convert_url(args):
                 
                 # Сохранение результата в файл, если указан
                 if args.output:
-                    output_data = result
-                    if not args.json and "document" in result:
-                        doc = result.get("document", {})
-                        if doc.get("md_content"):
-                            output_data = doc["md_content"]
-                        elif doc.get("text_content"):
-                            output_data = doc["text_content"]
-                        elif doc.get("html_content"):
-                            output_data = doc["html_content"]
-                    
-                    with open(args.output, 'w', encoding='utf-8') as f:
-                        if isinstance(output_data, str):
-                            f.write(output_data)
-                        else:
-                            json.dump(output_data, f, indent=2, ensure_ascii=False)
-                    print(f"Результат сохранен в: {args.output}", file=sys.stderr)
+                    save_output(result, args.output, args.json)
                 
                 if args.json:
                     print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -457,23 +527,7 @@ def cmd_convert_file(args):
         
         # Сохранение результата в файл, если указан
         if args.output:
-            output_data = result
-            if not args.json and "document" in result:
-                # Сохраняем только содержимое документа
-                doc = result.get("document", {})
-                if doc.get("md_content"):
-                    output_data = doc["md_content"]
-                elif doc.get("text_content"):
-                    output_data = doc["text_content"]
-                elif doc.get("html_content"):
-                    output_data = doc["html_content"]
-            
-            with open(args.output, 'w', encoding='utf-8') as f:
-                if isinstance(output_data, str):
-                    f.write(output_data)
-                else:
-                    json.dump(output_data, f, indent=2, ensure_ascii=False)
-            print(f"Результат сохранен в: {args.output}", file=sys.stderr)
+            save_output(result, args.output, args.json)
         
         if args.json:
             print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -506,22 +560,7 @@ def cmd_convert_url_sync(args):
         
         # Сохранение результата в файл, если указан
         if args.output:
-            output_data = result
-            if not args.json and "document" in result:
-                doc = result.get("document", {})
-                if doc.get("md_content"):
-                    output_data = doc["md_content"]
-                elif doc.get("text_content"):
-                    output_data = doc["text_content"]
-                elif doc.get("html_content"):
-                    output_data = doc["html_content"]
-            
-            with open(args.output, 'w', encoding='utf-8') as f:
-                if isinstance(output_data, str):
-                    f.write(output_data)
-                else:
-                    json.dump(output_data, f, indent=2, ensure_ascii=False)
-            print(f"Результат сохранен в: {args.output}", file=sys.stderr)
+            save_output(result, args.output, args.json)
         
         if args.json:
             print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -568,22 +607,7 @@ async def cmd_convert_file_async(args):
                 
                 # Сохранение результата в файл, если указан
                 if args.output:
-                    output_data = result
-                    if not args.json and "document" in result:
-                        doc = result.get("document", {})
-                        if doc.get("md_content"):
-                            output_data = doc["md_content"]
-                        elif doc.get("text_content"):
-                            output_data = doc["text_content"]
-                        elif doc.get("html_content"):
-                            output_data = doc["html_content"]
-                    
-                    with open(args.output, 'w', encoding='utf-8') as f:
-                        if isinstance(output_data, str):
-                            f.write(output_data)
-                        else:
-                            json.dump(output_data, f, indent=2, ensure_ascii=False)
-                    print(f"Результат сохранен в: {args.output}", file=sys.stderr)
+                    save_output(result, args.output, args.json)
                 
                 if args.json:
                     print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -608,6 +632,32 @@ async def cmd_convert_file_async(args):
         sys.exit(1)
 
 
+def cmd_convert_storage(args):
+    """Команда: конвертация всех файлов входного хранилища с сохранением результатов"""
+    input_storage = open_storage(args.input)
+    output_storage = open_storage(args.output)
+    keys = input_storage.list()
+    if not keys:
+        print(f"Файлы не найдены: {input_storage}", file=sys.stderr)
+        sys.exit(1)
+
+    def process(key: str) -> bool:
+        try:
+            result = sync_convert_from_storage(input_storage, key, args.format)
+            print(f"✓ {key} -> {output_storage.save_result(key, result, OUTPUT_FORMAT)}")
+            return True
+        except Exception as e:
+            print(f"✗ {key}: {e}", file=sys.stderr)
+            return False
+
+    print(f"Файлов: {len(keys)}, одновременно: {args.jobs}, результаты: {output_storage} ({OUTPUT_FORMAT})",
+          file=sys.stderr)
+    failed = map_parallel(process, keys, args.jobs).count(False)
+    if failed:
+        print(f"Неудачных файлов: {failed}", file=sys.stderr)
+        sys.exit(1)
+
+
 def cmd_status(args):
     """Команда: проверка статуса задачи"""
     try:
@@ -801,6 +851,9 @@ def create_parser():
   
   # Синхронная конвертация из URL
   python test.py convert-url-sync https://arxiv.org/pdf/2501.17887
+  
+  # Все файлы из хранилища (по умолчанию input/ -> output/; S3 - по подписанным ссылкам)
+  python test.py convert-storage --input s3://documents/input --output s3://documents/output
         """
     )
     
@@ -829,21 +882,21 @@ def create_parser():
     parser_convert_url.add_argument("--wait", action="store_true", help="Ожидать завершения конвертации")
     parser_convert_url.add_argument("--timeout", type=int, default=300, help="Таймаут ожидания в секундах (по умолчанию: 300)")
     parser_convert_url.add_argument("--poll-interval", type=int, default=2, help="Интервал проверки статуса в секундах (по умолчанию: 2)")
-    parser_convert_url.add_argument("--output", "-o", help="Путь к файлу для сохранения результата")
+    parser_convert_url.add_argument("--output", "-o", help="Путь или s3://bucket/префикс/файл для сохранения результата")
     parser_convert_url.set_defaults(func=cmd_convert_url)
     
     # Команда convert-url-sync (синхронная)
     parser_convert_url_sync = subparsers.add_parser("convert-url-sync", help="Синхронная конвертация из URL")
     parser_convert_url_sync.add_argument("url", help="URL PDF файла")
     parser_convert_url_sync.add_argument("--format", help="Формат вывода (например, markdown)")
-    parser_convert_url_sync.add_argument("--output", "-o", help="Путь к файлу для сохранения результата")
+    parser_convert_url_sync.add_argument("--output", "-o", help="Путь или s3://bucket/префикс/файл для сохранения результата")
     parser_convert_url_sync.set_defaults(func=cmd_convert_url_sync)
     
     # Команда convert-file (синхронная)
     parser_convert_file = subparsers.add_parser("convert-file", help="Синхронная конвертация из файла")
     parser_convert_file.add_argument("file", help="Путь к файлу (локальный или в контейнере, например, ./input/file.pdf или /app/input/file.pdf)")
     parser_convert_file.add_argument("--format", help="Формат вывода (например, markdown)")
-    parser_convert_file.add_argument("--output", "-o", help="Путь к файлу для сохранения результата")
+    parser_convert_file.add_argument("--output", "-o", help="Путь или s3://bucket/префикс/файл для сохранения результата")
     parser_convert_file.set_defaults(func=cmd_convert_file)
     
     # Команда convert-file-async (асинхронная)
@@ -853,9 +906,17 @@ def create_parser():
     parser_convert_file_async.add_argument("--wait", action="store_true", help="Ожидать завершения конвертации")
     parser_convert_file_async.add_argument("--timeout", type=int, default=300, help="Таймаут ожидания в секундах (по умолчанию: 300)")
     parser_convert_file_async.add_argument("--poll-interval", type=int, default=2, help="Интервал проверки статуса в секундах (по умолчанию: 2)")
-    parser_convert_file_async.add_argument("--output", "-o", help="Путь к файлу для сохранения результата")
+    parser_convert_file_async.add_argument("--output", "-o", help="Путь или s3://bucket/префикс/файл для сохранения результата")
     parser_convert_file_async.set_defaults(func=lambda args: asyncio.run(cmd_convert_file_async(args)))
     
+    # Команда convert-storage (пакетная)
+    parser_convert_storage = subparsers.add_parser("convert-storage", help="Конвертация всех файлов из хранилища")
+    parser_convert_storage.add_argument("--input", default=INPUT_LOCATION, help="Входное хранилище: путь или s3://bucket/префикс (по умолчанию: INPUT_LOCATION)")
+    parser_convert_storage.add_argument("--output", default=OUTPUT_LOCATION, help="Хранилище результатов (по умолчанию: OUTPUT_LOCATION)")
+    parser_convert_storage.add_argument("--format", help="Формат вывода (например, markdown)")
+    parser_convert_storage.add_argument("--jobs", type=int, default=JOBS, help="Одновременно обрабатываемых файлов (по умолчанию: CLIENT_JOBS или 4)")
+    parser_convert_storage.set_defaults(func=cmd_convert_storage)
+    
     # Команда status
     parser_status = subparsers.add_parser("status", help="Проверка статуса задачи")
     parser_status.add_argument("task_id", help="ID задачи")
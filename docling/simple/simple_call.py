@@ -14,40 +14,45 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+import os
+import sys
 import time
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 from docling.document_converter import DocumentConverter
 
 
 
 
-def write_to_file(text, filename):
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(text)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "storage"))
+from storage import open_storage
+
+# Входные файлы и результаты: путь или s3://bucket/префикс (см. storage/readme.md)
+INPUT_LOCATION = os.getenv("INPUT_LOCATION", "files")
+OUTPUT_LOCATION = os.getenv("OUTPUT_LOCATION", "output")
+
+
+def write_to_file(text, key, storage):
+    storage.write(key, text.encode("utf-8"), "text/markdown")
+
+
+def sources(storage):
+    """Источники для docling: подписанная ссылка (S3 - без скачивания клиентом) или локальный путь"""
+    for key in storage.list():
+        yield storage.url(key) or storage.local_path(key), f"{PurePosixPath(key).with_suffix('')}.md"
 
 
 if __name__ == "__main__":
-    input_dir = Path("files")
-    output_dir = Path("output")
-    output_dir.mkdir(exist_ok=True)
-
-    if not input_dir.exists():
-        raise FileNotFoundError(f"Input directory {input_dir} does not exist")
-
-    for source, fp_name in zip([
-        "https://arxiv.org/pdf/2408.09869", 
-        input_dir/"2408.09869v5.pdf",
-        input_dir/"765275.pdf", 
-        input_dir/"classic_mem.jpg",
-    ], [
-        "arxiv_2408.09869.md",
-        "2408.09869v5.md",
-        "765275.md",
-        "classic_mem.md",
-    ]):
+    input_storage = open_storage(INPUT_LOCATION)
+    output_storage = open_storage(OUTPUT_LOCATION)
+
+    files = list(sources(input_storage))
+    if not files:
+        raise FileNotFoundError(f"No input files in {input_storage}")
+
+    for source, key in [("https://arxiv.org/pdf/2408.09869", "arxiv_2408.09869.md")] + files:
         start_time = time.time()
         converter = DocumentConverter()
         result = converter.convert(source)
         md_content = result.document.export_to_markdown()
-        write_to_file(md_content, output_dir / fp_name)
-        logger.info(f"{source} {len(md_content)} {time.time() - start_time} seconds")
\ No newline at end of file
+        write_to_file(md_content, key, output_storage)
+        logger.info(f"{key} {len(md_content)} {time.time() - start_time} seconds")
\ No newline at end of file
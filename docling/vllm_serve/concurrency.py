@@ -0,0 +1,117 @@
+"""
+Адаптивное управление параллелизмом запросов к vLLM серверу (AIMD)
+
+Аддитивное увеличение, пока задержка страниц укладывается в целевую и ошибок
+нет; мультипликативное уменьшение при росте задержки или доле ошибок/таймаутов
+выше порога.
+"""
+import os
+import threading
+from typing import Sequence
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class AimdController:
+    """
+    AIMD-регулятор числа одновременных запросов к VLM
+
+    Args:
+        initial: Начальный уровень параллелизма
+        min_limit: Нижняя граница
+        max_limit: Верхняя граница (не больше --max-num-seqs сервера)
+        target_latency: Целевая задержка страницы (p90), секунд
+        increase_step: Шаг аддитивного увеличения
+        decrease_factor: Множитель уменьшения при перегрузке
+        max_error_rate: Допустимая доля ошибок/таймаутов в окне
+    """
+
+    def __init__(
+        self,
+        initial: int = 64,
+        min_limit: int = 4,
+        max_limit: int = 512,
+        target_latency: float = 45.0,
+        increase_step: int = 16,
+        decrease_factor: float = 0.5,
+        max_error_rate: float = 0.02,
+    ):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError(f"Invalid concurrency limits: {min_limit}..{max_limit}")
+        if not 0.0 < decrease_factor < 1.0:
+            raise ValueError(f"decrease_factor must be in (0, 1): {decrease_factor}")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.max_error_rate = max_error_rate
+        self._limit = min(max(initial, min_limit), max_limit)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, timeout: float = 90.0) -> "AimdController":
+        """
+        Создание регулятора из переменных окружения VLM_CONCURRENCY_*
+
+        Целевая задержка по умолчанию - половина таймаута запроса, чтобы
+        снижать нагрузку раньше, чем страницы начнут падать по таймауту.
+        """
+        return cls(
+            initial=_env_int("VLM_CONCURRENCY_INITIAL", 64),
+            min_limit=_env_int("VLM_CONCURRENCY_MIN", 4),
+            max_limit=_env_int("VLM_CONCURRENCY_MAX", 512),
+            target_latency=_env_float("VLM_TARGET_LATENCY", timeout / 2),
+            increase_step=_env_int("VLM_CONCURRENCY_STEP", 16),
+            decrease_factor=_env_float("VLM_CONCURRENCY_BACKOFF", 0.5),
+            max_error_rate=_env_float("VLM_MAX_ERROR_RATE", 0.02),
+        )
+
+    @property
+    def limit(self) -> int:
+        """Текущий уровень параллелизма"""
+        return self._limit
+
+    @property
+    def at_minimum(self) -> bool:
+        return self._limit <= self.min_limit
+
+    def observe(self, latencies: Sequence[float], failures: int = 0) -> int:
+        """
+        Учет результатов очередного окна страниц
+
+        Args:
+            latencies: Задержки успешно обработанных страниц, секунд
+            failures: Число страниц, завершившихся ошибкой или таймаутом
+
+        Returns:
+            Новый уровень параллелизма
+        """
+        total = len(latencies) + failures
+        if total == 0:
+            return self._limit
+
+        error_rate = failures / total
+        p90 = _percentile(latencies, 0.9) if latencies else float("inf")
+
+        with self._lock:
+            if error_rate > self.max_error_rate or p90 > self.target_latency:
+                self._limit = max(self.min_limit, int(self._limit * self.decrease_factor))
+            else:
+                self._limit = min(self.max_limit, self._limit + self.increase_step)
+            return self._limit
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(q * len(ordered)))
+    return ordered[index]
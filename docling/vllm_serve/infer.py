@@ -4,12 +4,15 @@
 
 
 import datetime
+import heapq
+import json
 import logging
 import os
 import time
 from pathlib import Path
 
 import numpy as np
+import pypdfium2
 from pydantic import TypeAdapter
 
 from docling.datamodel import vlm_model_specs
@@ -23,16 +26,120 @@ from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.pipeline.vlm_pipeline import VlmPipeline
 from docling.utils.profiling import ProfilingItem
 
+from concurrency import AimdController
+from retry import RetryPolicy, TimeBudget
+from router import ROUTE_TEXT, plan_document
+from vlm_cache import CachingProxy, PageCache
+
 _log = logging.getLogger(__name__)
 
 
+def count_pages(path: Path) -> int:
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def build_converter(vlm_options: ApiVlmOptions) -> DocumentConverter:
+    pipeline_options = VlmPipelineOptions(
+        vlm_options=vlm_options,
+        enable_remote_services=True,  # required when using a remote inference service.
+    )
+    return DocumentConverter(
+        format_options={
+            InputFormat.PDF: PdfFormatOption(
+                pipeline_cls=VlmPipeline,
+                pipeline_options=pipeline_options,
+            ),
+        }
+    )
+
+
+def parse_pages(spec: str, num_pages: int) -> list[int]:
+    """
+    Разбор списка страниц вида "1-5,9,12-" (нумерация с 1)
+    """
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            pages.update(range(int(start or 1), int(end or num_pages) + 1))
+        else:
+            pages.add(int(part))
+    return sorted(p for p in pages if 1 <= p <= num_pages)
+
+
+def format_pages(pages: list[int]) -> str:
+    """Обратное к parse_pages: [1, 2, 3, 7] -> 1-3,7"""
+    parts = []
+    for page in sorted(pages):
+        if parts and parts[-1][1] == page - 1:
+            parts[-1][1] = page
+        else:
+            parts.append([page, page])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in parts)
+
+
+def next_window(pages: list[int], limit: int) -> list[int]:
+    """Непрерывный диапазон страниц из начала списка длиной не больше limit"""
+    window = pages[:1]
+    for page in pages[1:limit]:
+        if page != window[-1] + 1:
+            break
+        window.append(page)
+    return window
+
+
+def timeout_step(timeout: float, capped: float, steps: int = 4) -> float:
+    """
+    Таймаут запроса, округленный вниз до ступени timeout / 2**k (k <= steps)
+
+    Ограниченный бюджетом таймаут меняется каждую секунду; по ступеням
+    кэшируется не больше steps + 1 конвертеров на уровень параллелизма.
+    Последнее окно может выйти за бюджет не больше чем на timeout / 2**steps.
+    """
+    step = timeout
+    for _ in range(steps):
+        if step <= capped:
+            break
+        step /= 2
+    return step
+
+
+def merge_timings(
+    total: dict[str, ProfilingItem], timings: dict[str, ProfilingItem]
+) -> dict[str, ProfilingItem]:
+    """Объединение профилей нескольких окон страниц одного документа"""
+    for key, item in timings.items():
+        if key not in total:
+            total[key] = item.model_copy(deep=True)
+            continue
+        merged = total[key]
+        merged.count += item.count
+        merged.times.extend(item.times)
+        merged.start_timestamps.extend(item.start_timestamps)
+    return total
+
+
 def main():
     logging.getLogger("docling").setLevel(logging.WARNING)
     _log.setLevel(logging.INFO)
 
-    BATCH_SIZE = 64
+    timeout = float(os.getenv("VLM_TIMEOUT", "90"))
+    controller = AimdController.from_env(timeout=timeout)
+    retry_policy = RetryPolicy.from_env()
+    # Частичный режим: сохранить сконвертированные страницы и список
+    # неудачных вместо падения всего документа
+    partial = os.getenv("VLM_PARTIAL", "0") == "1"
+    # hybrid - страницы с хорошим текстовым слоем берутся из PyMuPDF, в VLM
+    # уходят только сканы и сложные страницы; vlm - все страницы через VLM
+    routing = os.getenv("VLM_ROUTING", "hybrid")
 
-    settings.perf.page_batch_size = BATCH_SIZE
     settings.debug.profile_pipeline_timings = True
 
     # Путь к входному файлу можно задать через переменную окружения
@@ -59,61 +166,216 @@ def main():
         raise FileNotFoundError(f"Input document not found: {input_doc_path}")
 
     vllm_url = os.getenv("VLLM_URL", "http://localhost:8000/v1/chat/completions")
+
+    # Кэш ответов по хэшу изображения страницы: повторяющиеся страницы
+    # (обложки, типовые условия) не отправляются на GPU повторно
+    cache_path = os.getenv("VLM_CACHE_PATH")
+    proxy = None
+    if cache_path:
+        proxy = CachingProxy(
+            vllm_url, PageCache(Path(cache_path)), timeout=timeout, max_connections=controller.max_limit
+        ).start()
+
     vlm_options = ApiVlmOptions(
-        url=vllm_url,  # LM studio defaults to port 1234, VLLM to 8000
+        url=proxy.url if proxy else vllm_url,  # LM studio defaults to port 1234, VLLM to 8000
         params=dict(
             model=vlm_model_specs.GRANITEDOCLING_TRANSFORMERS.repo_id,
             max_tokens=4096,
             skip_special_tokens=True,
         ),
         prompt=vlm_model_specs.GRANITEDOCLING_TRANSFORMERS.prompt,
-        timeout=90,
+        timeout=timeout,
         scale=2.0,
         temperature=0.0,
-        concurrency=BATCH_SIZE,
+        concurrency=controller.limit,
         stop_strings=["", "<|end_of_text|>"],
         response_format=ResponseFormat.DOCTAGS,
     )
 
-    pipeline_options = VlmPipelineOptions(
-        vlm_options=vlm_options,
-        enable_remote_services=True,  # required when using a remote inference service.
-    )
+    # Конвертеры кэшируются по уровню параллелизма и ступени таймаута:
+    # параметры ApiVlmOptions фиксируются при инициализации пайплайна
+    converters: dict[tuple[int, float], DocumentConverter] = {}
 
-    doc_converter = DocumentConverter(
-        format_options={
-            InputFormat.PDF: PdfFormatOption(
-                pipeline_cls=VlmPipeline,
-                pipeline_options=pipeline_options,
-            ),
-        }
-    )
+    def get_converter(concurrency: int, request_timeout: float) -> DocumentConverter:
+        key = (concurrency, timeout_step(timeout, request_timeout))
+        if key not in converters:
+            start_time = time.time()
+            converter = build_converter(
+                vlm_options.model_copy(update={"concurrency": key[0], "timeout": key[1]})
+            )
+            converter.initialize_pipeline(InputFormat.PDF)
+            _log.info(
+                f"Pipeline (concurrency={key[0]}, timeout={key[1]:g}) initialized in {time.time() - start_time:.2f} seconds."
+            )
+            converters[key] = converter
+        return converters[key]
 
-    start_time = time.time()
-    doc_converter.initialize_pipeline(InputFormat.PDF)
-    end_time = time.time() - start_time
-    _log.info(f"Pipeline initialized in {end_time:.2f} seconds.")
+    num_pages = count_pages(input_doc_path)
+    pending = parse_pages(os.getenv("VLM_PAGES", "1-"), num_pages)
+    total_pages = len(pending)
+    timings: dict[str, ProfilingItem] = {}
+    page_markdown: dict[int, str] = {}
+    failed_pages: dict[int, str] = {}
+    attempts: dict[int, int] = {}
+    # Очередь повторов: (не раньше чем, порядковый номер, страницы окна)
+    retries: list[tuple[float, int, list[int]]] = []
+    retry_seq = 0
 
+    # Документ обрабатывается окнами страниц; размер окна и параллелизм
+    # подстраиваются AIMD-регулятором по задержкам и ошибкам предыдущего окна.
+    # Страницы, сконвертированные в окне (в том числе при частичном успехе),
+    # сохраняются; неудачные делятся пополам и ставятся в очередь повторов с
+    # задержкой, так что уже сконвертированные страницы не пересчитываются, а
+    # попытки расходуются только на одиночные страницы.
     now = datetime.datetime.now()
-    conv_result = doc_converter.convert(input_doc_path)
-    assert conv_result.status == ConversionStatus.SUCCESS
-
-    num_pages = len(conv_result.pages)
-    pipeline_runtime = conv_result.timings["pipeline_total"].times[0]
-    _log.info(f"Document converted in {pipeline_runtime:.2f} seconds.")
-    _log.info(f"  [efficiency]: {num_pages / pipeline_runtime:.2f} pages/second.")
-    for stage in ("page_init", "vlm"):
-        values = np.array(conv_result.timings[stage].times)
+    start_time = time.time()
+    budget = TimeBudget.from_env()
+
+    if routing == "hybrid":
+        plan = plan_document(input_doc_path, pending)
+        for page, profile in plan.items():
+            if profile["route"] == ROUTE_TEXT:
+                page_markdown[page] = profile["markdown"]
+        pending = [page for page in pending if page not in page_markdown]
         _log.info(
-            f"  [{stage}]: {np.min(values):.2f} / {np.median(values):.2f} / {np.max(values):.2f} seconds/page"
+            f"Routing: {len(page_markdown)} pages from text layer, {len(pending)} pages to VLM "
+            f"({time.time() - start_time:.2f} seconds)."
+        )
+
+    while (pending or retries) and not budget.exhausted:
+        if retries and (not pending or retries[0][0] <= time.monotonic()):
+            not_before, _, pages = heapq.heappop(retries)
+            wait = not_before - time.monotonic()
+            if wait > 0:
+                time.sleep(min(wait, budget.remaining()))
+                if budget.exhausted:
+                    heapq.heappush(retries, (not_before, retry_seq, pages))
+                    break
+            window = next_window(pages, controller.limit)
+            if len(window) < len(pages):
+                retry_seq += 1
+                heapq.heappush(retries, (time.monotonic(), retry_seq, pages[len(window):]))
+        else:
+            window = next_window(pending, controller.limit)
+            del pending[:len(window)]
+
+        concurrency = controller.limit
+        settings.perf.page_batch_size = concurrency
+        conv_result = get_converter(concurrency, budget.cap(timeout)).convert(
+            input_doc_path, page_range=(window[0], window[-1]), raises_on_error=False
+        )
+
+        if proxy:
+            # Регулятору передаются только запросы, дошедшие до vLLM
+            upstream_latencies, upstream_failures = proxy.drain_upstream_stats()
+
+        converted = []
+        if conv_result.status in (ConversionStatus.SUCCESS, ConversionStatus.PARTIAL_SUCCESS):
+            converted = [page for page in window if page in conv_result.document.pages]
+            merge_timings(timings, conv_result.timings)
+            for page in converted:
+                page_markdown[page] = conv_result.document.export_to_markdown(page_no=page)
+        failed = [page for page in window if page not in page_markdown]
+
+        if proxy:
+            latencies, failures = upstream_latencies, upstream_failures
+        else:
+            latencies = list(conv_result.timings["vlm"].times) if converted and "vlm" in conv_result.timings else []
+            failures = 0
+        new_limit = controller.observe(latencies, failures=max(failures, len(failed)))
+        if not failed:
+            _log.info(
+                f"Pages {format_pages(window)}: ok at concurrency={concurrency}, next={new_limit}"
+            )
+            continue
+        if converted:
+            _log.info(f"Pages {format_pages(converted)}: ok, {format_pages(failed)}: {conv_result.status}")
+
+        # Повторяются только неудачные страницы окна
+        window = failed
+        reason = "; ".join(e.error_message for e in conv_result.errors) or str(conv_result.status)
+        if len(window) > 1:
+            half = len(window) // 2
+            delay = retry_policy.delay(2)
+            for part in (window[:half], window[half:]):
+                retry_seq += 1
+                heapq.heappush(retries, (time.monotonic() + delay, retry_seq, part))
+            _log.warning(
+                f"Pages {format_pages(window)}: {conv_result.status} at concurrency={concurrency}, "
+                f"split and retry in {delay:.1f}s with concurrency={new_limit}"
+            )
+            continue
+
+        page = window[0]
+        attempts[page] = attempts.get(page, 0) + 1
+        if retry_policy.can_retry(attempts[page]):
+            delay = retry_policy.delay(attempts[page] + 1)
+            retry_seq += 1
+            heapq.heappush(retries, (time.monotonic() + delay, retry_seq, window))
+            _log.warning(f"Page {page}: attempt {attempts[page]} failed ({reason}), retry in {delay:.1f}s")
+        else:
+            failed_pages[page] = reason
+            _log.error(f"Page {page}: failed after {attempts[page]} attempts ({reason})")
+            if not partial:
+                raise RuntimeError(f"Page {page} of {input_doc_path} failed: {reason}")
+
+    # Страницы, не обработанные до исчерпания бюджета времени
+    for page in pending + [p for _, _, pages in retries for p in pages]:
+        failed_pages.setdefault(page, "time budget exhausted")
+    if failed_pages and not partial:
+        raise RuntimeError(
+            f"Time budget exhausted, pages not converted: {format_pages(list(failed_pages))}"
+        )
+
+    wall_time = time.time() - start_time
+    if proxy:
+        _log.info(f"VLM cache: {proxy.hits} hits / {proxy.misses} misses.")
+        proxy.stop()
+    _log.info(
+        f"Converted {len(page_markdown)}/{total_pages} pages in {wall_time:.2f} seconds wall "
+        f"({len(page_markdown) / wall_time:.2f} pages/second)."
+    )
+    if timings:
+        pipeline_runtime = sum(timings["pipeline_total"].times)
+        _log.info(f"  [pipeline]: {pipeline_runtime:.2f} seconds.")
+        for stage in ("page_init", "vlm"):
+            values = np.array(timings[stage].times)
+            _log.info(
+                f"  [{stage}]: {np.min(values):.2f} / {np.median(values):.2f} / {np.max(values):.2f} seconds/page"
+            )
+
+    output_dir = Path(os.getenv("OUTPUT_DIR", "/app/output"))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = f"{now:%Y-%m-%d_%H-%M-%S}"
+
+    markdown_file = output_dir / f"result-{input_doc_path.stem}-{stamp}.md"
+    markdown_file.write_text(
+        "\n\n".join(
+            page_markdown.get(page, f"<!-- page {page}: not converted -->")
+            for page in sorted(set(page_markdown) | set(failed_pages))
+        ),
+        encoding="utf-8",
+    )
+    _log.info(f"Markdown in {markdown_file}.")
+
+    if failed_pages:
+        failed_file = output_dir / f"result-{input_doc_path.stem}-{stamp}-failed.json"
+        failed_file.write_text(
+            json.dumps({
+                "document": str(input_doc_path),
+                "converted_pages": len(page_markdown),
+                "failed_pages": {str(page): failed_pages[page] for page in sorted(failed_pages)},
+                # Повторный запуск только для неудачных страниц
+                "retry": f"VLM_PAGES={format_pages(list(failed_pages))}",
+            }, ensure_ascii=False, indent=2),
+            encoding="utf-8",
         )
+        _log.warning(f"{len(failed_pages)} pages not converted, see {failed_file}.")
 
     TimingsT = TypeAdapter(dict[str, ProfilingItem])
-    output_dir = Path("/app/output")
-    output_dir.mkdir(exist_ok=True)
-    timings_file = output_dir / f"result-timings-gpu-vlm-{now:%Y-%m-%d_%H-%M-%S}.json"
+    timings_file = output_dir / f"result-timings-gpu-vlm-{stamp}.json"
     with timings_file.open("wb") as fp:
-        r = TimingsT.dump_json(conv_result.timings, indent=2)
+        r = TimingsT.dump_json(timings, indent=2)
         fp.write(r)
     _log.info(f"Profile details in {timings_file}.")
 
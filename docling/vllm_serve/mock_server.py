@@ -0,0 +1,295 @@
+"""
+Локальная заглушка OpenAI-совместимого VLM сервера для бенчмарков без GPU
+
+Реализует /v1/chat/completions, /v1/models и /health как vLLM, возвращая
+заранее заданные DocTags с настраиваемыми распределением задержек, долей
+ошибок и таймаутов и ограничением пропускной способности. Используется для
+нагрузочной проверки клиентской стороны infer.py (параллелизм, окна страниц,
+таймауты, кэш) на CPU-машинах.
+
+Запуск:
+    python mock_server.py --port 8001 --latency-dist lognormal --latency-mean 2 --error-rate 0.01
+    VLLM_URL=http://localhost:8001/v1/chat/completions python infer.py
+"""
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_DOCTAGS = (
+    "<doctag><page_header><loc_27><loc_20><loc_227><loc_28>Mock VLM server</page_header>"
+    "<section_header_level_1><loc_27><loc_40><loc_300><loc_52>Mock page</section_header_level_1>"
+    "<text><loc_27><loc_60><loc_473><loc_120>This page was generated by mock_server.py "
+    "instead of a real vision language model.</text></doctag>"
+)
+
+
+class MockVlmServer:
+    """
+    Модель поведения VLM сервера
+
+    Args:
+        doctags: Ответ модели для каждой страницы
+        model: Имя модели в ответах и /v1/models
+        latency_dist: Распределение задержки: fixed, uniform, normal, lognormal
+        latency_mean: Средняя задержка запроса, секунд
+        latency_std: Разброс задержки, секунд
+        load_factor: Рост задержки при полной загрузке слотов (0 - не зависит от нагрузки)
+        error_rate: Доля запросов с ответом 500
+        timeout_rate: Доля запросов, зависающих на hang_seconds
+        hang_seconds: Длительность "зависания", секунд
+        max_num_seqs: Число одновременно обрабатываемых запросов (как --max-num-seqs), остальные ждут
+        queue_limit: Максимум ожидающих запросов, сверх него ответ 503 (0 - без ограничения)
+        seed: Зерно генератора случайных чисел
+    """
+
+    def __init__(
+        self,
+        doctags: str = DEFAULT_DOCTAGS,
+        model: str = "ibm-granite/granite-docling-258M",
+        latency_dist: str = "fixed",
+        latency_mean: float = 0.5,
+        latency_std: float = 0.1,
+        load_factor: float = 0.0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        hang_seconds: float = 600.0,
+        max_num_seqs: int = 512,
+        queue_limit: int = 0,
+        seed: int = 0,
+    ):
+        if latency_dist not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {latency_dist}")
+
+        self.doctags = doctags
+        self.model = model
+        self.latency_dist = latency_dist
+        self.latency_mean = latency_mean
+        self.latency_std = latency_std
+        self.load_factor = load_factor
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.max_num_seqs = max_num_seqs
+        self.queue_limit = queue_limit
+
+        self._random = random.Random(seed)
+        self._slots = threading.BoundedSemaphore(max_num_seqs)
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "completed": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "active": 0,
+            "waiting": 0,
+            "peak_active": 0,
+            "peak_waiting": 0,
+        }
+
+    def sample_latency(self) -> float:
+        if self.latency_mean <= 0:
+            return 0.0
+        with self._lock:
+            rnd = self._random
+            if self.latency_dist == "fixed":
+                value = self.latency_mean
+            elif self.latency_dist == "uniform":
+                value = rnd.uniform(self.latency_mean - self.latency_std, self.latency_mean + self.latency_std)
+            elif self.latency_dist == "normal":
+                value = rnd.gauss(self.latency_mean, self.latency_std)
+            else:
+                # Параметры логнормального распределения по среднему и СКО
+                variance = self.latency_std ** 2
+                mu = math.log(self.latency_mean ** 2 / math.sqrt(variance + self.latency_mean ** 2))
+                sigma = math.sqrt(math.log(1 + variance / self.latency_mean ** 2))
+                value = rnd.lognormvariate(mu, sigma)
+            load = self.stats["active"] / self.max_num_seqs
+        return max(0.0, value) * (1.0 + self.load_factor * load)
+
+    def _roll(self, rate: float) -> bool:
+        with self._lock:
+            return self._random.random() < rate
+
+    def _update(self, **deltas: int):
+        with self._lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+            self.stats["peak_active"] = max(self.stats["peak_active"], self.stats["active"])
+            self.stats["peak_waiting"] = max(self.stats["peak_waiting"], self.stats["waiting"])
+
+    def complete(self, payload: Dict[str, Any]) -> tuple:
+        """
+        Обработка запроса chat/completions
+
+        Returns:
+            Кортеж (HTTP статус, тело ответа)
+        """
+        self._update(requests=1)
+
+        if not self._slots.acquire(blocking=False):
+            # Проверка лимита и постановка в очередь под одной блокировкой
+            with self._lock:
+                rejected = bool(self.queue_limit) and self.stats["waiting"] >= self.queue_limit
+                if not rejected:
+                    self.stats["waiting"] += 1
+                    self.stats["peak_waiting"] = max(self.stats["peak_waiting"], self.stats["waiting"])
+            if rejected:
+                self._update(rejected=1)
+                return 503, {"error": {"message": "Server overloaded", "type": "overloaded"}}
+            self._slots.acquire()
+            self._update(waiting=-1)
+        self._update(active=1)
+
+        try:
+            if self._roll(self.timeout_rate):
+                self._update(timeouts=1)
+                time.sleep(self.hang_seconds)
+                return 504, {"error": {"message": "Mock hang", "type": "timeout"}}
+
+            time.sleep(self.sample_latency())
+
+            if self._roll(self.error_rate):
+                self._update(errors=1)
+                return 500, {"error": {"message": "Mock internal error", "type": "internal_error"}}
+
+            self._update(completed=1)
+            completion_tokens = len(self.doctags) // 4
+            return 200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model", self.model),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.doctags},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": completion_tokens,
+                },
+            }
+        finally:
+            self._update(active=-1)
+            self._slots.release()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+
+def make_handler(server: MockVlmServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: Dict[str, Any]):
+            content = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {})
+            elif self.path == "/v1/models":
+                self._send(200, {"object": "list", "data": [{"id": server.model, "object": "model"}]})
+            elif self.path == "/stats":
+                self._send(200, server.snapshot())
+            else:
+                self._send(404, {"error": {"message": f"Not found: {self.path}"}})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path != "/v1/chat/completions":
+                self._send(404, {"error": {"message": f"Not found: {self.path}"}})
+                return
+            try:
+                payload = json.loads(body)
+            except json.JSONDecodeError:
+                self._send(400, {"error": {"message": "Invalid JSON"}})
+                return
+            try:
+                status, response = server.complete(payload)
+            except Exception as e:
+                _log.exception("Mock completion failed")
+                status, response = 500, {"error": {"message": str(e), "type": "internal_error"}}
+            try:
+                self._send(status, response)
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент уже отключился по своему таймауту
+                pass
+
+        def log_message(self, format, *args):
+            _log.debug(format, *args)
+
+    return Handler
+
+
+def serve(server: MockVlmServer, host: str = "0.0.0.0", port: int = 8001) -> ThreadingHTTPServer:
+    """Создание HTTP сервера заглушки (запуск - serve_forever())"""
+    httpd = ThreadingHTTPServer((host, port), make_handler(server))
+    httpd.daemon_threads = True
+    return httpd
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible VLM server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--model", default="ibm-granite/granite-docling-258M")
+    parser.add_argument("--doctags-file", type=Path, help="Файл с DocTags для ответа")
+    parser.add_argument("--latency-dist", default="fixed", choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--latency-mean", type=float, default=0.5, help="Средняя задержка, секунд")
+    parser.add_argument("--latency-std", type=float, default=0.1, help="Разброс задержки, секунд")
+    parser.add_argument("--load-factor", type=float, default=0.0, help="Рост задержки при полной загрузке")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Доля зависающих запросов")
+    parser.add_argument("--hang-seconds", type=float, default=600.0)
+    parser.add_argument("--max-num-seqs", type=int, default=512, help="Одновременно обрабатываемые запросы")
+    parser.add_argument("--queue-limit", type=int, default=0, help="Лимит очереди, сверх - 503 (0 - без лимита)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    server = MockVlmServer(
+        doctags=args.doctags_file.read_text(encoding="utf-8") if args.doctags_file else DEFAULT_DOCTAGS,
+        model=args.model,
+        latency_dist=args.latency_dist,
+        latency_mean=args.latency_mean,
+        latency_std=args.latency_std,
+        load_factor=args.load_factor,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        max_num_seqs=args.max_num_seqs,
+        queue_limit=args.queue_limit,
+        seed=args.seed,
+    )
+    httpd = serve(server, args.host, args.port)
+    _log.info(f"Mock VLM server on http://{args.host}:{args.port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        _log.info(f"Stats: {server.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Политика повторов и бюджет времени для запросов страниц к VLM
+"""
+import os
+import random
+import time
+from typing import Optional
+
+
+class RetryPolicy:
+    """
+    Повторы страниц с экспоненциальной задержкой
+
+    Args:
+        max_attempts: Максимум попыток на страницу (включая первую)
+        backoff: Базовая задержка перед повтором, секунд
+        max_backoff: Верхняя граница задержки, секунд
+        jitter: Доля случайного разброса задержки
+    """
+
+    def __init__(self, max_attempts: int = 3, backoff: float = 2.0, max_backoff: float = 60.0, jitter: float = 0.2):
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts must be >= 1: {max_attempts}")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Создание политики из переменных окружения VLM_MAX_ATTEMPTS, VLM_RETRY_BACKOFF*"""
+        return cls(
+            max_attempts=int(os.getenv("VLM_MAX_ATTEMPTS", "3")),
+            backoff=float(os.getenv("VLM_RETRY_BACKOFF", "2.0")),
+            max_backoff=float(os.getenv("VLM_RETRY_BACKOFF_MAX", "60.0")),
+        )
+
+    def delay(self, attempt: int) -> float:
+        """Задержка перед попыткой номер attempt (вторая попытка - базовая задержка)"""
+        value = min(self.max_backoff, self.backoff * 2 ** max(0, attempt - 2))
+        return value * (1.0 + random.uniform(-self.jitter, self.jitter))
+
+    def can_retry(self, attempt: int) -> bool:
+        return attempt < self.max_attempts
+
+
+class TimeBudget:
+    """
+    Бюджет времени на документ
+
+    Args:
+        seconds: Бюджет в секундах (None или 0 - без ограничения)
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.deadline = time.monotonic() + seconds if seconds else None
+
+    @classmethod
+    def from_env(cls) -> "TimeBudget":
+        return cls(float(os.getenv("VLM_DOC_BUDGET", "0")) or None)
+
+    def remaining(self) -> float:
+        if self.deadline is None:
+            return float("inf")
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def exhausted(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def cap(self, timeout: float) -> float:
+        """Таймаут запроса, не выходящий за оставшийся бюджет"""
+        return min(timeout, self.remaining())
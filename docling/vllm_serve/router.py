@@ -0,0 +1,188 @@
+"""
+Гибридная маршрутизация страниц: текстовый слой PyMuPDF или VLM
+
+Дешевый проход PyMuPDF оценивает каждую страницу (плотность текста, доля
+площади под изображениями, вероятность таблицы по числу линий) и решает,
+достаточно ли текстового слоя или страницу нужно отправить в VLM.
+"""
+import os
+from pathlib import Path
+from statistics import median
+from typing import Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+ROUTE_TEXT = "text"
+ROUTE_VLM = "vlm"
+
+
+class RoutingThresholds:
+    """
+    Пороги классификации страниц
+
+    Args:
+        min_chars: Минимум символов текстового слоя для маршрута text
+        max_image_coverage: Максимальная доля площади страницы под изображениями
+        max_table_lines: Максимум горизонтальных/вертикальных линий (признак таблицы)
+        max_garbage_ratio: Максимальная доля нераспознанных символов в тексте
+    """
+
+    def __init__(
+        self,
+        min_chars: int = 200,
+        max_image_coverage: float = 0.3,
+        max_table_lines: int = 20,
+        max_garbage_ratio: float = 0.05,
+    ):
+        self.min_chars = min_chars
+        self.max_image_coverage = max_image_coverage
+        self.max_table_lines = max_table_lines
+        self.max_garbage_ratio = max_garbage_ratio
+
+    @classmethod
+    def from_env(cls) -> "RoutingThresholds":
+        """Создание порогов из переменных окружения ROUTER_*"""
+        return cls(
+            min_chars=int(os.getenv("ROUTER_MIN_CHARS", "200")),
+            max_image_coverage=float(os.getenv("ROUTER_MAX_IMAGE_COVERAGE", "0.3")),
+            max_table_lines=int(os.getenv("ROUTER_MAX_TABLE_LINES", "20")),
+            max_garbage_ratio=float(os.getenv("ROUTER_MAX_GARBAGE_RATIO", "0.05")),
+        )
+
+
+def _image_coverage(page: fitz.Page) -> float:
+    page_area = abs(page.rect) or 1.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"]) & page.rect
+        covered += abs(bbox)
+    return min(1.0, covered / page_area)
+
+
+# Отрезок короче (в пунктах) не учитывается; прямоугольник тоньше - линия
+# (те же пороги, что в pymupdf/serve/tables.py)
+MIN_SEGMENT = 10.0
+LINE_THICKNESS = 2.0
+
+
+def _table_lines(page: fitz.Page) -> int:
+    """
+    Число горизонтальных и вертикальных отрезков (линии и ребра прямоугольников)
+
+    Тонкий прямоугольник считается одной линией, рамка ячейки - четырьмя.
+    Залитые прямоугольники без обводки (фон, выделение) не учитываются.
+    """
+    count = 0
+    for drawing in page.get_drawings():
+        stroked = "s" in (drawing.get("type") or "")
+        for item in drawing["items"]:
+            if item[0] == "l":
+                p1, p2 = item[1], item[2]
+                width, height = abs(p1.x - p2.x), abs(p1.y - p2.y)
+                if (height < 1 and width >= MIN_SEGMENT) or (width < 1 and height >= MIN_SEGMENT):
+                    count += 1
+            elif item[0] == "re":
+                rect = item[1]
+                width, height = abs(rect.width), abs(rect.height)
+                if (height <= LINE_THICKNESS and width >= MIN_SEGMENT) or (width <= LINE_THICKNESS and height >= MIN_SEGMENT):
+                    count += 1
+                elif stroked and width >= MIN_SEGMENT and height >= MIN_SEGMENT:
+                    count += 4
+    return count
+
+
+def classify_page(page: fitz.Page, thresholds: RoutingThresholds) -> Dict:
+    """
+    Классификация страницы
+
+    Returns:
+        Словарь с признаками страницы, маршрутом и причиной выбора VLM
+    """
+    text = page.get_text()
+    chars = len(text.strip())
+    garbage = text.count("\ufffd") / chars if chars else 0.0
+    coverage = _image_coverage(page)
+    lines = _table_lines(page)
+
+    reason = None
+    if chars < thresholds.min_chars:
+        reason = "no text layer"
+    elif garbage > thresholds.max_garbage_ratio:
+        reason = "broken text layer"
+    elif coverage > thresholds.max_image_coverage:
+        reason = "image coverage"
+    elif lines > thresholds.max_table_lines:
+        reason = "table likely"
+
+    return {
+        "page": page.number + 1,
+        "chars": chars,
+        "image_coverage": round(coverage, 3),
+        "table_lines": lines,
+        "route": ROUTE_VLM if reason else ROUTE_TEXT,
+        "reason": reason,
+    }
+
+
+def page_to_markdown(page: fitz.Page) -> str:
+    """
+    Markdown из текстового слоя страницы
+
+    Блоки с размером шрифта заметно выше медианного по странице считаются
+    заголовками.
+    """
+    blocks = page.get_text("dict", flags=fitz.TEXT_PRESERVE_WHITESPACE)["blocks"]
+    sizes = [
+        span["size"]
+        for block in blocks if block["type"] == 0
+        for line in block["lines"]
+        for span in line["spans"] if span["text"].strip()
+    ]
+    body_size = median(sizes) if sizes else 0.0
+
+    parts = []
+    for block in blocks:
+        if block["type"] != 0:
+            continue
+        lines = []
+        block_size = 0.0
+        for line in block["lines"]:
+            line_text = "".join(span["text"] for span in line["spans"]).strip()
+            if line_text:
+                lines.append(line_text)
+                block_size = max(block_size, max(span["size"] for span in line["spans"]))
+        if not lines:
+            continue
+        text = " ".join(lines)
+        if body_size and block_size >= body_size * 1.2 and len(text) < 200:
+            parts.append(f"## {text}")
+        else:
+            parts.append(text)
+    return "\n\n".join(parts)
+
+
+def plan_document(
+    path: Path, pages: List[int], thresholds: Optional[RoutingThresholds] = None
+) -> Dict[int, Dict]:
+    """
+    Маршрутизация страниц документа
+
+    Args:
+        path: Путь к PDF
+        pages: Номера страниц (с 1)
+        thresholds: Пороги классификации (по умолчанию - из окружения)
+
+    Returns:
+        Словарь номер страницы -> признаки; для страниц маршрута text
+        дополнительно ключ "markdown" с текстом страницы
+    """
+    thresholds = thresholds or RoutingThresholds.from_env()
+    plan = {}
+    with fitz.open(path) as doc:
+        for page_no in pages:
+            page = doc[page_no - 1]
+            profile = classify_page(page, thresholds)
+            if profile["route"] == ROUTE_TEXT:
+                profile["markdown"] = page_to_markdown(page)
+            plan[page_no] = profile
+    return plan
@@ -0,0 +1,200 @@
+"""
+Кэш ответов VLM по хэшу изображения страницы
+
+Локальный прокси перед /v1/chat/completions: docling отправляет запросы в
+прокси, тот ищет ответ в SQLite по ключу (хэш изображения страницы + модель,
+промпт и параметры генерации) и обращается к vLLM только при промахе.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_log = logging.getLogger(__name__)
+
+
+def _hash_images(value: Any) -> Any:
+    """Замена data URL изображений на их sha256 (рекурсивно по payload)"""
+    if isinstance(value, dict):
+        if value.get("type") == "image_url":
+            url = value.get("image_url", {}).get("url", "")
+            return {"type": "image_url", "sha256": hashlib.sha256(url.encode("utf-8")).hexdigest()}
+        return {k: _hash_images(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_hash_images(v) for v in value]
+    return value
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """
+    Ключ кэша для запроса chat/completions
+
+    В ключ входят хэш изображения страницы, модель, промпт и все параметры
+    генерации, поэтому смена любого из них дает промах.
+    """
+    canonical = json.dumps(_hash_images(payload), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PageCache:
+    """
+    Персистентное хранилище ответов VLM (SQLite)
+
+    Args:
+        path: Путь к файлу базы
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, body: bytes):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, created) VALUES (?, ?, ?)",
+                (key, body, time.time()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachingProxy:
+    """
+    Локальный HTTP прокси с кэшем перед OpenAI-совместимым VLM сервером
+
+    Args:
+        upstream_url: URL /v1/chat/completions сервера vLLM
+        cache: Хранилище ответов
+        timeout: Таймаут запроса к серверу, секунд
+        max_connections: Размер пула соединений к серверу - не меньше максимального
+            параллелизма запросов (VLM_CONCURRENCY_MAX), иначе лишние соединения
+            открываются и закрываются на каждый запрос
+    """
+
+    def __init__(self, upstream_url: str, cache: PageCache, timeout: float = 90.0, max_connections: int = 512):
+        self.upstream_url = upstream_url
+        self.cache = cache
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._latencies: List[float] = []
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self) -> "CachingProxy":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        _log.info(f"VLM cache proxy on {self.url} -> {self.upstream_url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.cache.close()
+
+    def drain_upstream_stats(self) -> Tuple[List[float], int]:
+        """
+        Задержки и число ошибок запросов к серверу с момента прошлого вызова
+
+        Попадания в кэш сюда не входят, чтобы регулятор параллелизма видел
+        только реальную нагрузку на vLLM.
+        """
+        with self._lock:
+            latencies, failures = self._latencies, self._failures
+            self._latencies, self._failures = [], 0
+        return latencies, failures
+
+    def handle(self, body: bytes) -> Tuple[int, bytes]:
+        payload = json.loads(body)
+        cacheable = not payload.get("stream", False)
+        key = cache_key(payload) if cacheable else None
+
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self._lock:
+                    self.hits += 1
+                return 200, cached
+
+        start_time = time.time()
+        try:
+            response = self._session.post(
+                self.upstream_url,
+                data=body,
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout,
+            )
+        except requests.RequestException:
+            with self._lock:
+                self.misses += 1
+                self._failures += 1
+            raise
+        latency = time.time() - start_time
+
+        with self._lock:
+            self.misses += 1
+            if response.ok:
+                self._latencies.append(latency)
+            else:
+                self._failures += 1
+
+        if key is not None and response.ok:
+            self.cache.put(key, response.content)
+        return response.status_code, response.content
+
+    def _make_handler(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    status, content = proxy.handle(body)
+                except requests.Timeout:
+                    status, content = 504, b'{"error": "upstream timeout"}'
+                except Exception as e:
+                    status, content = 502, json.dumps({"error": str(e)}).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
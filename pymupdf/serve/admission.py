@@ -0,0 +1,248 @@
+"""
+Контроль допуска запросов: ограничение одновременных запросов и объема загрузок
+
+ASGI middleware срабатывает до чтения тела запроса, поэтому при перегрузке
+файл не буферизуется: клиент сразу получает 429/503 с Retry-After. Ожидающие
+запросы обслуживаются по кругу между клиентами, чтобы один клиент с пачкой
+файлов не занимал всю очередь.
+"""
+import asyncio
+import json
+import os
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from metrics import metrics
+
+
+class Rejected(Exception):
+    """Запрос отклонен контролем допуска"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Лимиты одновременных запросов с очередью и справедливостью между клиентами
+
+    Args:
+        max_in_flight: Максимум одновременно обрабатываемых запросов
+        max_in_flight_bytes: Максимальный суммарный объем обрабатываемых загрузок
+        max_queue: Максимум ожидающих запросов (сверх - 503)
+        queue_timeout: Максимальное ожидание в очереди, секунд (затем 503)
+        max_per_client: Максимум запросов одного клиента в работе и очереди (сверх - 429, 0 - без лимита)
+        max_upload_bytes: Максимальный размер одной загрузки (сверх - 413)
+        retry_after: Значение Retry-After в секундах
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        max_in_flight_bytes: int = 512 * 1024 * 1024,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        max_per_client: int = 4,
+        max_upload_bytes: int = 200 * 1024 * 1024,
+        retry_after: int = 1,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_client = max_per_client
+        self.max_upload_bytes = max_upload_bytes
+        self.retry_after = retry_after
+
+        self.in_flight = 0
+        self.in_flight_bytes = 0
+        self.rejected = 0
+        self._per_client: Dict[str, int] = {}
+        self._waiters: "OrderedDict[str, Deque[Tuple[asyncio.Future, int]]]" = OrderedDict()
+        self._waiting = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Настройки из переменных окружения ADMISSION_*"""
+        mb = 1024 * 1024
+        # Лимиты действуют в каждом процессе сервиса: CPU делятся между WEB_CONCURRENCY процессами
+        cpus = max(1, (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY", "1"))))
+        return cls(
+            max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(2 * cpus))),
+            max_in_flight_bytes=int(os.getenv("ADMISSION_MAX_IN_FLIGHT_MB", "512")) * mb,
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+            max_per_client=int(os.getenv("ADMISSION_MAX_PER_CLIENT", "4")),
+            max_upload_bytes=int(os.getenv("ADMISSION_MAX_UPLOAD_MB", "200")) * mb,
+            retry_after=int(os.getenv("ADMISSION_RETRY_AFTER", "1")),
+        )
+
+    def _can_admit(self, size: int) -> bool:
+        if self.in_flight >= self.max_in_flight:
+            return False
+        # Одна загрузка больше лимита байт допускается, если сервис простаивает
+        return self.in_flight == 0 or self.in_flight_bytes + size <= self.max_in_flight_bytes
+
+    def _admit(self, client: str, size: int):
+        self.in_flight += 1
+        self.in_flight_bytes += size
+
+    def _reject(self, status_code: int, detail: str, retry: bool = True) -> Rejected:
+        """Отказ с учетом в счетчике и метрике; retry=False - без Retry-After (повтор не поможет)"""
+        self.rejected += 1
+        metrics.inc("pymupdf_admission_rejected_total", status=str(status_code))
+        return Rejected(status_code, detail, self.retry_after if retry else None)
+
+    async def acquire(self, client: str, size: int):
+        """
+        Ожидание допуска запроса
+
+        Raises:
+            Rejected: 413 - слишком большой файл, 429 - лимит клиента, 503 - очередь заполнена или истекло ожидание
+        """
+        if size > self.max_upload_bytes:
+            raise self._reject(413, f"Файл больше {self.max_upload_bytes // (1024 * 1024)} МБ", retry=False)
+
+        client_load = self._per_client.get(client, 0)
+        if self.max_per_client and client_load >= self.max_per_client:
+            raise self._reject(429, "Слишком много одновременных запросов от клиента")
+
+        if not self._waiters and self._can_admit(size):
+            self._per_client[client] = client_load + 1
+            self._admit(client, size)
+            return
+
+        if self._waiting >= self.max_queue:
+            raise self._reject(503, "Сервис перегружен, очередь заполнена")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append((future, size))
+        self._waiting += 1
+        self._per_client[client] = client_load + 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Допуск выдан одновременно с таймаутом/отменой
+                if isinstance(e, asyncio.TimeoutError):
+                    return
+                self.release(client, size)
+                raise
+            self._remove_waiter(client, future)
+            future.cancel()
+            self._release_client(client)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(503, "Сервис перегружен, истекло время ожидания в очереди")
+            raise
+
+    def _remove_waiter(self, client: str, future: asyncio.Future):
+        queue = self._waiters.get(client)
+        if queue is None:
+            return
+        for item in queue:
+            if item[0] is future:
+                queue.remove(item)
+                self._waiting -= 1
+                break
+        if not queue:
+            del self._waiters[client]
+
+    def _release_client(self, client: str):
+        remaining = self._per_client.get(client, 1) - 1
+        if remaining > 0:
+            self._per_client[client] = remaining
+        else:
+            self._per_client.pop(client, None)
+
+    def release(self, client: str, size: int):
+        """Освобождение слота и допуск ожидающих по кругу между клиентами"""
+        self.in_flight -= 1
+        self.in_flight_bytes -= size
+        self._release_client(client)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiters:
+            next_client = next(iter(self._waiters))
+            queue = self._waiters[next_client]
+            future, size = queue[0]
+            if not self._can_admit(size):
+                break
+            queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._waiters.move_to_end(next_client)
+            else:
+                del self._waiters[next_client]
+            self._admit(next_client, size)
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "in_flight_bytes": self.in_flight_bytes,
+            "waiting": self._waiting,
+            "clients": len(self._per_client),
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware контроля допуска для POST запросов
+
+    Клиент определяется заголовком X-Client-Id, иначе адресом подключения.
+    Запросы без Content-Length отклоняются (411), так как их объем нельзя
+    учесть до чтения тела, с нечисловым или отрицательным - 400.
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length")
+        if length is None:
+            await self._send_error(send, Rejected(411, "Требуется заголовок Content-Length"))
+            return
+
+        if not length.strip().isdigit():
+            await self._send_error(send, self.controller._reject(400, "Неверный заголовок Content-Length", retry=False))
+            return
+        size = int(length)
+        client_id = headers.get(b"x-client-id")
+        if client_id:
+            client = client_id.decode("latin-1")
+        else:
+            client = scope["client"][0] if scope.get("client") else "unknown"
+
+        try:
+            await self.controller.acquire(client, size)
+        except Rejected as e:
+            await self._send_error(send, e)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(client, size)
+
+    @staticmethod
+    async def _send_error(send, error: Rejected):
+        body = json.dumps({"detail": error.detail}, ensure_ascii=False).encode("utf-8")
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ]
+        if error.retry_after is not None:
+            headers.append((b"retry-after", str(error.retry_after).encode("latin-1")))
+        await send({"type": "http.response.start", "status": error.status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -1,215 +1,485 @@
 """
-FastAPI сервис для парсинга PDF документов с помощью PyMuPDF
+FastAPI сервис для парсинга документов с помощью PyMuPDF (PDF, XPS, EPUB, CBZ, FB2, MOBI, изображения)
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-import fitz  # PyMuPDF (импортируется как fitz)
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, File, Form, UploadFile, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
 import json
-from typing import Optional, Dict, Any
+import os
+import time
+from typing import AsyncIterator, Optional, Dict, Any, Tuple
 from pathlib import Path
 
+from admission import AdmissionController, AdmissionMiddleware
+from archive import ARCHIVES
+from cache import ResultCache, content_key
+from compression import CompressionMiddleware
+from encoding import encoders, render
+from fetch import FetchError, fetch
+from fingerprint import FingerprintIndex
+from metrics import metrics
+from preflight import PreflightError, check_bytes
+from search_index import SearchIndex, SearchQueryError, result_pages
+from workers import WorkerCancelled, WorkerError, WorkerPool, WorkerTimeout
+
+# Разбор выполняется в пуле рабочих процессов с бюджетом времени на запрос
+pool = WorkerPool.from_env()
+
+# Результаты: локальный LRU процесса и общий дисковый уровень (CACHE_DIR)
+cache = ResultCache.from_env()
+
+# Индекс отпечатков документов для поиска почти-дубликатов (FINGERPRINT_DB)
+fingerprints = FingerprintIndex.from_env()
+
+# Полнотекстовый индекс страниц (SEARCH_DB, без него поиск отключен)
+search_index = SearchIndex.from_env()
+
+
+async def flush_metrics(interval: float):
+    """Периодическое сохранение метрик процесса для агрегации между процессами"""
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(metrics.flush)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await pool.start()
+    flusher = asyncio.create_task(flush_metrics(1.0)) if metrics.directory else None
+    yield
+    if flusher is not None:
+        flusher.cancel()
+        metrics.flush()
+    await pool.close()
+
+
 app = FastAPI(
     title="PyMuPDF Document Parser",
-    description="REST API для извлечения текста, метаданных и изображений из PDF документов",
-    version="1.0.0"
+    description="REST API для извлечения текста, метаданных и изображений из PDF, XPS, EPUB, CBZ и других форматов MuPDF",
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Сжатие ответов больше COMPRESSION_MIN_SIZE (gzip, brotli, zstd)
+app.add_middleware(CompressionMiddleware, **CompressionMiddleware.options_from_env())
+
+# Контроль допуска: лимиты одновременных запросов и объема загрузок.
+# Добавляется последним, чтобы отклонять запросы до остальной обработки
+admission = AdmissionController.from_env()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+
+@app.exception_handler(StarletteHTTPException)
+async def http_exception_handler(request: Request, exc: StarletteHTTPException):
+    """Ошибки в том же формате, что и успешные ответы"""
+    return render(request, {"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+
+
+@app.exception_handler(PreflightError)
+async def preflight_exception_handler(request: Request, exc: PreflightError):
+    """Файл отклонен предварительной проверкой: HTTP статус и машиночитаемый код причины"""
+    metrics.inc("pymupdf_preflight_rejected_total", code=exc.code)
+    return render(request, {"detail": exc.detail, "code": exc.code}, status_code=exc.status_code)
+
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Информация о сервисе"""
-    return {
+    return render(request, {
         "service": "PyMuPDF Document Parser",
         "version": "1.0.0",
         "endpoints": {
-            "/extract_text": "Извлечение текста из PDF",
+            "/extract_text": "Извлечение текста",
             "/extract_metadata": "Извлечение метаданных",
             "/extract_images": "Извлечение изображений",
-            "/extract_all": "Извлечение всего содержимого"
-        }
-    }
+            "/extract_all": "Извлечение всего содержимого",
+            "/extract_tables": "Извлечение таблиц",
+            "/fingerprint": "Отпечаток документа и почти-дубликаты",
+            "/chunk": "Фрагменты для эмбеддингов (потоково, NDJSON)",
+            "/export_images": "Выгрузка изображений (zip, tar или директория)",
+            "/search": "Полнотекстовый поиск по извлеченному тексту",
+            "/metrics": "Метрики в формате Prometheus",
+            "/ready": "Готовность принимать запросы"
+        },
+        "formats": ["application/json", *encoders()],
+        "documents": ["pdf", "xps", "epub", "cbz", "fb2", "mobi", "svg", "image"],
+    })
 
 
 @app.get("/health")
-async def health():
+async def health(request: Request):
     """Проверка состояния сервиса"""
-    return {"status": "healthy"}
+    return render(request, {
+        "status": "healthy",
+        "admission": admission.stats(),
+        "workers": pool.stats(),
+        "cache": cache.stats(),
+        "fingerprints": fingerprints.stats(),
+        "search": search_index.stats() if search_index is not None else None,
+    })
 
 
-@app.post("/extract_text")
-async def extract_text(file: UploadFile = File(...)):
+@app.get("/ready")
+async def ready(request: Request):
+    """
+    Готовность принимать запросы на разбор (readiness)
+
+    В отличие от /health (liveness) возвращает 503, пока рабочие процессы не загрузили PyMuPDF.
+    """
+    if not pool.is_ready():
+        return render(request, {"status": "starting", "workers": pool.stats()}, status_code=503)
+    return render(request, {"status": "ready"})
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+class Document:
+    """Документ запроса: загруженный файл или скачанный по ссылке"""
+
+    __slots__ = ("filename", "content")
+
+    def __init__(self, filename: str, content: bytes):
+        self.filename = filename
+        self.content = content
+
+
+async def read_document(
+    file: Optional[UploadFile] = File(None, description="Файл документа"),
+    url: Optional[str] = Form(None, description="Ссылка на документ вместо файла (узел из FETCH_ALLOWED_HOSTS)"),
+) -> Document:
     """
-    Извлечение текста из PDF документа
+    Чтение загрузки или скачивание по ссылке и быстрая проверка байтов до передачи в рабочий процесс
+
+    Формат определяется по содержимому, расширение имени файла не проверяется.
+
+    Raises:
+        HTTPException: 400 - нет ни file, ни url (или оба); ошибки загрузки по ссылке
+        PreflightError: пустой файл, неподдерживаемый формат, поврежденная структура PDF
     """
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Поддерживаются только PDF файлы")
+    if (file is None) == (url is None):
+        raise HTTPException(status_code=400, detail="Передайте файл (file) или ссылку на него (url)")
+    if file is not None:
+        document = Document(file.filename, await file.read())
+    else:
+        try:
+            document = Document(*await fetch(url))
+        except FetchError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+    check_bytes(document.content)
+    return document
+
+
+DOCUMENT = Depends(read_document)
+
+
+def http_error(error: Exception) -> HTTPException:
+    """Ошибка рабочего процесса -> HTTP ответ"""
+    if isinstance(error, WorkerTimeout):
+        return HTTPException(status_code=504, detail=f"Ошибка обработки файла: {str(error)}")
+    if isinstance(error, WorkerCancelled):
+        # Ответ уже некому отправлять; 499 - для логов
+        return HTTPException(status_code=499, detail=str(error))
+    return HTTPException(status_code=500, detail=f"Ошибка обработки файла: {str(error)}")
+
+
+async def start_stream(items: AsyncIterator[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Первый элемент потоковой задачи
+
+    Ошибки открытия документа приходят до первого элемента, поэтому
+    возвращаются с HTTP статусом, а не внутри уже начатого ответа.
+    """
+    try:
+        return await items.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="Ошибка обработки файла: пустой результат")
+    except (WorkerTimeout, WorkerCancelled, WorkerError) as e:
+        raise http_error(e)
+
+
+async def run_task(
+    task: str,
+    request: Request,
+    document: Document,
+    timeout: Optional[float],
+    options: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Выполнение задачи разбора в рабочем процессе с бюджетом времени
     
+    При отключении клиента обработка прерывается между страницами.
+    Результаты кэшируются по SHA-256 файла, задаче и ее параметрам.
+
+    Returns:
+        SHA-256 файла и результат задачи
+    """
+    content = document.content
+    options = {name: value for name, value in (options or {}).items() if value}
+    cache_task = task + "".join(f"&{name}={value}" for name, value in sorted(options.items()))
+    digest = content_key(content)
+    cached = await asyncio.to_thread(cache.get, cache_task, digest)
+    if cached is not None:
+        metrics.inc("pymupdf_requests_total", task=task, status="cached")
+        return digest, {**cached, "filename": document.filename}
+
+    started = time.perf_counter()
+    status = "ok"
     try:
-        content = await file.read()
-        doc = fitz.open(stream=content, filetype="pdf")
-        
-        result = {
-            "filename": file.filename,
-            "pages": len(doc),
-            "text": []
-        }
-        
-        for page_num, page in enumerate(doc, 1):
-            text = page.get_text()
-            result["text"].append({
-                "page": page_num,
-                "content": text
-            })
-        
-        doc.close()
-        return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка обработки файла: {str(e)}")
+        result = await pool.run(task, content, document.filename, timeout, request.is_disconnected, options)
+    except PreflightError:
+        status = "rejected"
+        raise
+    except (WorkerTimeout, WorkerCancelled, WorkerError) as e:
+        status = {WorkerTimeout: "timeout", WorkerCancelled: "cancelled"}.get(type(e), "error")
+        raise http_error(e)
+    finally:
+        metrics.inc("pymupdf_requests_total", task=task, status=status)
+        metrics.observe("pymupdf_extraction_seconds", time.perf_counter() - started, task=task)
+    await asyncio.to_thread(cache.put, cache_task, digest, result)
+    return digest, result
+
+
+def find_duplicates(digest: str, filename: str, fingerprint: Dict[str, Any]) -> Dict[str, Any]:
+    """Почти-дубликаты среди ранее обработанных документов; документ добавляется в индекс"""
+    duplicates = fingerprints.query(digest, fingerprint)
+    fingerprints.add(digest, filename, fingerprint)
+    return duplicates
+
+
+async def run_extraction(
+    task: str,
+    request: Request,
+    document: Document,
+    timeout: Optional[float],
+    options: Optional[Dict[str, Any]] = None,
+) -> Response:
+    """
+    Выполнение задачи разбора и ответ в формате, выбранном по заголовку Accept
+    (JSON, MessagePack, CBOR)
+    """
+    digest, result = await run_task(task, request, document, timeout, options)
+    if search_index is not None and task in ("text", "all"):
+        await asyncio.to_thread(search_index.add, digest, document.filename, result_pages(result))
+    if "fingerprint" in result:
+        duplicates = await asyncio.to_thread(find_duplicates, digest, document.filename, result["fingerprint"])
+        result = {**result, "duplicates": duplicates}
+    return render(request, result)
+
+
+TIMEOUT_QUERY = Query(None, gt=0, description="Бюджет времени запроса в секундах (не больше REQUEST_TIMEOUT)")
+FINGERPRINT_QUERY = Query(False, description="MinHash подписи страниц и почти-дубликаты среди обработанных документов")
+TABLES_QUERY = Query(False, description="Таблицы на страницах с линиями разметки (find_tables)")
+
+
+@app.post("/extract_text")
+async def extract_text(
+    request: Request,
+    document: Document = DOCUMENT,
+    timeout: Optional[float] = TIMEOUT_QUERY,
+    fingerprint: bool = FINGERPRINT_QUERY,
+    tables: bool = TABLES_QUERY,
+):
+    """
+    Извлечение текста из документа
+    """
+    return await run_extraction("text", request, document, timeout, {"fingerprint": fingerprint, "tables": tables})
 
 
 @app.post("/extract_metadata")
-async def extract_metadata(file: UploadFile = File(...)):
+async def extract_metadata(request: Request, document: Document = DOCUMENT, timeout: Optional[float] = TIMEOUT_QUERY):
     """
-    Извлечение метаданных из PDF документа
+    Извлечение метаданных из документа
     """
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Поддерживаются только PDF файлы")
-    
-    try:
-        content = await file.read()
-        doc = fitz.open(stream=content, filetype="pdf")
-        
-        metadata = doc.metadata
-        result = {
-            "filename": file.filename,
-            "pages": len(doc),
-            "metadata": {
-                "title": metadata.get("title", ""),
-                "author": metadata.get("author", ""),
-                "subject": metadata.get("subject", ""),
-                "creator": metadata.get("creator", ""),
-                "producer": metadata.get("producer", ""),
-                "creation_date": metadata.get("creationDate", ""),
-                "modification_date": metadata.get("modDate", ""),
-                "format": metadata.get("format", ""),
-                "encryption": metadata.get("encryption", "")
-            }
-        }
-        
-        doc.close()
-        return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка обработки файла: {str(e)}")
+    return await run_extraction("metadata", request, document, timeout)
 
 
 @app.post("/extract_images")
-async def extract_images(file: UploadFile = File(...)):
+async def extract_images(request: Request, document: Document = DOCUMENT, timeout: Optional[float] = TIMEOUT_QUERY):
     """
-    Извлечение изображений из PDF документа
+    Извлечение изображений из документа (встроенные изображения есть только у PDF)
     """
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Поддерживаются только PDF файлы")
-    
-    try:
-        content = await file.read()
-        doc = fitz.open(stream=content, filetype="pdf")
-        
-        result = {
-            "filename": file.filename,
-            "pages": len(doc),
-            "images": []
-        }
-        
-        for page_num, page in enumerate(doc, 1):
-            image_list = page.get_images()
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                result["images"].append({
-                    "page": page_num,
-                    "index": img_index,
-                    "xref": xref,
-                    "width": base_image["width"],
-                    "height": base_image["height"],
-                    "colorspace": base_image["colorspace"],
-                    "bpc": base_image["bpc"],
-                    "size": len(base_image["image"])
-                })
-        
-        doc.close()
-        return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка обработки файла: {str(e)}")
+    return await run_extraction("images", request, document, timeout)
 
 
 @app.post("/extract_all")
-async def extract_all(file: UploadFile = File(...)):
+async def extract_all(
+    request: Request,
+    document: Document = DOCUMENT,
+    timeout: Optional[float] = TIMEOUT_QUERY,
+    fingerprint: bool = FINGERPRINT_QUERY,
+    tables: bool = TABLES_QUERY,
+):
     """
-    Извлечение всего содержимого из PDF: текст, метаданные и информация об изображениях
+    Извлечение всего содержимого документа: текст, метаданные и информация об изображениях
     """
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Поддерживаются только PDF файлы")
-    
+    return await run_extraction("all", request, document, timeout, {"fingerprint": fingerprint, "tables": tables})
+
+
+@app.post("/extract_tables")
+async def extract_tables(request: Request, document: Document = DOCUMENT, timeout: Optional[float] = TIMEOUT_QUERY):
+    """
+    Извлечение таблиц из документа (только страницы с линиями разметки)
+    """
+    return await run_extraction("tables", request, document, timeout)
+
+
+@app.post("/fingerprint")
+async def fingerprint_document(request: Request, document: Document = DOCUMENT, timeout: Optional[float] = TIMEOUT_QUERY):
+    """
+    Отпечаток документа (MinHash подписи документа и страниц) и почти-дубликаты
+    среди ранее обработанных документов и страниц
+    """
+    return await run_extraction("fingerprint", request, document, timeout)
+
+
+def ndjson(item: Dict[str, Any]) -> bytes:
+    return (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@app.post("/chunk")
+async def chunk(
+    request: Request,
+    document: Document = DOCUMENT,
+    max_tokens: int = Query(512, ge=32, le=8192, description="Максимальный размер фрагмента, токенов"),
+    timeout: Optional[float] = TIMEOUT_QUERY,
+):
+    """
+    Фрагменты документа для эмбеддингов с учетом заголовков (NDJSON, по мере обработки страниц)
+
+    Строки: {"type": "document"}, {"type": "chunk"} ..., {"type": "end"}.
+    Ошибка после начала ответа передается строкой {"type": "error"} - без строки
+    "end" поток считается неполным.
+    """
+    started = time.perf_counter()
+    items = pool.stream("chunk", document.content, document.filename, timeout, request.is_disconnected, {"max_tokens": max_tokens})
+    first = await start_stream(items)
+
+    async def produce():
+        status = "ok"
+        try:
+            yield ndjson(first)
+            async for item in items:
+                yield ndjson(item)
+        except WorkerTimeout as e:
+            status = "timeout"
+            yield ndjson({"type": "error", "status": 504, "detail": f"Ошибка обработки файла: {str(e)}"})
+        except WorkerCancelled:
+            status = "cancelled"
+        except WorkerError as e:
+            status = "error"
+            yield ndjson({"type": "error", "status": 500, "detail": f"Ошибка обработки файла: {str(e)}"})
+        finally:
+            metrics.inc("pymupdf_requests_total", task="chunk", status=status)
+            metrics.observe("pymupdf_extraction_seconds", time.perf_counter() - started, task="chunk")
+
+    return StreamingResponse(produce(), media_type="application/x-ndjson")
+
+
+# Директория для выгрузки изображений в режиме format=dir (смонтированный output)
+IMAGE_EXPORT_DIR = Path(os.getenv("IMAGE_EXPORT_DIR", "/app/output"))
+
+
+def write_file(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+@app.post("/export_images")
+async def export_images(
+    request: Request,
+    document: Document = DOCUMENT,
+    archive_format: str = Query(
+        "zip", alias="format", pattern="^(zip|tar|dir)$", description="zip, tar или dir (запись в IMAGE_EXPORT_DIR)"
+    ),
+    timeout: Optional[float] = TIMEOUT_QUERY,
+):
+    """
+    Выгрузка встроенных изображений в исходном формате без перекодирования
+
+    Изображения с одинаковым xref или содержимым выгружаются один раз. Архив
+    (zip, tar) передается потоково и содержит manifest.json; при ошибке
+    обработки вместо манифеста в архив добавляется error.json. В режиме dir
+    файлы записываются в поддиректорию IMAGE_EXPORT_DIR, ответ - манифест.
+    """
+    content, filename = document.content, document.filename
+    items = pool.stream("export_images", content, filename, timeout, request.is_disconnected)
+
+    if archive_format == "dir":
+        directory = IMAGE_EXPORT_DIR / f"{Path(filename).stem}-{content_key(content)[:12]}"
+        manifest = None
+        try:
+            async for item in items:
+                if item["type"] == "image":
+                    await asyncio.to_thread(write_file, directory / item["name"], item["data"])
+                else:
+                    manifest = item
+        except (WorkerTimeout, WorkerCancelled, WorkerError) as e:
+            raise http_error(e)
+        if manifest is None:
+            # Поток закончился без манифеста: выгрузка неполная
+            raise HTTPException(status_code=500, detail="Ошибка обработки файла: нет манифеста выгрузки")
+        await asyncio.to_thread(
+            write_file, directory / "manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+        )
+        return render(request, {**manifest, "directory": str(directory)})
+
+    first = await start_stream(items)
+    # Архив создается после первого элемента: при отклонении файла он не нужен
+    archive = ARCHIVES[archive_format]()
+
+    def entry(item: Dict[str, Any]) -> bytes:
+        if item["type"] == "image":
+            return archive.add(item["name"], item["data"])
+        return archive.add("manifest.json", json.dumps(item, ensure_ascii=False, indent=2).encode("utf-8"))
+
+    async def produce():
+        try:
+            yield entry(first)
+            async for item in items:
+                yield entry(item)
+        except (WorkerTimeout, WorkerError) as e:
+            error = {"detail": f"Ошибка обработки файла: {str(e)}"}
+            yield archive.add("error.json", json.dumps(error, ensure_ascii=False).encode("utf-8"))
+        except WorkerCancelled:
+            return
+        yield archive.close()
+
+    return StreamingResponse(
+        produce(),
+        media_type=archive.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{Path(filename).stem}-images.{archive.extension}"'},
+    )
+
+
+@app.get("/search")
+async def search(
+    request: Request,
+    q: str = Query(..., min_length=1, description="Слова для поиска (все должны встретиться на странице)"),
+    limit: int = Query(20, ge=1, le=100, description="Максимум результатов"),
+    offset: int = Query(0, ge=0, description="Смещение для постраничной выдачи"),
+    raw: bool = Query(False, description="q - выражение FTS5 (AND, OR, NOT, \"фраза\", префикс*)"),
+):
+    """
+    Полнотекстовый поиск по страницам извлеченных документов
+    """
+    if search_index is None:
+        raise HTTPException(status_code=503, detail="Поиск отключен: не задан SEARCH_DB")
+    started = time.perf_counter()
     try:
-        content = await file.read()
-        doc = fitz.open(stream=content, filetype="pdf")
-        
-        # Метаданные
-        metadata = doc.metadata
-        metadata_dict = {
-            "title": metadata.get("title", ""),
-            "author": metadata.get("author", ""),
-            "subject": metadata.get("subject", ""),
-            "creator": metadata.get("creator", ""),
-            "producer": metadata.get("producer", ""),
-            "creation_date": metadata.get("creationDate", ""),
-            "modification_date": metadata.get("modDate", ""),
-            "format": metadata.get("format", ""),
-            "encryption": metadata.get("encryption", "")
-        }
-        
-        # Текст и изображения по страницам
-        pages_data = []
-        for page_num, page in enumerate(doc, 1):
-            text = page.get_text()
-            image_list = page.get_images()
-            
-            images_info = []
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                images_info.append({
-                    "index": img_index,
-                    "xref": xref,
-                    "width": base_image["width"],
-                    "height": base_image["height"],
-                    "colorspace": base_image["colorspace"],
-                    "bpc": base_image["bpc"],
-                    "size": len(base_image["image"])
-                })
-            
-            pages_data.append({
-                "page": page_num,
-                "text": text,
-                "images_count": len(image_list),
-                "images": images_info
-            })
-        
-        result = {
-            "filename": file.filename,
-            "pages": len(doc),
-            "metadata": metadata_dict,
-            "pages_data": pages_data
-        }
-        
-        doc.close()
-        return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка обработки файла: {str(e)}")
+        hits = await asyncio.to_thread(search_index.search, q, limit, offset, raw)
+    except SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=f"Некорректный запрос: {str(e)}")
+    return render(request, {
+        "query": q,
+        "hits": hits,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+"""
+Потоковая запись архивов (zip, tar) для ответов сервиса
+
+Архив пишется в буфер, который опустошается после каждого файла, поэтому в
+памяти находится не больше одного файла. Файлы добавляются без сжатия
+(ZIP_STORED): изображения уже сжаты в своем формате.
+"""
+import io
+import tarfile
+import time
+import zipfile
+
+
+class _Sink(io.RawIOBase):
+    """Несохраняемый поток: записанные байты забираются методом drain()"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+class ZipStream:
+    media_type = "application/zip"
+    extension = "zip"
+
+    def __init__(self):
+        self._sink = _Sink()
+        # Поток без seek: zipfile пишет размеры в data descriptor после файла
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=zipfile.ZIP_STORED)
+
+    def add(self, name: str, data: bytes) -> bytes:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        self._zip.writestr(info, data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+
+class TarStream:
+    media_type = "application/x-tar"
+    extension = "tar"
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._tar = tarfile.open(fileobj=self._sink, mode="w|")
+
+    def add(self, name: str, data: bytes) -> bytes:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._tar.close()
+        return self._sink.drain()
+
+
+ARCHIVES = {"zip": ZipStream, "tar": TarStream}
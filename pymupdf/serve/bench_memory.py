@@ -0,0 +1,140 @@
+"""
+Замер памяти на представление результата /extract_all
+
+Генерируется документ из --pages страниц (текст и встроенное изображение на
+каждой странице), extract_all выполняется в текущем процессе. Сравниваются
+записи со слотами (records.py) и прежнее дерево словарей:
+1. Память структуры результата без учета самих строк текста (tracemalloc).
+2. Размер pickle при передаче из рабочего процесса.
+3. Пик памяти и время кодирования ответа в JSON.
+
+Запуск из директории pymupdf/serve:
+    python bench_memory.py --pages 5000
+"""
+import argparse
+import gc
+import json
+import pickle
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+
+import fitz  # PyMuPDF (импортируется как fitz)
+
+from extraction import extract_all
+from records import DocumentPage, to_serializable
+
+_WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def make_document(pages: int, images: int) -> bytes:
+    """PDF с несколькими строками текста и images встроенными изображениями на странице"""
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 32, 32), 0)
+    pixmap.clear_with(128)
+    image = pixmap.tobytes("png")
+    doc = fitz.open()
+    xrefs = []
+    for page_num in range(pages):
+        page = doc.new_page()
+        lines = [
+            f"{page_num}.{line} " + " ".join(_WORDS[(page_num + line + i) % len(_WORDS)] for i in range(12))
+            for line in range(10)
+        ]
+        page.insert_text((72, 72), "\n".join(lines))
+        for index in range(images):
+            rect = fitz.Rect(72 + index * 40, 300, 104 + index * 40, 332)
+            if len(xrefs) <= index:
+                xrefs.append(page.insert_image(rect, stream=image))
+            else:
+                # Одно изображение на всех страницах: документ не растет с числом страниц
+                page.insert_image(rect, xref=xrefs[index])
+    return doc.tobytes(garbage=3, deflate=True)
+
+
+def _as_dicts(pages: list) -> list:
+    """Прежнее представление: словарь на страницу и на изображение (те же строки текста)"""
+    return [
+        {
+            "page": page.page,
+            "text": page.text,
+            "images_count": len(page.images),
+            "images": [image.to_dict() for image in page.images],
+        }
+        for page in pages
+    ]
+
+
+def _copy(record):
+    return type(record)(*record._values(record))
+
+
+def _as_records(pages: list) -> list:
+    """Записи со слотами (те же строки текста)"""
+    return [DocumentPage(page.page, page.text, [_copy(image) for image in page.images], None) for page in pages]
+
+
+def _allocated(build: Callable[[], Any]) -> Tuple[Any, int]:
+    """Результат build и объем памяти, оставшейся занятой после него"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return value, size
+
+
+def _encode(payload: Dict[str, Any], default) -> Tuple[float, int]:
+    """Время и пик памяти кодирования в JSON"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1e6:8.2f} МБ"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на представление результата /extract_all")
+    parser.add_argument("--pages", type=int, default=5000, help="Число страниц документа")
+    parser.add_argument("--images", type=int, default=2, help="Изображений на странице")
+    args = parser.parse_args()
+
+    content = make_document(args.pages, args.images)
+    print(f"Документ: {args.pages} страниц, {args.images} изображений на странице, {len(content) / 1e6:.1f} МБ")
+
+    started = time.perf_counter()
+    result = extract_all(content, "bench.pdf", lambda: None)
+    print(f"extract_all: {time.perf_counter() - started:.2f} с")
+
+    pages = result["pages_data"]
+    records, records_size = _allocated(lambda: _as_records(pages))
+    dicts, dicts_size = _allocated(lambda: _as_dicts(pages))
+
+    with_records = {**result, "pages_data": records}
+    with_dicts = {**result, "pages_data": dicts}
+    records_pickle = len(pickle.dumps(with_records, pickle.HIGHEST_PROTOCOL))
+    dicts_pickle = len(pickle.dumps(with_dicts, pickle.HIGHEST_PROTOCOL))
+    records_time, records_peak = _encode(with_records, to_serializable)
+    dicts_time, dicts_peak = _encode(with_dicts, None)
+
+    print()
+    print(f"{'':32} {'записи':>11} {'словари':>11}")
+    print(f"{'Структура (без текста)':32} {_mb(records_size)} {_mb(dicts_size)}")
+    print(f"{'  на страницу':32} {records_size / args.pages:8.0f} Б  {dicts_size / args.pages:8.0f} Б")
+    print(f"{'Pickle (передача по pipe)':32} {_mb(records_pickle)} {_mb(dicts_pickle)}")
+    print(f"{'JSON: пик памяти':32} {_mb(records_peak)} {_mb(dicts_peak)}")
+    print(f"{'JSON: время':32} {records_time:9.3f} с {dicts_time:9.3f} с")
+
+
+if __name__ == "__main__":
+    main()
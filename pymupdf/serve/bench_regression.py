@@ -0,0 +1,459 @@
+"""
+Регрессионный замер производительности на синтетическом корпусе (corpus.py)
+
+Для каждой задачи (эндпоинта) замеряются страниц в секунду, перцентили
+задержки запроса (p50, p95, p99) и пик памяти в двух режимах:
+- inprocess - функции extraction.TASKS в отдельном процессе (пик RSS процесса);
+- http - запросы к сервису: запускается uvicorn на свободном порту (или
+  используется --url), пик RSS - сумма по процессу сервиса и рабочим
+  процессам. Кэш результатов и поисковый индекс в запущенном сервисе выключены.
+  Задачи выполняются одним сервисом по очереди, поэтому пик памяти задачи
+  включает память, оставшуюся занятой после предыдущих.
+
+Заодно проверяются ответы на поврежденные файлы корпуса (статус и code).
+
+Результаты сравниваются с базовыми (--baseline): замер считается регрессией,
+если страниц в секунду меньше на --tolerance, p50/p95 больше на --tolerance
+или пик памяти больше на --rss-tolerance. Код возврата 1 - регрессия или
+неверный ответ, 0 - все в норме. Базовые значения зависят от машины и
+записываются на ней же (--save-baseline). Перцентили сравниваются, только если
+в замере и в базовых значениях не меньше --min-samples запросов на задачу.
+
+Без базовых значений (например, в CI на чистой копии) замер проверяется по
+абсолютным порогам из bench_floors.json (хранится в git): минимум страниц в
+секунду и максимум пика памяти по задаче. Пороги взяты с запасом (примерно
+в пять раз ниже скорости на 1 CPU) и ловят только грубые регрессии.
+
+Запуск из директории pymupdf/serve:
+    python bench_regression.py --save-baseline            # базовые значения
+    python bench_regression.py                            # сравнение с ними
+    python bench_regression.py --mode http --tasks text,all --scale 0.2
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import corpus
+
+# Задача -> эндпоинт сервиса
+ENDPOINTS = {
+    "text": "/extract_text",
+    "metadata": "/extract_metadata",
+    "images": "/extract_images",
+    "all": "/extract_all",
+    "tables": "/extract_tables",
+    "fingerprint": "/fingerprint",
+    "chunk": "/chunk",
+    "export_images": "/export_images",
+}
+
+# Сервис для замера: без кэша (иначе повторы - попадания в кэш) и без индексов на диске
+SERVICE_ENV = {
+    "CACHE_MEMORY_ITEMS": "0",
+    "CACHE_DIR": "",
+    "SEARCH_DB": "",
+    "FINGERPRINT_DB": ":memory:",
+    "METRICS_DIR": "",
+    "WEB_CONCURRENCY": "1",
+    "WORKER_PROCESSES": "1",
+    "ADMISSION_MAX_PER_CLIENT": "64",
+}
+
+# Меньше запросов - p50/p95 определяются одним-двумя значениями и шумят
+MIN_SAMPLES = 20
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль q (0-100) методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies: List[float], pages: int, elapsed: float, peak_rss: int) -> Dict[str, Any]:
+    return {
+        "requests": len(latencies),
+        "pages": pages,
+        "pages_per_sec": round(pages / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "peak_rss_mb": round(peak_rss / 2 ** 20, 1),
+    }
+
+
+def _expected(entry: Dict[str, Any], status: int, code: Optional[str]) -> Optional[str]:
+    """Описание несовпадения с ожидаемым ответом (None - совпадает)"""
+    if status == entry["status"] and code == entry["code"]:
+        return None
+    return f"{entry['name']}: ожидался {entry['status']} {entry['code'] or ''}, получен {status} {code or ''}".rstrip()
+
+
+def _run_inprocess(directory: str, documents: List[Dict[str, Any]], task: str, repeat: int, warmup: int):
+    """Замер задачи в текущем процессе (выполняется в отдельном процессе на задачу)"""
+    from collections import deque
+
+    import fitz  # PyMuPDF (импортируется как fitz)
+
+    from extraction import TASKS
+    from preflight import PreflightError, check_bytes
+
+    # Сообщения MuPDF о восстановлении поврежденных файлов корпуса
+    fitz.TOOLS.mupdf_display_errors(False)
+    function = TASKS[task]
+    contents = {entry["name"]: (Path(directory) / entry["name"]).read_bytes() for entry in documents}
+
+    def call(entry):
+        content = contents[entry["name"]]
+        try:
+            check_bytes(content)
+            result = function(content, entry["name"], lambda: None)
+            if not isinstance(result, dict):
+                # Потоковые задачи (chunk, export_images): генератор до конца
+                deque(result, maxlen=0)
+            return 200, None
+        except PreflightError as e:
+            return e.status_code, e.code
+        except Exception:
+            # Как в сервисе: ошибка разбора - 500
+            return 500, None
+
+    for _ in range(warmup):
+        for entry in documents:
+            call(entry)
+
+    latencies, pages, errors = [], 0, []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for entry in documents:
+            request_started = time.perf_counter()
+            status, code = call(entry)
+            latencies.append(time.perf_counter() - request_started)
+            error = _expected(entry, status, code)
+            if error:
+                errors.append(error)
+            elif status == 200:
+                pages += entry["pages"]
+    elapsed = time.perf_counter() - started
+    # ru_maxrss в Linux - в килобайтах
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return summarize(latencies, pages, elapsed, peak_rss), sorted(set(errors))
+
+
+def bench_inprocess(directory: Path, documents, tasks: List[str], repeat: int, warmup: int):
+    results, errors = {}, {}
+    context = multiprocessing.get_context("spawn")
+    for task in tasks:
+        # Новый процесс на задачу: пик RSS не накапливается между задачами
+        with context.Pool(1) as pool:
+            results[task], errors[task] = pool.apply(_run_inprocess, (str(directory), documents, task, repeat, warmup))
+        print(f"  inprocess/{task}: {results[task]['pages_per_sec']} стр/с")
+    return results, errors
+
+
+def _process_tree(pid: int) -> List[int]:
+    """pid и все его потомки (по /proc)"""
+    children: Dict[int, List[int]] = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def _rss(pid: int) -> int:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler(threading.Thread):
+    """Пик суммарного RSS процесса и его потомков (опрос /proc)"""
+
+    def __init__(self, pid: int, interval: float = 0.02):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, sum(_rss(pid) for pid in _process_tree(self.pid)))
+
+    def reset(self) -> int:
+        """Пик с прошлого вызова"""
+        peak, self.peak = self.peak, 0
+        return peak
+
+    def stop(self):
+        self._stopped.set()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_service(timeout: float) -> tuple:
+    """Запуск сервиса; возвращает процесс и адрес после ответа /ready"""
+    import httpx
+
+    port = _free_port()
+    # Журнал сервиса выводится только при ошибке запуска
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **SERVICE_ENV},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(f"{url}/ready", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    process.terminate()
+    process.wait(timeout=10)
+    log.seek(0)
+    raise RuntimeError(f"Сервис не запустился:\n{log.read().decode('utf-8', 'replace')[-4000:]}")
+
+
+def bench_http(url: str, directory: Path, documents, tasks: List[str], repeat: int, warmup: int,
+               sampler: Optional[RssSampler]):
+    import httpx
+
+    contents = {entry["name"]: (directory / entry["name"]).read_bytes() for entry in documents}
+    results, errors = {}, {}
+    with httpx.Client(base_url=url, timeout=600) as client:
+
+        def call(task: str, entry) -> tuple:
+            files = {"file": (entry["name"], contents[entry["name"]], "application/pdf")}
+            response = client.post(ENDPOINTS[task], files=files)
+            code = None
+            if response.status_code != 200:
+                try:
+                    code = response.json().get("code")
+                except ValueError:
+                    pass
+            return response.status_code, code
+
+        for task in tasks:
+            for _ in range(warmup):
+                for entry in documents:
+                    call(task, entry)
+            if sampler:
+                sampler.reset()
+            latencies, pages, task_errors = [], 0, []
+            started = time.perf_counter()
+            for _ in range(repeat):
+                for entry in documents:
+                    request_started = time.perf_counter()
+                    status, code = call(task, entry)
+                    latencies.append(time.perf_counter() - request_started)
+                    error = _expected(entry, status, code)
+                    if error:
+                        task_errors.append(error)
+                    elif status == 200:
+                        pages += entry["pages"]
+            elapsed = time.perf_counter() - started
+            results[task] = summarize(latencies, pages, elapsed, sampler.reset() if sampler else 0)
+            errors[task] = sorted(set(task_errors))
+            print(f"  http/{task}: {results[task]['pages_per_sec']} стр/с")
+    return results, errors
+
+
+def compare(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float, rss_tolerance: float, min_samples: int = MIN_SAMPLES) -> List[str]:
+    """Регрессии относительно базовых значений"""
+    regressions = []
+    for key, metrics in current.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if metrics["pages_per_sec"] < base["pages_per_sec"] * (1 - tolerance):
+            regressions.append(f"{key}: {metrics['pages_per_sec']} стр/с < {base['pages_per_sec']} - {tolerance:.0%}")
+        if min(metrics["requests"], base["requests"]) >= min_samples:
+            for name in ("p50_ms", "p95_ms"):
+                if metrics[name] > base[name] * (1 + tolerance):
+                    regressions.append(f"{key}: {name} {metrics[name]} > {base[name]} + {tolerance:.0%}")
+        if base["peak_rss_mb"] and metrics["peak_rss_mb"] > base["peak_rss_mb"] * (1 + rss_tolerance):
+            regressions.append(
+                f"{key}: пик памяти {metrics['peak_rss_mb']} МБ > {base['peak_rss_mb']} МБ + {rss_tolerance:.0%}"
+            )
+    return regressions
+
+
+def check_floors(current: Dict[str, Dict[str, Any]], floors: Dict[str, Dict[str, float]]) -> List[str]:
+    """Нарушения абсолютных порогов (bench_floors.json)"""
+    violations = []
+    for key, metrics in current.items():
+        minimum = floors.get("pages_per_sec", {}).get(key)
+        # Без страниц (только поврежденные файлы) скорость не определена
+        if minimum is not None and metrics["pages"] and metrics["pages_per_sec"] < minimum:
+            violations.append(f"{key}: {metrics['pages_per_sec']} стр/с < порога {minimum}")
+        maximum = floors.get("peak_rss_mb", {}).get(key)
+        # Пик 0 - память не замерялась (сервис по --url)
+        if maximum is not None and metrics["peak_rss_mb"] and metrics["peak_rss_mb"] > maximum:
+            violations.append(f"{key}: пик памяти {metrics['peak_rss_mb']} МБ > порога {maximum} МБ")
+    return violations
+
+
+def _print_table(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]):
+    print()
+    print(f"{'':26} {'стр/с':>9} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'пик, МБ':>8} {'база стр/с':>11}")
+    for key, metrics in results.items():
+        base = baseline.get(key, {}).get("pages_per_sec", "")
+        print(f"{key:26} {metrics['pages_per_sec']:9} {metrics['p50_ms']:9} {metrics['p95_ms']:9} "
+              f"{metrics['p99_ms']:9} {metrics['peak_rss_mb']:8} {base:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Регрессионный замер PyMuPDF сервиса на синтетическом корпусе")
+    parser.add_argument("--corpus", type=Path, default=Path("bench_corpus"), help="Директория корпуса")
+    parser.add_argument("--seed", type=int, default=0, help="Начальное значение генератора корпуса")
+    parser.add_argument("--scale", type=float, default=1.0, help="Множитель числа страниц корпуса")
+    parser.add_argument("--mode", choices=("inprocess", "http", "all"), default="all", help="Режим замера")
+    parser.add_argument("--tasks", default=",".join(ENDPOINTS), help="Задачи через запятую")
+    parser.add_argument("--kinds", default=None, help="Виды документов через запятую (по умолчанию: все)")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов корпуса на задачу")
+    parser.add_argument("--warmup", type=int, default=1, help="Прогревочных проходов корпуса")
+    parser.add_argument("--url", default=None, help="Адрес запущенного сервиса (без него - запуск uvicorn)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Ожидание запуска сервиса, секунд")
+    parser.add_argument("--baseline", type=Path, default=Path("bench_baseline.json"), help="Файл базовых значений")
+    parser.add_argument("--save-baseline", action="store_true", help="Записать результаты как базовые")
+    parser.add_argument("--floors", type=Path, default=Path(__file__).with_name("bench_floors.json"),
+                        help="Файл абсолютных порогов (используется без базовых значений)")
+    parser.add_argument("--min-samples", type=int, default=MIN_SAMPLES,
+                        help="Минимум запросов на задачу для сравнения перцентилей")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение скорости и задержки")
+    parser.add_argument("--rss-tolerance", type=float, default=0.25, help="Допустимый рост пика памяти")
+    parser.add_argument("--output", type=Path, default=None, help="Записать результаты в JSON")
+    args = parser.parse_args()
+
+    tasks = [task.strip() for task in args.tasks.split(",") if task.strip()]
+    unknown = [task for task in tasks if task not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Неизвестные задачи: {', '.join(unknown)}. Доступны: {', '.join(ENDPOINTS)}")
+
+    documents = corpus.load(args.corpus, args.seed, args.scale)
+    if args.kinds:
+        kinds = set(args.kinds.split(","))
+        documents = [entry for entry in documents if entry["kind"] in kinds]
+    total_pages = sum(entry["pages"] or 0 for entry in documents)
+    print(f"Корпус: {args.corpus}, документов: {len(documents)}, страниц: {total_pages}, повторов: {args.repeat}")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, List[str]] = {}
+    if args.mode in ("inprocess", "all"):
+        task_results, task_errors = bench_inprocess(args.corpus, documents, tasks, args.repeat, args.warmup)
+        results.update({f"inprocess/{task}": value for task, value in task_results.items()})
+        errors.update({f"inprocess/{task}": value for task, value in task_errors.items()})
+    if args.mode in ("http", "all"):
+        process, sampler = None, None
+        url = args.url
+        if not url:
+            process, url = start_service(args.timeout)
+            sampler = RssSampler(process.pid)
+            sampler.start()
+        try:
+            task_results, task_errors = bench_http(url, args.corpus, documents, tasks, args.repeat, args.warmup, sampler)
+        finally:
+            if sampler:
+                sampler.stop()
+            if process:
+                process.terminate()
+                process.wait(timeout=30)
+        results.update({f"http/{task}": value for task, value in task_results.items()})
+        errors.update({f"http/{task}": value for task, value in task_errors.items()})
+
+    meta = {
+        "seed": args.seed,
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "kinds": args.kinds,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+    baseline: Dict[str, Dict[str, Any]] = {}
+    if args.baseline.exists() and not args.save_baseline:
+        saved = json.loads(args.baseline.read_text(encoding="utf-8"))
+        same = all(saved["meta"].get(name) == meta[name] for name in ("seed", "scale", "repeat", "kinds"))
+        if same:
+            baseline = saved["results"]
+        else:
+            print(f"Базовые значения {args.baseline} записаны с другим корпусом или числом повторов - сравнение пропущено")
+    floors: Dict[str, Dict[str, float]] = {}
+    if not baseline and not args.save_baseline and args.floors.exists():
+        floors = json.loads(args.floors.read_text(encoding="utf-8"))
+
+    _print_table(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps({"meta": meta, "results": results}, indent=2), encoding="utf-8")
+
+    failed = False
+    wrong = [f"{key}: {error}" for key, items in errors.items() for error in items]
+    if wrong:
+        failed = True
+        print("\nНеверные ответы:")
+        for line in wrong:
+            print(f"  {line}")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({"meta": meta, "results": results}, indent=2), encoding="utf-8")
+        print(f"\nБазовые значения записаны: {args.baseline}")
+    elif baseline or floors:
+        if baseline:
+            regressions = compare(results, baseline, args.tolerance, args.rss_tolerance, args.min_samples)
+            few = sorted(key for key, metrics in results.items()
+                         if key in baseline and min(metrics["requests"], baseline[key]["requests"]) < args.min_samples)
+            if few:
+                print(f"\np50/p95 не сравниваются (меньше {args.min_samples} запросов): {', '.join(few)}")
+        else:
+            print(f"\nБазовых значений нет - проверка по порогам {args.floors}")
+            regressions = check_floors(results, floors)
+        if regressions:
+            failed = True
+            print("\nРегрессии:")
+            for line in regressions:
+                print(f"  {line}")
+        else:
+            print("\nРегрессий нет")
+    else:
+        print("\nНет ни базовых значений, ни порогов - сравнение пропущено")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
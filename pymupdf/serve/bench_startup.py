@@ -0,0 +1,113 @@
+"""
+Замер времени запуска сервиса
+
+1. Время импорта app в новом интерпретаторе (python -X importtime) и самые
+   медленные модули.
+2. Время от запуска uvicorn до ответа /health (liveness) и /ready (readiness).
+
+Запуск из директории pymupdf/serve:
+    python bench_startup.py --runs 5
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_imports(module: str, top: int):
+    """Время импорта модуля и самые медленные вложенные импорты (по собственному времени)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    entries = []
+    total = None
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        entries.append((int(self_us), name))
+        if name == module:
+            total = int(cumulative_us)
+    entries.sort(reverse=True)
+    return total / 1e6 if total else None, entries[:top]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _status(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+def measure_startup(timeout: float):
+    """Время до ответа /health и /ready для нового процесса сервиса"""
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    live = ready = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if live is None and _status(f"http://127.0.0.1:{port}/health") == 200:
+                live = time.perf_counter() - started
+            if live is not None and _status(f"http://127.0.0.1:{port}/ready") == 200:
+                ready = time.perf_counter() - started
+                break
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return live, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер времени запуска PyMuPDF сервиса")
+    parser.add_argument("--runs", type=int, default=3, help="Число запусков")
+    parser.add_argument("--top", type=int, default=10, help="Число самых медленных модулей в отчете")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Максимальное ожидание запуска, секунд")
+    args = parser.parse_args()
+
+    total, slowest = measure_imports("app", args.top)
+    print(f"Импорт app: {total:.3f} с" if total else "Импорт app: нет данных")
+    for self_us, name in slowest:
+        print(f"  {self_us / 1000:8.1f} мс  {name}")
+
+    lives, readies = [], []
+    for run in range(1, args.runs + 1):
+        live, ready = measure_startup(args.timeout)
+        print(f"Запуск {run}: /health {live if live is None else f'{live:.3f} с'}, "
+              f"/ready {ready if ready is None else f'{ready:.3f} с'}")
+        if live is not None:
+            lives.append(live)
+        if ready is not None:
+            readies.append(ready)
+
+    if lives:
+        print(f"Медиана /health: {statistics.median(lives):.3f} с")
+    if readies:
+        print(f"Медиана /ready:  {statistics.median(readies):.3f} с")
+
+
+if __name__ == "__main__":
+    main()
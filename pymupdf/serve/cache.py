@@ -0,0 +1,222 @@
+"""
+Кэш результатов извлечения: локальный в памяти и общий на диске
+
+Ключ - задача и SHA-256 содержимого файла. Локальный уровень (LRU) у каждого
+процесса сервиса свой и ограничен числом записей (CACHE_MEMORY_ITEMS) и
+объемом (CACHE_MEMORY_MB); объем записи оценивается по размеру ее JSON, объекты
+Python в памяти занимают в несколько раз больше. Дисковый уровень (CACHE_DIR) общий для всех процессов
+и контейнеров, смонтировавших одну директорию. Запись на диск атомарная
+(временный файл + os.replace), поэтому блокировки между процессами не нужны.
+
+Дисковый уровень ограничен по объему (CACHE_MAX_BYTES) и возрасту записей
+(CACHE_TTL): не чаще раза в CACHE_SWEEP_INTERVAL секунд процесс, записавший
+результат, удаляет устаревшие записи и самые старые по mtime, пока объем не
+станет меньше лимита. Чтение обновляет mtime, поэтому вытесняются давно не
+использованные результаты.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from metrics import metrics
+from records import to_serializable
+
+
+def content_key(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class ResultCache:
+    """
+    Двухуровневый кэш результатов
+
+    Args:
+        memory_items: Размер локального LRU (0 - без локального уровня)
+        memory_bytes: Предельный объем локального LRU в байтах JSON (0 - без ограничения)
+        directory: Директория общего дискового уровня (None - без него)
+        max_bytes: Предельный объем дискового уровня в байтах (0 - без ограничения)
+        ttl: Время жизни записи на диске с последнего обращения, секунд (0 - без ограничения)
+        sweep_interval: Период очистки дискового уровня, секунд
+    """
+
+    def __init__(
+        self,
+        memory_items: int = 256,
+        memory_bytes: int = 128 << 20,
+        directory: Optional[str] = None,
+        max_bytes: int = 2 << 30,
+        ttl: float = 7 * 24 * 3600,
+        sweep_interval: float = 300,
+    ):
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # Ключ -> (результат, размер JSON в байтах)
+        self._memory: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._memory_size = 0
+        self._sweeping = False
+        self._next_sweep = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        """Настройки из переменных окружения CACHE_*"""
+        return cls(
+            memory_items=int(os.getenv("CACHE_MEMORY_ITEMS", "256")),
+            memory_bytes=int(float(os.getenv("CACHE_MEMORY_MB", "128")) * 2 ** 20),
+            directory=os.getenv("CACHE_DIR") or None,
+            max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(2 << 30))),
+            ttl=float(os.getenv("CACHE_TTL", str(7 * 24 * 3600))),
+            sweep_interval=float(os.getenv("CACHE_SWEEP_INTERVAL", "300")),
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, task: str, digest: str) -> Optional[Any]:
+        key = f"{task}-{digest}"
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                metrics.inc("pymupdf_cache_requests_total", tier="memory", result="hit")
+                return self._memory[key][0]
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    if self.ttl and time.time() - os.fstat(f.fileno()).st_mtime > self.ttl:
+                        raise OSError("expired")
+                    data = f.read()
+                value = json.loads(data)
+                # Отметка обращения для вытеснения давно не использованных
+                os.utime(path)
+            except (OSError, ValueError):
+                pass
+            else:
+                metrics.inc("pymupdf_cache_requests_total", tier="disk", result="hit")
+                self._remember(key, value, len(data))
+                return value
+        metrics.inc("pymupdf_cache_requests_total", tier="all", result="miss")
+        return None
+
+    def put(self, task: str, digest: str, value: Any):
+        key = f"{task}-{digest}"
+        if not (self.memory_items or self.directory):
+            return
+        data = json.dumps(value, ensure_ascii=False, default=to_serializable).encode("utf-8")
+        self._remember(key, value, len(data))
+        if not self.directory:
+            return
+        if self.max_bytes and len(data) > self.max_bytes // 10:
+            # Результат больше десятой части лимита вытеснил бы большую часть кэша
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        if not (self.max_bytes or self.ttl):
+            return
+        with self._lock:
+            if self._sweeping or time.monotonic() < self._next_sweep:
+                return
+            self._sweeping = True
+        try:
+            self.sweep()
+        finally:
+            with self._lock:
+                self._sweeping = False
+                self._next_sweep = time.monotonic() + self.sweep_interval
+
+    def sweep(self) -> int:
+        """
+        Очистка дискового уровня: записи старше ttl, затем самые старые по mtime сверх max_bytes
+
+        Returns:
+            Число удаленных записей
+        """
+        if not self.directory:
+            return 0
+        now = time.time()
+        entries = []
+        # Только поддиректории записей (key[:2]): в CACHE_DIR могут лежать другие файлы
+        for shard in os.scandir(self.directory):
+            if len(shard.name) != 2 or not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith(".json"):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith(".tmp") and now - stat.st_mtime > 3600:
+                    # Временный файл прерванной записи
+                    self._remove(entry.path)
+
+        removed = 0
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for mtime, size, path in entries:
+            expired = self.ttl and now - mtime > self.ttl
+            if not expired and not (self.max_bytes and total > self.max_bytes):
+                break
+            if self._remove(path):
+                removed += 1
+            total -= size
+        if removed:
+            self.evicted += removed
+            metrics.inc("pymupdf_cache_evictions_total", removed)
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            # Удалено другим процессом
+            return False
+
+    def _remember(self, key: str, value: Any, size: int):
+        if not self.memory_items:
+            return
+        if self.memory_bytes and size > self.memory_bytes // 10:
+            # Как на диске: большой результат вытеснил бы большую часть кэша
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= self._memory.pop(key)[1]
+            self._memory[key] = (value, size)
+            self._memory_size += size
+            while len(self._memory) > self.memory_items or (
+                self.memory_bytes and self._memory_size > self.memory_bytes
+            ):
+                self._memory_size -= self._memory.popitem(last=False)[1][1]
+
+    def stats(self):
+        return {
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "shared": bool(self.directory),
+            "evicted": self.evicted,
+        }
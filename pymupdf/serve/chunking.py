@@ -0,0 +1,286 @@
+"""
+Разбиение документа на фрагменты для эмбеддингов с учетом разметки
+
+Используются блоки и шрифты из page.get_text("dict"): блоки с крупным или
+жирным коротким текстом считаются заголовками и начинают новый фрагмент,
+путь заголовков сохраняется в каждом фрагменте. Блоки не разрезаются, пока
+помещаются в лимит токенов, поэтому абзацы не рвутся посередине.
+
+Таблицы находятся через tables.page_tables (find_tables только на страницах
+с линиями разметки) и отдаются отдельным фрагментом (table: true) - строки
+через перевод строки, ячейки через " | ". Таблица больше лимита режется по
+строкам, заголовок таблицы повторяется в каждой части. Блоки текста внутри
+таблицы в остальные фрагменты не попадают.
+
+Фрагменты отдаются по мере готовности (генератор), с номерами страниц и
+прямоугольниками блоков.
+"""
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF (импортируется как fitz)
+
+from preflight import open_document
+from tables import TableStats, page_tables
+
+# Приближение числа токенов: слова и знаки препинания
+_TOKEN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE = re.compile(r"(?<=[.!?…])\s+")
+
+HEADING_SIZE_RATIO = 1.15
+HEADING_MAX_CHARS = 200
+BOLD_FLAG = 16
+
+
+def count_tokens(text: str) -> int:
+    return len(_TOKEN.findall(text))
+
+
+class _Block:
+    __slots__ = ("page", "bbox", "text", "size", "bold")
+
+    def __init__(self, page: int, bbox: Tuple[float, ...], text: str, size: float, bold: bool):
+        self.page = page
+        self.bbox = bbox
+        self.text = text
+        self.size = size
+        self.bold = bold
+
+
+def _page_blocks(page: fitz.Page, page_num: int, sizes: Counter) -> List[_Block]:
+    blocks = []
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        if block.get("type") != 0:
+            continue
+        lines = []
+        block_sizes: Counter = Counter()
+        bold_chars = 0
+        for line in block["lines"]:
+            spans = line["spans"]
+            lines.append("".join(span["text"] for span in spans))
+            for span in spans:
+                chars = len(span["text"].strip())
+                block_sizes[round(span["size"], 1)] += chars
+                if span["flags"] & BOLD_FLAG:
+                    bold_chars += chars
+        text = "\n".join(lines).strip()
+        if not text:
+            continue
+        sizes.update(block_sizes)
+        total = sum(block_sizes.values()) or 1
+        blocks.append(_Block(
+            page_num,
+            tuple(round(value, 1) for value in block["bbox"]),
+            text,
+            block_sizes.most_common(1)[0][0],
+            bold_chars / total > 0.8,
+        ))
+    return blocks
+
+
+def _is_heading(block: _Block, body_size: float) -> bool:
+    if len(block.text) > HEADING_MAX_CHARS or block.text.count("\n") > 2:
+        return False
+    if block.size >= body_size * HEADING_SIZE_RATIO:
+        return True
+    return block.bold and block.size >= body_size and not block.text.endswith((".", ",", ";", ":"))
+
+
+def _split_long(text: str, max_tokens: int) -> List[str]:
+    """Разрезание блока больше лимита: по предложениям, затем по токенам"""
+    parts, current, current_tokens = [], [], 0
+    for sentence in _SENTENCE.split(text):
+        tokens = count_tokens(sentence)
+        if tokens > max_tokens:
+            if current:
+                parts.append(" ".join(current))
+                current, current_tokens = [], 0
+            # Части по max_tokens токенов с исходными пробелами между ними
+            spans = [match.span() for match in _TOKEN.finditer(sentence)]
+            for start in range(0, len(spans), max_tokens):
+                part = spans[start:start + max_tokens]
+                parts.append(sentence[part[0][0]:part[-1][1]])
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            parts.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        parts.append(" ".join(current))
+    return parts
+
+
+def _inside(block: _Block, bbox: Tuple[float, ...]) -> bool:
+    """Центр блока внутри прямоугольника"""
+    x, y = (block.bbox[0] + block.bbox[2]) / 2, (block.bbox[1] + block.bbox[3]) / 2
+    return bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]
+
+
+def _row_text(cells: List[Optional[str]]) -> str:
+    return " | ".join(" ".join((cell or "").split()) for cell in cells)
+
+
+def _table_parts(table: Dict[str, Any], max_tokens: int) -> List[str]:
+    """Текст таблицы; больше лимита - части по строкам с заголовком в каждой"""
+    header = _row_text(table["header"]) if table["header"] else ""
+    rows = [_row_text(row) for row in table["cells"]]
+    lines = [header] + rows if header else rows
+    if count_tokens("\n".join(lines)) <= max_tokens:
+        return ["\n".join(lines)]
+    header_tokens = count_tokens(header)
+    # Заголовок, который сам не помещается в лимит, не повторяется
+    if header_tokens * 2 > max_tokens:
+        rows, header, header_tokens = lines, "", 0
+    limit = max_tokens - header_tokens
+    parts, current, current_tokens = [], [], 0
+    for row in rows:
+        tokens = count_tokens(row)
+        pieces = [row] if tokens <= limit else _split_long(row, limit)
+        for piece in pieces:
+            tokens = count_tokens(piece)
+            if current and current_tokens + tokens > limit:
+                parts.append(current)
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        parts.append(current)
+    return ["\n".join(([header] if header else []) + part) for part in parts]
+
+
+def _with_tables(
+    blocks: List[_Block], tables: List[Dict[str, Any]], page_num: int, max_tokens: int
+) -> List[Tuple[_Block, Optional[List[str]]]]:
+    """
+    Блоки страницы и таблицы в порядке чтения: (блок, None) или (таблица, части)
+
+    Блоки внутри таблицы заменяются таблицей на месте первого из них; таблица
+    без текстовых блоков внутри ставится перед первым блоком ниже ее верха.
+    """
+    items: List[Tuple[_Block, Optional[List[str]]]] = []
+    placed = set()
+
+    def place(index: int):
+        placed.add(index)
+        table = tables[index]
+        text_parts = _table_parts(table, max_tokens)
+        items.append((_Block(page_num, tuple(table["bbox"]), "\n".join(text_parts), 0, False), text_parts))
+
+    for block in blocks:
+        index = next((i for i, table in enumerate(tables) if _inside(block, table["bbox"])), None)
+        if index is None:
+            for i, table in enumerate(tables):
+                if i not in placed and block.bbox[1] >= table["bbox"][1]:
+                    place(i)
+            items.append((block, None))
+        elif index not in placed:
+            place(index)
+    for i in range(len(tables)):
+        if i not in placed:
+            place(i)
+    return items
+
+
+class _ChunkBuilder:
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.headings: List[Tuple[float, str]] = []
+        self.index = 0
+        self._texts: List[str] = []
+        self._tokens = 0
+        self._boxes: Dict[int, List[float]] = {}
+        self._table = False
+
+    def heading(self, block: _Block) -> Optional[Dict[str, Any]]:
+        chunk = self.flush()
+        # Заголовок того же или большего размера закрывает предыдущий раздел
+        while self.headings and self.headings[-1][0] <= block.size:
+            self.headings.pop()
+        self.headings.append((block.size, " ".join(block.text.split())))
+        return chunk
+
+    def add(self, block: _Block, text: str) -> Optional[Dict[str, Any]]:
+        tokens = count_tokens(text)
+        chunk = None
+        if self._texts and self._tokens + tokens > self.max_tokens:
+            chunk = self.flush()
+        self._texts.append(text)
+        self._tokens += tokens
+        box = self._boxes.get(block.page)
+        if box is None:
+            self._boxes[block.page] = list(block.bbox)
+        else:
+            box[0], box[1] = min(box[0], block.bbox[0]), min(box[1], block.bbox[1])
+            box[2], box[3] = max(box[2], block.bbox[2]), max(box[3], block.bbox[3])
+        return chunk
+
+    def table(self, block: _Block, parts: List[str]) -> List[Dict[str, Any]]:
+        """Таблица отдельными фрагментами: по одному на часть"""
+        chunks = [self.flush()]
+        for part in parts:
+            self.add(block, part)
+            self._table = True
+            chunks.append(self.flush())
+        return [chunk for chunk in chunks if chunk]
+
+    def flush(self) -> Optional[Dict[str, Any]]:
+        if not self._texts:
+            return None
+        chunk = {
+            "index": self.index,
+            "headings": [text for _, text in self.headings],
+            "text": "\n\n".join(self._texts),
+            "tokens": self._tokens,
+            "table": self._table,
+            "pages": sorted(self._boxes),
+            "bboxes": [{"page": page, "bbox": box} for page, box in sorted(self._boxes.items())],
+        }
+        self.index += 1
+        self._texts, self._tokens, self._boxes, self._table = [], 0, {}, False
+        return chunk
+
+
+def chunk_document(
+    content: bytes,
+    filename: str,
+    check: Callable[[], None],
+    max_tokens: int = 512,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Фрагменты документа по мере обработки страниц
+
+    Первый элемент - {"type": "document", ...}, затем {"type": "chunk", ...},
+    последний - {"type": "end", "chunks": N}.
+    """
+    with open_document(content) as doc:
+        yield {"type": "document", "filename": filename, "pages": len(doc)}
+        builder = _ChunkBuilder(max_tokens)
+        stats = TableStats()
+        # Размер основного текста - самый частый размер шрифта на обработанных страницах
+        sizes: Counter = Counter()
+        for page_num, page in enumerate(doc, 1):
+            check()
+            blocks = _page_blocks(page, page_num, sizes)
+            body_size = sizes.most_common(1)[0][0] if sizes else 0
+            tables = page_tables(page, stats)
+            for block, table_parts in _with_tables(blocks, tables, page_num, max_tokens):
+                if table_parts is not None:
+                    for chunk in builder.table(block, table_parts):
+                        yield {"type": "chunk", **chunk}
+                    continue
+                if _is_heading(block, body_size):
+                    chunk = builder.heading(block)
+                    if chunk:
+                        yield {"type": "chunk", **chunk}
+                    continue
+                parts = [block.text] if count_tokens(block.text) <= max_tokens else _split_long(block.text, max_tokens)
+                for part in parts:
+                    chunk = builder.add(block, part)
+                    if chunk:
+                        yield {"type": "chunk", **chunk}
+        chunk = builder.flush()
+        if chunk:
+            yield {"type": "chunk", **chunk}
+        yield {"type": "end", "chunks": builder.index}
@@ -0,0 +1,254 @@
+"""
+Сжатие ответов (zstd, brotli, gzip) по заголовку Accept-Encoding
+
+Сжимаются только ответы больше порога COMPRESSION_MIN_SIZE. Тело сжимается
+потоково по мере отправки: каждый фрагмент сбрасывается компрессором сразу,
+поэтому постраничная (потоковая) выдача доходит до клиента без задержки.
+brotli и zstandard - опциональные зависимости; без них доступен только gzip.
+"""
+import importlib.util
+import os
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+# Порядок предпочтения сервера при равном q у клиента
+PREFERENCE = ("zstd", "br", "gzip")
+
+# Типы, которые имеет смысл сжимать (изображения и архивы уже сжаты)
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/msgpack",
+    "application/cbor",
+    "application/x-ndjson",
+    "text/",
+)
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        # wbits 16 + MAX_WBITS - формат gzip
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, level: int):
+        import brotli
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        import zstandard
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def _available() -> Dict[str, Callable[[int], object]]:
+    # Наличие пакета проверяется без импорта: модули загружаются при первом сжатии
+    codecs = {"gzip": _Gzip}
+    for encoding, module, codec in (("br", "brotli", _Brotli), ("zstd", "zstandard", _Zstd)):
+        if importlib.util.find_spec(module) is not None:
+            codecs[encoding] = codec
+    return codecs
+
+
+def negotiate(accept_encoding: Optional[str], available) -> Optional[str]:
+    """Выбор кодировки по Accept-Encoding с учетом q и предпочтений сервера"""
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for part in accept_encoding.split(","):
+        fields = part.strip().split(";")
+        name = fields[0].strip().lower()
+        quality = 1.0
+        for param in fields[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name] = quality
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in PREFERENCE:
+        if encoding not in available:
+            continue
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware сжатия ответов
+
+    Args:
+        app: ASGI приложение
+        minimum_size: Минимальный размер ответа для сжатия, байт
+        levels: Уровни сжатия по кодировкам {"gzip": 6, "br": 4, "zstd": 3}
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, levels: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": 6, "br": 4, "zstd": 3, **(levels or {})}
+        self.codecs = _available()
+
+    @classmethod
+    def options_from_env(cls) -> dict:
+        """Настройки из переменных окружения COMPRESSION_*"""
+        return {
+            "minimum_size": int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+            "levels": {
+                "gzip": int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+                "br": int(os.getenv("COMPRESSION_BROTLI_LEVEL", "4")),
+                "zstd": int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3")),
+            },
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1")
+        encoding = negotiate(accept, self.codecs)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(send, encoding, self.codecs[encoding], self.levels[encoding], self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    """Перехват отправки ответа: решение о сжатии и потоковое сжатие тела"""
+
+    def __init__(self, send, encoding: str, codec, level: int, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.codec = codec
+        self.level = level
+        self.minimum_size = minimum_size
+        self._start: Optional[dict] = None
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._compressor = None
+        self._passthrough = False
+        self._elapsed = 0.0
+        self._bytes_in = 0
+        self._bytes_out = 0
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self._start = message
+            self._passthrough = not self._should_compress(message)
+            if self._passthrough:
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._compressor is None:
+            # Размер неизвестен (потоковый ответ): копим до порога
+            self._buffer.append(body)
+            self._buffered += len(body)
+            if self._buffered < self.minimum_size:
+                if not more_body:
+                    await self._send_uncompressed()
+                return
+            await self._begin()
+            body, self._buffer = b"".join(self._buffer), []
+
+        chunk = self._compress(body, final=not more_body)
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+        if not more_body:
+            self._record()
+
+    def _should_compress(self, message) -> bool:
+        headers = _Headers(message["headers"])
+        if headers.get(b"content-encoding") is not None:
+            return False
+        content_type = (headers.get(b"content-type") or b"").decode("latin-1").lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = headers.get(b"content-length")
+        return length is None or int(length) >= self.minimum_size
+
+    async def _send_uncompressed(self):
+        await self._send(self._start)
+        await self._send({"type": "http.response.body", "body": b"".join(self._buffer)})
+
+    async def _begin(self):
+        headers = _Headers(self._start["headers"])
+        headers.remove(b"content-length")
+        headers.set(b"content-encoding", self.encoding.encode("latin-1"))
+        vary = headers.get(b"vary")
+        if vary is None:
+            headers.set(b"vary", b"Accept-Encoding")
+        elif b"accept-encoding" not in vary.lower():
+            headers.set(b"vary", vary + b", Accept-Encoding")
+        await self._send({**self._start, "headers": headers.items})
+        self._compressor = self.codec(self.level)
+
+    def _compress(self, data: bytes, final: bool) -> bytes:
+        started = time.perf_counter()
+        chunk = self._compressor.compress(data) if data else b""
+        if final:
+            chunk += self._compressor.finish()
+        self._elapsed += time.perf_counter() - started
+        self._bytes_in += len(data)
+        self._bytes_out += len(chunk)
+        return chunk
+
+    def _record(self):
+        metrics.observe("pymupdf_compression_seconds", self._elapsed, encoding=self.encoding)
+        metrics.inc("pymupdf_compression_input_bytes_total", self._bytes_in, encoding=self.encoding)
+        metrics.inc("pymupdf_compression_output_bytes_total", self._bytes_out, encoding=self.encoding)
+
+
+class _Headers:
+    """Изменяемый список заголовков ASGI"""
+
+    def __init__(self, items: List[Tuple[bytes, bytes]]):
+        self.items = list(items)
+
+    def get(self, name: bytes) -> Optional[bytes]:
+        for key, value in self.items:
+            if key.lower() == name:
+                return value
+        return None
+
+    def remove(self, name: bytes):
+        self.items = [(key, value) for key, value in self.items if key.lower() != name]
+
+    def set(self, name: bytes, value: bytes):
+        self.remove(name)
+        self.items.append((name, value))
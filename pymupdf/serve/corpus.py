@@ -0,0 +1,245 @@
+"""
+Синтетический корпус документов для замеров производительности
+
+Виды документов:
+- text - только текст (заголовки и абзацы), несколько страниц;
+- images - много разных встроенных изображений на каждой странице;
+- huge - тысячи страниц короткого текста;
+- scanned - каждая страница - растровое изображение без текстового слоя;
+- tables - страницы с таблицами, размеченными линиями;
+- malformed - поврежденные, зашифрованные, пустые и не-PDF файлы с
+  ожидаемым ответом предварительной проверки.
+
+Содержимое определяется параметром seed: при том же seed и scale корпус
+тот же (без дат создания и случайных идентификаторов PDF; у зашифрованного
+файла отличается только случайный вектор инициализации AES). Рядом с файлами
+записывается manifest.json: имя, вид, число страниц и ожидаемый ответ.
+
+Запуск из директории pymupdf/serve:
+    python corpus.py --out bench_corpus --scale 1
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import fitz  # PyMuPDF (импортируется как fitz)
+
+_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua документ отчет таблица раздел глава приложение данные результат анализ"
+).split()
+
+# Версия генератора: при изменении содержимого корпуса существующий генерируется заново
+VERSION = 1
+
+# Размер страницы A4 в пунктах
+_WIDTH, _HEIGHT = 595, 842
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _save(doc: fitz.Document, **options) -> bytes:
+    # Без дат и нового /ID: одинаковый seed - одинаковые байты
+    doc.set_metadata({"producer": "corpus.py", "creator": "corpus.py"})
+    data = doc.tobytes(garbage=3, deflate=True, no_new_id=True, **options)
+    doc.close()
+    return data
+
+
+def _text_page(doc: fitz.Document, rng: random.Random, number: int, paragraphs: int):
+    page = doc.new_page(width=_WIDTH, height=_HEIGHT)
+    y = 72
+    page.insert_text((72, y), f"Раздел {number}. {_sentence(rng, 4)}", fontsize=16, fontname="helv")
+    y += 32
+    for _ in range(paragraphs):
+        box = fitz.Rect(72, y, _WIDTH - 72, y + 110)
+        page.insert_textbox(box, " ".join(_sentence(rng, rng.randint(8, 16)) for _ in range(5)), fontsize=10)
+        y += 120
+        if y > _HEIGHT - 150:
+            break
+    return page
+
+
+def text_document(rng: random.Random, pages: int) -> bytes:
+    """Только текст: заголовок и абзацы на каждой странице"""
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        _text_page(doc, rng, number, paragraphs=5)
+    return _save(doc)
+
+
+def _noise_image(rng: random.Random, size: int) -> bytes:
+    """PNG со случайным содержимым (изображения не совпадают и плохо сжимаются)"""
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, size, size), 0)
+    pixmap.set_rect(pixmap.irect, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    for _ in range(size // 2):
+        x, y = rng.randrange(size - 8), rng.randrange(size - 8)
+        pixmap.set_rect(fitz.IRect(x, y, x + 8, y + 8), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return pixmap.tobytes("png")
+
+
+def images_document(rng: random.Random, pages: int, per_page: int = 6, size: int = 192) -> bytes:
+    """Много разных встроенных изображений на каждой странице и немного текста"""
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page(width=_WIDTH, height=_HEIGHT)
+        page.insert_text((72, 60), f"Иллюстрации {number}. {_sentence(rng, 6)}", fontsize=12)
+        for index in range(per_page):
+            column, row = index % 2, index // 2
+            rect = fitz.Rect(72 + column * 230, 90 + row * 230, 282 + column * 230, 300 + row * 230)
+            page.insert_image(rect, stream=_noise_image(rng, size))
+    return _save(doc)
+
+
+def huge_document(rng: random.Random, pages: int) -> bytes:
+    """Тысячи страниц с несколькими строками текста"""
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page(width=_WIDTH, height=_HEIGHT)
+        page.insert_text((72, 72), "\n".join(f"{number}.{line} {_sentence(rng, 10)}" for line in range(8)), fontsize=10)
+    return _save(doc)
+
+
+def scanned_document(rng: random.Random, pages: int, dpi: int = 150) -> bytes:
+    """Страницы-изображения без текстового слоя: отрисованный текст в оттенках серого с шумом"""
+    source = fitz.open()
+    for number in range(1, pages + 1):
+        _text_page(source, rng, number, paragraphs=5)
+    doc = fitz.open()
+    for page in source:
+        pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        # Шум сканера: редкие темные точки
+        for _ in range(pixmap.width * pixmap.height // 2000):
+            x, y = rng.randrange(pixmap.width - 2), rng.randrange(pixmap.height - 2)
+            pixmap.set_rect(fitz.IRect(x, y, x + 2, y + 2), (rng.randrange(64),))
+        scan = doc.new_page(width=_WIDTH, height=_HEIGHT)
+        scan.insert_image(scan.rect, stream=pixmap.tobytes("jpeg", jpg_quality=70))
+    source.close()
+    return _save(doc)
+
+
+def tables_document(rng: random.Random, pages: int, rows: int = 12, columns: int = 5) -> bytes:
+    """Страницы с таблицей, размеченной линиями, и абзацем текста"""
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page(width=_WIDTH, height=_HEIGHT)
+        page.insert_text((72, 72), f"Таблица {number}. {_sentence(rng, 5)}", fontsize=12)
+        left, top, cell_width, cell_height = 72, 100, 90, 24
+        for row in range(rows + 1):
+            y = top + row * cell_height
+            page.draw_line((left, y), (left + columns * cell_width, y))
+        for column in range(columns + 1):
+            x = left + column * cell_width
+            page.draw_line((x, top), (x, top + rows * cell_height))
+        for row in range(rows):
+            for column in range(columns):
+                value = rng.choice(_WORDS) if row == 0 else str(rng.randint(0, 99999))
+                page.insert_text((left + column * cell_width + 4, top + row * cell_height + 16), value, fontsize=9)
+        box = fitz.Rect(72, top + rows * cell_height + 30, _WIDTH - 72, _HEIGHT - 72)
+        page.insert_textbox(box, " ".join(_sentence(rng, 12) for _ in range(6)), fontsize=10)
+    return _save(doc)
+
+
+def malformed_documents(rng: random.Random) -> Dict[str, Dict[str, Any]]:
+    """
+    Поврежденные и неподдерживаемые файлы
+
+    Returns:
+        Имя -> {"content", "status", "code"}; ответ ожидается при настройках
+        по умолчанию (PREFLIGHT_REPAIR=1): обрезанный файл и неверный
+        startxref MuPDF восстанавливает, остальные отклоняются.
+    """
+    valid = text_document(rng, 3)
+    # startxref указывает не на таблицу xref
+    bad_xref = valid[: valid.rindex(b"startxref")] + b"startxref\n1\n%%EOF\n"
+
+    doc = fitz.open()
+    _text_page(doc, rng, 1, paragraphs=2)
+    encrypted = _save(doc, encryption=fitz.PDF_ENCRYPT_AES_256, user_pw="secret", owner_pw="owner")
+
+    return {
+        "truncated.pdf": {"content": valid[: len(valid) // 2], "status": 200, "code": None},
+        "bad_xref.pdf": {"content": bad_xref, "status": 200, "code": None},
+        "header_only.pdf": {"content": b"%PDF-1.7\n%%EOF\n", "status": 422, "code": "unreadable"},
+        "encrypted.pdf": {"content": encrypted, "status": 422, "code": "encrypted"},
+        "empty.pdf": {"content": b"", "status": 422, "code": "empty_file"},
+        "not_pdf.pdf": {"content": ("Обычный текст, не PDF. " * 50).encode("utf-8"), "status": 415, "code": "unsupported_format"},
+    }
+
+
+def generate(out: Path, seed: int = 0, scale: float = 1.0) -> List[Dict[str, Any]]:
+    """
+    Генерация корпуса в директорию out
+
+    Args:
+        out: Директория корпуса (создается)
+        seed: Начальное значение генератора случайных чисел
+        scale: Множитель числа страниц (0.1 - быстрый прогон, 10 - нагрузочный)
+
+    Returns:
+        Манифест: [{"name", "kind", "size", "pages", "status", "code"}]
+    """
+    def pages(count: int) -> int:
+        return max(1, round(count * scale))
+
+    builders = [
+        ("text.pdf", "text", text_document, pages(50)),
+        ("images.pdf", "images", images_document, pages(20)),
+        ("huge.pdf", "huge", huge_document, pages(2000)),
+        ("scanned.pdf", "scanned", scanned_document, pages(20)),
+        ("tables.pdf", "tables", tables_document, pages(20)),
+    ]
+    out.mkdir(parents=True, exist_ok=True)
+    manifest = []
+    for name, kind, build, count in builders:
+        # Отдельный генератор на документ: добавление вида не меняет остальные
+        content = build(random.Random(f"{seed}-{kind}"), count)
+        (out / name).write_bytes(content)
+        manifest.append({"name": name, "kind": kind, "size": len(content), "pages": count, "status": 200, "code": None})
+    for name, entry in malformed_documents(random.Random(f"{seed}-malformed")).items():
+        (out / name).write_bytes(entry["content"])
+        count = None
+        if entry["status"] == 200:
+            # Страниц после восстановления
+            with fitz.open(stream=entry["content"], filetype="pdf") as doc:
+                count = doc.page_count
+        manifest.append({
+            "name": name, "kind": "malformed", "size": len(entry["content"]), "pages": count,
+            "status": entry["status"], "code": entry["code"],
+        })
+    (out / "manifest.json").write_text(
+        json.dumps({"version": VERSION, "seed": seed, "scale": scale, "documents": manifest}, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+    return manifest
+
+
+def load(out: Path, seed: int = 0, scale: float = 1.0) -> List[Dict[str, Any]]:
+    """Манифест корпуса; генерируется заново, если корпуса нет, он другой версии или с другими параметрами"""
+    path = out / "manifest.json"
+    manifest: Optional[Dict[str, Any]] = None
+    if path.exists():
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    if not manifest or [manifest.get(name) for name in ("version", "seed", "scale")] != [VERSION, seed, scale]:
+        return generate(out, seed, scale)
+    return manifest["documents"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетический корпус документов для замеров")
+    parser.add_argument("--out", type=Path, default=Path("bench_corpus"), help="Директория корпуса")
+    parser.add_argument("--seed", type=int, default=0, help="Начальное значение генератора")
+    parser.add_argument("--scale", type=float, default=1.0, help="Множитель числа страниц")
+    args = parser.parse_args()
+
+    for entry in generate(args.out, args.seed, args.scale):
+        pages = f"{entry['pages']:>5} стр." if entry["pages"] else " " * 10
+        print(f"{entry['name']:18} {entry['kind']:10} {pages} {entry['size'] / 1e6:8.2f} МБ  -> {entry['status']}")
+
+
+if __name__ == "__main__":
+    main()
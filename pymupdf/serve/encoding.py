@@ -0,0 +1,109 @@
+"""
+Согласование формата ответа по заголовку Accept: JSON, MessagePack, CBOR
+
+Схема ответа одинакова во всех форматах. Бинарные форматы предназначены для
+внутреннего обмена между сервисами: меньше байт и быстрее (де)сериализация.
+Записи страниц (records.py) превращаются в словари по одной во время кодирования.
+"""
+import importlib.util
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from records import to_serializable
+
+MEDIA_JSON = "application/json"
+MEDIA_MSGPACK = "application/msgpack"
+MEDIA_CBOR = "application/cbor"
+
+# Синонимы типов, встречающиеся у клиентов
+_ALIASES = {
+    "application/x-msgpack": MEDIA_MSGPACK,
+    "application/vnd.msgpack": MEDIA_MSGPACK,
+}
+
+
+def _encode_msgpack(payload: Any) -> bytes:
+    import msgpack
+    return msgpack.packb(payload, use_bin_type=True, default=to_serializable)
+
+
+def _encode_cbor(payload: Any) -> bytes:
+    import cbor2
+    return cbor2.dumps(payload, default=lambda encoder, value: encoder.encode(to_serializable(value)))
+
+
+def _available_encoders() -> Dict[str, Callable[[Any], bytes]]:
+    # Наличие пакета проверяется без импорта: модули загружаются при первом ответе
+    encoders = {}
+    for media_type, module, encoder in (
+        (MEDIA_MSGPACK, "msgpack", _encode_msgpack),
+        (MEDIA_CBOR, "cbor2", _encode_cbor),
+    ):
+        if importlib.util.find_spec(module) is not None:
+            encoders[media_type] = encoder
+    return encoders
+
+
+_encoders: Optional[Dict[str, Callable[[Any], bytes]]] = None
+
+
+def encoders() -> Dict[str, Callable[[Any], bytes]]:
+    """Бинарные кодировщики, для которых установлены библиотеки"""
+    global _encoders
+    if _encoders is None:
+        _encoders = _available_encoders()
+    return _encoders
+
+
+def _parse_accept(accept: str) -> List[Tuple[str, float]]:
+    items = []
+    for part in accept.split(","):
+        fields = part.strip().split(";")
+        media_type = fields[0].strip().lower()
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        items.append((_ALIASES.get(media_type, media_type), quality))
+    return items
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Выбор формата ответа по заголовку Accept
+
+    При отсутствии заголовка, */* или неподдерживаемых типах - JSON.
+    """
+    if not accept:
+        return MEDIA_JSON
+    supported = {MEDIA_JSON, *encoders()}
+    best, best_quality = MEDIA_JSON, 0.0
+    for media_type, quality in _parse_accept(accept):
+        if media_type in supported and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+
+def _encode_json(payload: Any) -> bytes:
+    # Те же параметры, что у JSONResponse, и записи страниц без промежуточного дерева словарей
+    return json.dumps(
+        payload, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=to_serializable
+    ).encode("utf-8")
+
+
+def render(request: Request, payload: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Ответ в формате, запрошенном клиентом"""
+    media_type = negotiate(request.headers.get("accept"))
+    encode = _encode_json if media_type == MEDIA_JSON else encoders()[media_type]
+    response = Response(encode(payload), status_code=status_code, headers=headers, media_type=media_type)
+    response.headers["Vary"] = "Accept"
+    return response
@@ -0,0 +1,247 @@
+"""
+Извлечение данных из документов с помощью PyMuPDF
+
+Документ открывается через preflight.open_document: кроме PDF это XPS, EPUB,
+CBZ, FB2, MOBI, SVG и изображения. Встроенные изображения (xref) есть только у
+PDF, для остальных форматов списки изображений пустые.
+
+Функции выполняются в рабочих процессах (workers.py) и между страницами
+вызывают check() - так обработку можно прервать при отключении клиента или
+превышении бюджета процессорного времени. Дополнительные параметры задачи
+(например, fingerprint) передаются именованными аргументами. Страницы и
+изображения в результатах - компактные записи со слотами (records.py).
+"""
+import hashlib
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import fitz  # PyMuPDF (импортируется как fitz)
+
+from chunking import chunk_document
+from fingerprint import document_signature, page_signature
+from preflight import open_document
+from records import DocumentPage, ImageInfo, TextPage
+from tables import TableStats, page_tables
+
+
+class Cancelled(Exception):
+    """Обработка прервана между страницами"""
+
+
+def _metadata(doc: fitz.Document) -> Dict[str, Any]:
+    metadata = doc.metadata
+    return {
+        "title": metadata.get("title", ""),
+        "author": metadata.get("author", ""),
+        "subject": metadata.get("subject", ""),
+        "creator": metadata.get("creator", ""),
+        "producer": metadata.get("producer", ""),
+        "creation_date": metadata.get("creationDate", ""),
+        "modification_date": metadata.get("modDate", ""),
+        "format": metadata.get("format", ""),
+        "encryption": metadata.get("encryption", "")
+    }
+
+
+def _images_info(doc: fitz.Document, page: fitz.Page, page_num: Optional[int] = None) -> Iterator[ImageInfo]:
+    for img_index, img in enumerate(page.get_images()):
+        xref = img[0]
+        base_image = doc.extract_image(xref)
+        yield ImageInfo(
+            page_num,
+            img_index,
+            xref,
+            base_image["width"],
+            base_image["height"],
+            base_image["colorspace"],
+            base_image["bpc"],
+            len(base_image["image"]),
+        )
+
+
+def _fingerprint(texts: List[str]) -> Dict[str, Any]:
+    pages = [page_signature(text) for text in texts]
+    return {"document": document_signature(pages), "pages": pages}
+
+
+def extract_text(
+    content: bytes,
+    filename: str,
+    check: Callable[[], None],
+    fingerprint: bool = False,
+    tables: bool = False,
+) -> Dict[str, Any]:
+    """Извлечение текста по страницам (fingerprint - с MinHash подписями страниц, tables - с таблицами)"""
+    with open_document(content) as doc:
+        result = {
+            "filename": filename,
+            "pages": len(doc),
+            "text": []
+        }
+        stats = TableStats()
+        for page_num, page in enumerate(doc, 1):
+            check()
+            result["text"].append(TextPage(
+                page_num,
+                page.get_text(),
+                page_tables(page, stats) if tables else None,
+            ))
+        if tables:
+            result["tables_stats"] = stats.to_dict()
+        if fingerprint:
+            result["fingerprint"] = _fingerprint([item.content for item in result["text"]])
+        return result
+
+
+def extract_fingerprint(content: bytes, filename: str, check: Callable[[], None]) -> Dict[str, Any]:
+    """MinHash подписи документа и страниц без возврата текста"""
+    with open_document(content) as doc:
+        texts = []
+        for page in doc:
+            check()
+            texts.append(page.get_text())
+        return {
+            "filename": filename,
+            "pages": len(doc),
+            "fingerprint": _fingerprint(texts)
+        }
+
+
+def extract_tables(content: bytes, filename: str, check: Callable[[], None]) -> Dict[str, Any]:
+    """Извлечение таблиц со страниц, на которых достаточно линий разметки"""
+    with open_document(content) as doc:
+        stats = TableStats()
+        found = []
+        for page_num, page in enumerate(doc, 1):
+            check()
+            for table in page_tables(page, stats):
+                found.append({"page": page_num, **table})
+        return {
+            "filename": filename,
+            "pages": len(doc),
+            "tables": found,
+            "tables_stats": stats.to_dict()
+        }
+
+
+def extract_metadata(content: bytes, filename: str, check: Callable[[], None]) -> Dict[str, Any]:
+    """Извлечение метаданных"""
+    with open_document(content) as doc:
+        return {
+            "filename": filename,
+            "pages": len(doc),
+            "metadata": _metadata(doc)
+        }
+
+
+def extract_images(content: bytes, filename: str, check: Callable[[], None]) -> Dict[str, Any]:
+    """Извлечение информации об изображениях"""
+    with open_document(content) as doc:
+        result = {
+            "filename": filename,
+            "pages": len(doc),
+            "images": []
+        }
+        for page_num, page in enumerate(doc, 1):
+            check()
+            result["images"].extend(_images_info(doc, page, page_num))
+        return result
+
+
+def extract_all(
+    content: bytes,
+    filename: str,
+    check: Callable[[], None],
+    fingerprint: bool = False,
+    tables: bool = False,
+) -> Dict[str, Any]:
+    """
+    Извлечение текста, метаданных и информации об изображениях
+    (fingerprint - с MinHash подписями страниц, tables - с таблицами)
+    """
+    with open_document(content) as doc:
+        pages_data = []
+        stats = TableStats()
+        for page_num, page in enumerate(doc, 1):
+            check()
+            pages_data.append(DocumentPage(
+                page_num,
+                page.get_text(),
+                list(_images_info(doc, page)),
+                page_tables(page, stats) if tables else None,
+            ))
+        result = {
+            "filename": filename,
+            "pages": len(doc),
+            "metadata": _metadata(doc),
+            "pages_data": pages_data
+        }
+        if tables:
+            result["tables_stats"] = stats.to_dict()
+        if fingerprint:
+            result["fingerprint"] = _fingerprint([item.text for item in pages_data])
+        return result
+
+
+def export_images(content: bytes, filename: str, check: Callable[[], None]) -> Iterator[Dict[str, Any]]:
+    """
+    Байты встроенных изображений без перекодирования (генератор)
+
+    Изображение с тем же xref или тем же содержимым (SHA-256) отдается один раз;
+    повторы отмечаются в манифесте. Элементы: {"type": "image", "name", "data", ...}
+    и последний {"type": "manifest", "images": [...], "duplicates": N}.
+    """
+    with open_document(content) as doc:
+        by_xref: Dict[int, Dict[str, Any]] = {}
+        by_hash: Dict[str, Dict[str, Any]] = {}
+        manifest: List[Dict[str, Any]] = []
+        duplicates = 0
+        for page_num, page in enumerate(doc, 1):
+            check()
+            for img in page.get_images():
+                xref = img[0]
+                entry = by_xref.get(xref)
+                if entry is not None:
+                    if page_num not in entry["pages"]:
+                        entry["pages"].append(page_num)
+                    continue
+                # extract_image возвращает исходный поток (JPEG, JPX, ...) без перекодирования,
+                # если формат поддерживается; иначе - PNG
+                base_image = doc.extract_image(xref)
+                if not base_image:
+                    continue
+                data = base_image["image"]
+                digest = hashlib.sha256(data).hexdigest()
+                original = by_hash.get(digest)
+                if original is not None:
+                    duplicates += 1
+                    entry = {"xref": xref, "pages": [page_num], "duplicate_of": original["name"]}
+                    by_xref[xref] = entry
+                    manifest.append(entry)
+                    continue
+                entry = {
+                    "name": f"p{page_num:04d}-x{xref}.{base_image['ext']}",
+                    "xref": xref,
+                    "pages": [page_num],
+                    "ext": base_image["ext"],
+                    "width": base_image["width"],
+                    "height": base_image["height"],
+                    "size": len(data),
+                    "sha256": digest,
+                }
+                by_xref[xref] = by_hash[digest] = entry
+                manifest.append(entry)
+                yield {"type": "image", "name": entry["name"], "data": data}
+        yield {"type": "manifest", "filename": filename, "pages": len(doc), "images": manifest, "duplicates": duplicates}
+
+
+TASKS = {
+    "text": extract_text,
+    "metadata": extract_metadata,
+    "images": extract_images,
+    "all": extract_all,
+    "fingerprint": extract_fingerprint,
+    "tables": extract_tables,
+    # Потоковая задача (генератор): WorkerPool.stream
+    "chunk": chunk_document,
+    "export_images": export_images,
+}
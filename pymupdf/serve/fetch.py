@@ -0,0 +1,79 @@
+"""
+Загрузка документа по ссылке (режим ссылок вместо загрузки файла)
+
+Клиент передает в поле url подписанную ссылку на объект в S3/MinIO или
+другой HTTP адрес, и сервис скачивает документ сам - байты не проходят через
+клиента. Разрешены только узлы из FETCH_ALLOWED_HOSTS (по умолчанию режим
+выключен): иначе сервис можно использовать для запросов во внутреннюю сеть.
+Перенаправления не выполняются, размер ограничен FETCH_MAX_BYTES.
+"""
+import os
+from pathlib import PurePosixPath
+from typing import Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("FETCH_ALLOWED_HOSTS", "").split(",") if host.strip()}
+MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(200 << 20)))
+TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "60"))
+
+
+class FetchError(Exception):
+    """Документ не удалось получить по ссылке"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def filename_from_url(url: str) -> str:
+    """Имя файла - последний сегмент пути ссылки (без параметров подписи)"""
+    return PurePosixPath(unquote(urlparse(url).path)).name or "document"
+
+
+def check_url(url: str, allowed_hosts: Optional[set] = None):
+    """
+    Raises:
+        FetchError: 403 - режим выключен или узел не разрешен, 400 - не http(s)
+    """
+    allowed_hosts = ALLOWED_HOSTS if allowed_hosts is None else allowed_hosts
+    if not allowed_hosts:
+        raise FetchError(403, "Загрузка по ссылке отключена: не задан FETCH_ALLOWED_HOSTS")
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise FetchError(400, "Ссылка должна быть http(s) адресом")
+    if "*" not in allowed_hosts and parsed.hostname.lower() not in allowed_hosts:
+        raise FetchError(403, f"Узел не разрешен для загрузки: {parsed.hostname}")
+
+
+async def fetch(url: str, max_bytes: int = MAX_BYTES, timeout: float = TIMEOUT) -> Tuple[str, bytes]:
+    """
+    Скачивание документа по ссылке
+
+    Returns:
+        Имя файла и содержимое
+
+    Raises:
+        FetchError: узел не разрешен, ошибка загрузки (502), слишком большой файл (413)
+    """
+    import httpx
+
+    check_url(url)
+    chunks = []
+    size = 0
+    try:
+        async with httpx.AsyncClient(timeout=timeout, follow_redirects=False) as client:
+            async with client.stream("GET", url) as response:
+                if response.status_code != 200:
+                    raise FetchError(502, f"Не удалось загрузить документ: HTTP {response.status_code}")
+                length = response.headers.get("content-length")
+                if length and int(length) > max_bytes:
+                    raise FetchError(413, f"Документ больше {max_bytes} байт")
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise FetchError(413, f"Документ больше {max_bytes} байт")
+                    chunks.append(chunk)
+    except httpx.HTTPError as e:
+        raise FetchError(502, f"Не удалось загрузить документ: {str(e)}")
+    return filename_from_url(url), b"".join(chunks)
@@ -0,0 +1,223 @@
+"""
+Отпечатки документов (MinHash по шинглам текста) и поиск почти-дубликатов
+
+Подписи страниц вычисляются в рабочих процессах во время извлечения текста.
+Подпись документа - поэлементный минимум подписей страниц (MinHash объединения
+шинглов). Индекс в SQLite находит кандидатов через LSH (полосы подписи) и
+оценивает сходство по доле совпадающих значений подписи. Кандидаты на
+подпись выбираются одним запросом, по числу совпавших полос; число кандидатов
+и совпадений на документ и страницу ограничено (FINGERPRINT_MAX_MATCHES), так
+что типовые страницы (пустые, общая обложка) не раздувают ответ.
+"""
+import os
+import random
+import re
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+
+_PRIME = (1 << 61) - 1
+_MASK = 0xFFFFFFFF
+_rng = random.Random(20240601)  # фиксированное зерно: подписи сравнимы между запусками
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Хэши последовательностей из size слов"""
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+def minhash(hashes: set) -> Optional[List[int]]:
+    """MinHash подпись множества хэшей (None для пустого множества)"""
+    if not hashes:
+        return None
+    return [min(((a * h + b) % _PRIME) & _MASK for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def page_signature(text: str) -> Optional[List[int]]:
+    return minhash(shingles(text))
+
+
+def document_signature(pages: Sequence[Optional[List[int]]]) -> Optional[List[int]]:
+    signatures = [signature for signature in pages if signature]
+    if not signatures:
+        return None
+    return [min(values) for values in zip(*signatures)]
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Оценка коэффициента Жаккара по подписям"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def _bands(signature: Sequence[int]) -> List[int]:
+    return [
+        zlib.crc32(b"".join(value.to_bytes(4, "little") for value in signature[i * ROWS:(i + 1) * ROWS]))
+        for i in range(BANDS)
+    ]
+
+
+# Строки bands с совпадающей полосой: по запросу по индексу на каждую полосу
+_HITS = " UNION ALL ".join(["SELECT document_id, page FROM bands WHERE kind = ? AND band = ? AND value = ?"] * BANDS)
+# Кандидаты, отсортированные по числу совпавших полос
+_CANDIDATES = {
+    "document": (
+        f"WITH hits AS ({_HITS}) SELECT h.page, d.digest, d.filename, d.signature FROM hits h "
+        "JOIN documents d ON d.id = h.document_id WHERE d.digest != ? "
+        "GROUP BY h.document_id ORDER BY COUNT(*) DESC LIMIT ?"
+    ),
+    "page": (
+        f"WITH hits AS ({_HITS}) SELECT h.page, d.digest, d.filename, p.signature FROM hits h "
+        "JOIN documents d ON d.id = h.document_id "
+        "JOIN pages p ON p.document_id = h.document_id AND p.page = h.page WHERE d.digest != ? "
+        "GROUP BY h.document_id, h.page ORDER BY COUNT(*) DESC LIMIT ?"
+    ),
+}
+
+
+def _pack(signature: Sequence[int]) -> bytes:
+    return b"".join(value.to_bytes(4, "little") for value in signature)
+
+
+def _unpack(blob: bytes) -> List[int]:
+    return [int.from_bytes(blob[i:i + 4], "little") for i in range(0, len(blob), 4)]
+
+
+class FingerprintIndex:
+    """
+    Индекс отпечатков документов и страниц в SQLite
+
+    Args:
+        path: Файл базы (":memory:" - индекс в памяти процесса)
+        threshold: Минимальное сходство для почти-дубликата
+        max_matches: Максимум совпадений на документ и на каждую страницу
+    """
+
+    # Кандидатов на подпись: с запасом на отсеянные по порогу сходства
+    CANDIDATES_PER_MATCH = 4
+
+    def __init__(self, path: str = ":memory:", threshold: float = 0.8, max_matches: int = 20):
+        self.path = path
+        self.threshold = threshold
+        self.max_matches = max_matches
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            # Общий файл для нескольких процессов сервиса
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                digest TEXT UNIQUE,
+                filename TEXT,
+                pages INTEGER,
+                signature BLOB
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                document_id INTEGER,
+                page INTEGER,
+                signature BLOB,
+                PRIMARY KEY (document_id, page)
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                kind TEXT,
+                band INTEGER,
+                value INTEGER,
+                document_id INTEGER,
+                page INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS bands_lookup ON bands (kind, band, value);
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> "FingerprintIndex":
+        """Настройки из переменных окружения FINGERPRINT_*"""
+        return cls(
+            path=os.getenv("FINGERPRINT_DB", ":memory:"),
+            threshold=float(os.getenv("FINGERPRINT_THRESHOLD", "0.8")),
+            max_matches=int(os.getenv("FINGERPRINT_MAX_MATCHES", "20")),
+        )
+
+    def _matches(self, kind: str, digest: str, signature: Sequence[int]) -> List[Dict[str, Any]]:
+        params: List[Any] = []
+        for band, value in enumerate(_bands(signature)):
+            params.extend((kind, band, value))
+        params.extend((digest, self.max_matches * self.CANDIDATES_PER_MATCH))
+        matches = []
+        for page, match_digest, filename, blob in self._conn.execute(_CANDIDATES[kind], params):
+            score = similarity(signature, _unpack(blob))
+            if score >= self.threshold:
+                match = {"digest": match_digest, "filename": filename}
+                if kind == "page":
+                    match["page"] = page
+                match["similarity"] = score
+                matches.append(match)
+        matches.sort(key=lambda m: -m["similarity"])
+        return matches[:self.max_matches]
+
+    def query(self, digest: str, fingerprint: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Почти-дубликаты документа и его страниц среди проиндексированных
+
+        known - точно такой же файл уже есть в индексе.
+
+        Args:
+            digest: SHA-256 файла (сам документ исключается из результатов)
+            fingerprint: {"document": подпись, "pages": [подпись или None, ...]}
+        """
+        with self._lock:
+            known = self._conn.execute("SELECT 1 FROM documents WHERE digest = ?", (digest,)).fetchone() is not None
+            documents = []
+            if fingerprint["document"]:
+                documents = self._matches("document", digest, fingerprint["document"])
+            pages = []
+            for page_num, signature in enumerate(fingerprint["pages"], 1):
+                if not signature:
+                    continue
+                matches = self._matches("page", digest, signature)
+                if matches:
+                    pages.append({"page": page_num, "matches": matches})
+        return {"known": known, "documents": documents, "pages": pages}
+
+    def add(self, digest: str, filename: str, fingerprint: Dict[str, Any]):
+        """Добавление документа в индекс (повторное добавление игнорируется)"""
+        if not fingerprint["document"]:
+            return
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO documents (digest, filename, pages, signature) VALUES (?, ?, ?, ?)",
+                (digest, filename, len(fingerprint["pages"]), _pack(fingerprint["document"])),
+            )
+            if not cursor.rowcount:
+                return
+            document_id = cursor.lastrowid
+            band_rows = [("document", band, value, document_id, 0)
+                         for band, value in enumerate(_bands(fingerprint["document"]))]
+            page_rows = []
+            for page_num, signature in enumerate(fingerprint["pages"], 1):
+                if not signature:
+                    continue
+                page_rows.append((document_id, page_num, _pack(signature)))
+                band_rows.extend(("page", band, value, document_id, page_num)
+                                 for band, value in enumerate(_bands(signature)))
+            self._conn.executemany("INSERT INTO pages VALUES (?, ?, ?)", page_rows)
+            self._conn.executemany("INSERT INTO bands VALUES (?, ?, ?, ?, ?)", band_rows)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            pages = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return {"documents": documents, "pages": pages}
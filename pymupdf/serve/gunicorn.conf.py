@@ -0,0 +1,33 @@
+"""
+Конфигурация gunicorn: несколько процессов сервиса (uvicorn workers) в одном контейнере
+
+Число процессов - WEB_CONCURRENCY (по умолчанию: число CPU). Пул рабочих
+процессов разбора и лимиты допуска в каждом процессе делят CPU поровну.
+"""
+import glob
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Запрос может обрабатываться до REQUEST_TIMEOUT секунд
+timeout = int(float(os.getenv("REQUEST_TIMEOUT", "120"))) + 30
+graceful_timeout = 30
+keepalive = 5
+
+# Перезапуск процессов сервиса для ограничения утечек памяти (0 - без перезапуска)
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# Значение по умолчанию в процессах сервиса, если переменная не задана
+os.environ.setdefault("WEB_CONCURRENCY", str(workers))
+
+
+def on_starting(server):
+    """Очистка снимков метрик предыдущего запуска"""
+    directory = os.getenv("METRICS_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            os.remove(path)
@@ -0,0 +1,122 @@
+"""
+Передача больших данных между сервисом и рабочими процессами через разделяемую память
+
+Через pipe данные копируются несколько раз (pickle, запись и чтение блоками по
+64 КБ, unpickle), а поток сервиса занят на все время передачи. Загрузки и
+результаты от min_size байт кладутся в сегмент разделяемой памяти
+(multiprocessing.shared_memory), а по pipe передается только ссылка на него.
+
+Жизненный цикл сегментов:
+- загрузку создает процесс сервиса и удаляет после завершения задачи;
+- результат создает рабочий процесс, процесс сервиса читает и удаляет его;
+- рабочий процесс разбирает загрузку прямо из сегмента (view, без копии),
+  процесс сервиса распаковывает результат тоже прямо из сегмента (load);
+  memoryview освобождается до закрытия сегмента, иначе close() - BufferError;
+- сегменты рабочего процесса, которые никто не прочитал (процесс убит по
+  таймауту или при отключении клиента), удаляются при его замене
+  (cleanup по префиксу с pid процесса).
+"""
+import glob
+import os
+import pickle
+import uuid
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Any, Iterator
+
+_PREFIX = "pymupdf-shm-"
+_SHM_DIR = "/dev/shm"
+
+
+class SharedBuffer:
+    """Ссылка на сегмент разделяемой памяти с данными"""
+
+    __slots__ = ("name", "size")
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+    def __reduce__(self):
+        return SharedBuffer, (self.name, self.size)
+
+
+def fits(size: int) -> bool:
+    """
+    Хватит ли места в /dev/shm для сегмента
+
+    Запись в сегмент сверх свободного места завершает процесс по SIGBUS, поэтому
+    при нехватке (в Docker /dev/shm по умолчанию 64 МБ) данные идут через pipe.
+    """
+    try:
+        stat = os.statvfs(_SHM_DIR)
+    except OSError:
+        return False
+    return size < stat.f_bavail * stat.f_frsize
+
+
+def put(data: bytes) -> SharedBuffer:
+    """Копирование данных в новый сегмент (имя содержит pid процесса-владельца)"""
+    segment = shared_memory.SharedMemory(
+        name=f"{_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:16]}", create=True, size=max(len(data), 1)
+    )
+    try:
+        segment.buf[:len(data)] = data
+    finally:
+        segment.close()
+    return SharedBuffer(segment.name, len(data))
+
+
+@contextmanager
+def view(ref: SharedBuffer) -> Iterator[memoryview]:
+    """
+    Данные сегмента без копирования (сегмент остается у владельца)
+
+    memoryview действителен только внутри блока with: объекты, ссылающиеся на
+    него (документ PyMuPDF), должны быть закрыты до выхода.
+    """
+    segment = shared_memory.SharedMemory(name=ref.name)
+    data = segment.buf[:ref.size]
+    try:
+        yield data
+    finally:
+        data.release()
+        segment.close()
+
+
+def load(ref: SharedBuffer) -> Any:
+    """Объект (pickle) из сегмента без промежуточной копии, с удалением сегмента"""
+    segment = shared_memory.SharedMemory(name=ref.name)
+    try:
+        data = segment.buf[:ref.size]
+        try:
+            return pickle.loads(data)
+        finally:
+            data.release()
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def release(ref: SharedBuffer):
+    """Удаление сегмента (повторное удаление игнорируется)"""
+    try:
+        segment = shared_memory.SharedMemory(name=ref.name)
+    except FileNotFoundError:
+        return
+    segment.close()
+    segment.unlink()
+
+
+def cleanup(pid: int) -> int:
+    """
+    Удаление сегментов, созданных процессом pid (после его завершения)
+
+    Returns:
+        Число удаленных сегментов
+    """
+    removed = 0
+    for path in glob.glob(os.path.join(_SHM_DIR, f"{_PREFIX}{pid}-*")):
+        release(SharedBuffer(os.path.basename(path), 0))
+        removed += 1
+    return removed
@@ -0,0 +1,131 @@
+"""
+Метрики сервиса в текстовом формате Prometheus
+
+Счетчики (counter) и суммы наблюдений (summary: _count и _sum) с метками.
+При запуске в несколько процессов (gunicorn) каждый процесс сохраняет свой
+снимок в METRICS_DIR, а /metrics суммирует снимки всех процессов, включая
+завершившиеся, - счетчики не сбрасываются при перезапуске процесса.
+"""
+import glob
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """Реестр метрик процесса"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelKey, Tuple[int, float]]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            count, total = series.get(key, (0, 0.0))
+            series[key] = (count + 1, total + value)
+
+    def snapshot(self) -> Tuple[dict, dict]:
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            summaries = {name: dict(series) for name, series in self._summaries.items()}
+        return counters, summaries
+
+    def flush(self):
+        """Сохранение снимка процесса в общую директорию"""
+        if not self.directory:
+            return
+        counters, summaries = self.snapshot()
+        data = {
+            "counters": {name: [[list(map(list, key)), value] for key, value in series.items()]
+                         for name, series in counters.items()},
+            "summaries": {name: [[list(map(list, key)), list(value)] for key, value in series.items()]
+                          for name, series in summaries.items()},
+        }
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _aggregate(self) -> Tuple[dict, dict]:
+        self.flush()
+        counters: Dict[str, Dict[LabelKey, float]] = {}
+        summaries: Dict[str, Dict[LabelKey, Tuple[int, float]]] = {}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, series in data["counters"].items():
+                target = counters.setdefault(name, {})
+                for key, value in series:
+                    key = tuple(map(tuple, key))
+                    target[key] = target.get(key, 0.0) + value
+            for name, series in data["summaries"].items():
+                target = summaries.setdefault(name, {})
+                for key, (count, total) in series:
+                    key = tuple(map(tuple, key))
+                    prev_count, prev_total = target.get(key, (0, 0.0))
+                    target[key] = (prev_count + count, prev_total + total)
+        return counters, summaries
+
+    def render(self) -> str:
+        counters, summaries = self._aggregate() if self.directory else self.snapshot()
+        return render_text(counters, summaries, self._help)
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+def render_text(counters: dict, summaries: dict, help_texts: Dict[str, str]) -> str:
+    """Текстовый формат Prometheus"""
+    lines = []
+    for name in sorted(counters):
+        if name in help_texts:
+            lines.append(f"# HELP {name} {help_texts[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in sorted(counters[name].items()):
+            lines.append(f"{name}{_labels(key)} {value:g}")
+    for name in sorted(summaries):
+        if name in help_texts:
+            lines.append(f"# HELP {name} {help_texts[name]}")
+        lines.append(f"# TYPE {name} summary")
+        for key, (count, total) in sorted(summaries[name].items()):
+            lines.append(f"{name}_count{_labels(key)} {count}")
+            lines.append(f"{name}_sum{_labels(key)} {total:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(os.getenv("METRICS_DIR") or None)
+metrics.describe("pymupdf_requests_total", "Запросы на извлечение по задаче и статусу")
+metrics.describe("pymupdf_extraction_seconds", "Время обработки запросов на извлечение")
+metrics.describe("pymupdf_compression_seconds", "Время сжатия ответов")
+metrics.describe("pymupdf_compression_input_bytes_total", "Объем ответов до сжатия")
+metrics.describe("pymupdf_compression_output_bytes_total", "Объем ответов после сжатия")
+metrics.describe("pymupdf_cache_requests_total", "Обращения к кэшу результатов по уровню и исходу")
+metrics.describe("pymupdf_cache_evictions_total", "Записи, удаленные из дискового кэша по возрасту и объему")
+metrics.describe("pymupdf_preflight_rejected_total", "Файлы, отклоненные предварительной проверкой, по коду причины")
+metrics.describe("pymupdf_admission_rejected_total", "Запросы, отклоненные контролем допуска, по статусу")
@@ -0,0 +1,194 @@
+"""
+Предварительная проверка загрузок до полного разбора
+
+Формат определяется по содержимому (sniff_format): кроме PDF принимаются
+форматы, которые MuPDF открывает сам - XPS, EPUB, CBZ, FB2, MOBI, SVG и
+изображения. Два этапа:
+1. check_bytes - в процессе сервиса, без PyMuPDF: формат, для PDF - маркер
+   %%EOF и startxref, указывающий на таблицу xref. Неподдерживаемые файлы
+   отклоняются сразу, не занимая рабочий процесс.
+2. open_document - в рабочем процессе при открытии документа: пароль
+   (needs_pass), восстановление поврежденного файла, лимит числа страниц.
+
+Политика восстановления (PREFLIGHT_REPAIR): 1 - поврежденные файлы передаются
+MuPDF, который пытается восстановить таблицу xref; 0 - отклоняются с кодом damaged.
+"""
+import io
+import os
+import re
+import zipfile
+from typing import List, Optional
+
+REPAIR = os.getenv("PREFLIGHT_REPAIR", "1") == "1"
+MAX_PAGES = int(os.getenv("PREFLIGHT_MAX_PAGES", "5000"))
+
+_HEAD_SIZE = 1024
+_TAIL_SIZE = 2048
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_OBJECT = re.compile(rb"\s*\d+\s+\d+\s+obj")
+
+
+_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+    (b"\x00\x00\x00\x0cjP  ", "jpx"),
+    (b"\xff\x4f\xff\x51", "jpx"),
+    (b"II\xbc", "jxr"),
+    (b"8BPS", "psd"),
+]
+_PNM = re.compile(rb"P[1-7]\s")
+_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".jpx", ".jp2", ".webp")
+
+
+def _sniff_zip(content: bytes) -> Optional[str]:
+    try:
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            names = archive.namelist()
+            if "mimetype" in names and archive.read("mimetype").strip() == b"application/epub+zip":
+                return "epub"
+            if "[Content_Types].xml" in names and any(name.lower().endswith(".fpage") for name in names):
+                return "xps"
+            files = [name for name in names if not name.endswith("/")]
+            if files and all(name.lower().endswith(_IMAGE_EXTENSIONS) for name in files):
+                return "cbz"
+    except zipfile.BadZipFile:
+        pass
+    return None
+
+
+def sniff_format(content: bytes) -> Optional[str]:
+    """
+    Формат по содержимому для fitz.open(filetype=...)
+
+    Returns:
+        pdf, xps, epub, cbz, fb2, mobi, svg, png, jpeg, ... или None - MuPDF не поддерживает
+    """
+    # bytes: в рабочем процессе content - memoryview сегмента разделяемой памяти
+    head = bytes(content[:_HEAD_SIZE])
+    if b"%PDF-" in head:
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        return _sniff_zip(content)
+    for signature, fmt in _SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    if content[60:68] == b"BOOKMOBI":
+        return "mobi"
+    if _PNM.match(head):
+        return "pnm"
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith(b"<?xml") or text.startswith(b"<"):
+        if b"<fictionbook" in text:
+            return "fb2"
+        if b"<svg" in text:
+            return "svg"
+    return None
+
+
+class PreflightError(Exception):
+    """
+    Файл отклонен предварительной проверкой
+
+    Args:
+        status_code: HTTP статус ответа
+        code: Машиночитаемый код причины (unsupported_format, empty_file, damaged, unreadable, encrypted,
+            no_pages, too_many_pages)
+        detail: Описание для человека
+    """
+
+    def __init__(self, status_code: int, code: str, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.code = code
+        self.detail = detail
+
+    def __reduce__(self):
+        # Передается из рабочего процесса через pipe
+        return PreflightError, (self.status_code, self.code, self.detail)
+
+
+def structure_problems(content: bytes) -> List[str]:
+    """Признаки повреждения структуры PDF по началу и концу файла"""
+    problems = []
+    header = content.find(b"%PDF-", 0, _HEAD_SIZE)
+    tail = content[-_TAIL_SIZE:]
+    if b"%%EOF" not in tail:
+        problems.append("нет маркера %%EOF (файл обрезан?)")
+    matches = _STARTXREF.findall(tail)
+    if not matches:
+        problems.append("нет startxref")
+    else:
+        # Смещения отсчитываются от заголовка %PDF- (перед ним может быть мусор)
+        offset = int(matches[-1]) + max(header, 0)
+        if offset >= len(content):
+            problems.append("startxref указывает за конец файла")
+        else:
+            segment = content[offset:offset + 32]
+            if not segment.lstrip().startswith(b"xref") and not _OBJECT.match(segment):
+                problems.append("startxref не указывает на таблицу xref")
+    return problems
+
+
+def check_bytes(content: bytes, repair: bool = REPAIR) -> str:
+    """
+    Быстрая проверка байтов загрузки без разбора
+
+    Returns:
+        Формат файла (см. sniff_format)
+
+    Raises:
+        PreflightError: empty_file, unsupported_format, damaged (PDF при запрете восстановления)
+    """
+    if not content:
+        raise PreflightError(422, "empty_file", "Пустой файл")
+    filetype = sniff_format(content)
+    if filetype is None:
+        raise PreflightError(
+            415, "unsupported_format", "Неподдерживаемый формат: ожидается PDF, XPS, EPUB, CBZ, FB2, MOBI, SVG или изображение"
+        )
+    if filetype == "pdf" and not repair:
+        problems = structure_problems(content)
+        if problems:
+            raise PreflightError(422, "damaged", f"Поврежденный PDF: {'; '.join(problems)}")
+    return filetype
+
+
+def open_document(content: bytes, repair: bool = REPAIR, max_pages: int = MAX_PAGES):
+    """
+    Открытие документа в рабочем процессе с проверками до обхода страниц
+
+    Формат определяется по содержимому; не-PDF форматы открываются тем же
+    движком MuPDF (для изображений - документ из одной страницы).
+
+    Raises:
+        PreflightError: unsupported_format, unreadable, damaged, encrypted, no_pages, too_many_pages
+    """
+    import fitz  # PyMuPDF (импортируется как fitz)
+
+    filetype = sniff_format(content)
+    if filetype is None:
+        raise PreflightError(415, "unsupported_format", "Неподдерживаемый формат")
+    try:
+        doc = fitz.open(stream=content, filetype=filetype)
+    except (fitz.FileDataError, RuntimeError) as e:
+        raise PreflightError(422, "unreadable", f"Не удалось открыть документ ({filetype}): {str(e)}")
+    try:
+        if doc.needs_pass:
+            raise PreflightError(422, "encrypted", "PDF защищен паролем")
+        if doc.is_repaired and not repair:
+            raise PreflightError(422, "damaged", "Поврежденный PDF: требуется восстановление таблицы xref")
+        if doc.page_count == 0:
+            raise PreflightError(422, "no_pages", "В документе нет страниц")
+        if max_pages and doc.page_count > max_pages:
+            raise PreflightError(
+                413, "too_many_pages", f"Слишком много страниц: {doc.page_count} (максимум {max_pages})"
+            )
+    except PreflightError:
+        doc.close()
+        raise
+    return doc
@@ -0,0 +1,107 @@
+"""
+Компактные записи результатов извлечения по страницам
+
+Вместо словаря на каждую страницу и каждое изображение используются классы со
+слотами: нет словаря атрибутов и повторяющихся ключей в каждом экземпляре, а
+при передаче из рабочего процесса запись упаковывается в кортеж значений.
+Словари создаются только при сериализации ответа (to_serializable - параметр
+default для json, msgpack, cbor2) и сразу освобождаются, поэтому дерево
+словарей всего документа в памяти не строится. Схема ответа не меняется:
+to_dict возвращает те же ключи в том же порядке, поля None пропускаются.
+
+Доступ по ключу (record["page"]) оставлен для кода, который работает и с
+записями, и со словарями из кэша на диске.
+"""
+from operator import attrgetter
+from typing import Any, Dict, List, Optional
+
+
+class Record:
+    """Базовый класс записи: поля - __slots__ подкласса"""
+
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Значения всех полей одним вызовом (кодирование ответа - горячий путь)
+        cls._values = staticmethod(attrgetter(*cls.__slots__))
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: value for name, value in zip(self.__slots__, self._values(self)) if value is not None}
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __reduce__(self):
+        return type(self), self._values(self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class ImageInfo(Record):
+    """Встроенное изображение; page задан только в плоском списке /extract_images"""
+
+    __slots__ = ("page", "index", "xref", "width", "height", "colorspace", "bpc", "size")
+
+    page: Optional[int]
+    index: int
+    xref: int
+    width: int
+    height: int
+    colorspace: int
+    bpc: int
+    size: int
+
+
+class TextPage(Record):
+    """Страница /extract_text"""
+
+    __slots__ = ("page", "content", "tables")
+
+    page: int
+    content: str
+    tables: Optional[List[Dict[str, Any]]]
+
+
+class DocumentPage(Record):
+    """Страница /extract_all"""
+
+    __slots__ = ("page", "text", "images", "tables")
+
+    page: int
+    text: str
+    images: List[ImageInfo]
+    tables: Optional[List[Dict[str, Any]]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "page": self.page,
+            "text": self.text,
+            "images_count": len(self.images),
+            "images": self.images,
+        }
+        if self.tables is not None:
+            result["tables"] = self.tables
+        return result
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "images_count":
+            return len(self.images)
+        return super().get(key, default)
+
+
+def to_serializable(value: Any) -> Any:
+    """Параметр default для json.dumps, msgpack.packb и cbor2.dumps"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
@@ -0,0 +1,164 @@
+"""
+Полнотекстовый индекс извлеченного текста (SQLite FTS5)
+
+Страницы документов добавляются в индекс при извлечении текста
+(/extract_text, /extract_all). Поиск возвращает документ, страницу и фрагмент
+текста с подсветкой, результаты упорядочены по BM25.
+
+Индексация ранее сохраненных результатов (JSON из test.py):
+    python search_index.py output/ --db search.db
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchQueryError(ValueError):
+    """Некорректное выражение запроса FTS5"""
+
+
+def result_pages(result: Dict[str, Any]) -> List[Tuple[int, str]]:
+    """Тексты страниц из результата /extract_text или /extract_all"""
+    if "text" in result:
+        return [(item["page"], item["content"]) for item in result["text"]]
+    if "pages_data" in result:
+        return [(item["page"], item["text"]) for item in result["pages_data"]]
+    return []
+
+
+def plain_query(text: str) -> str:
+    """Запрос из слов пользователя: все слова должны встретиться на странице"""
+    return " ".join(f'"{term}"' for term in _TERM.findall(text))
+
+
+class SearchIndex:
+    """
+    Индекс страниц в SQLite FTS5
+
+    Args:
+        path: Файл базы; общий для нескольких процессов сервиса (WAL)
+        snippet_tokens: Длина фрагмента текста в результатах, слов
+    """
+
+    def __init__(self, path: str, snippet_tokens: int = 12):
+        self.path = path
+        self.snippet_tokens = snippet_tokens
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                digest TEXT UNIQUE,
+                filename TEXT,
+                pages INTEGER
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5(
+                content,
+                document_id UNINDEXED,
+                page UNINDEXED,
+                tokenize = "unicode61 remove_diacritics 2"
+            );
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["SearchIndex"]:
+        """Индекс по пути SEARCH_DB (None - поиск отключен)"""
+        path = os.getenv("SEARCH_DB")
+        if not path:
+            return None
+        return cls(path, snippet_tokens=int(os.getenv("SEARCH_SNIPPET_TOKENS", "12")))
+
+    def add(self, digest: str, filename: str, pages: Iterable[Tuple[int, str]]) -> bool:
+        """Добавление страниц документа (повторное добавление того же файла игнорируется)"""
+        pages = list(pages)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO documents (digest, filename, pages) VALUES (?, ?, ?)",
+                (digest, filename, len(pages)),
+            )
+            if not cursor.rowcount:
+                return False
+            document_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO page_text (content, document_id, page) VALUES (?, ?, ?)",
+                [(text, document_id, page) for page, text in pages if text.strip()],
+            )
+        return True
+
+    def search(self, query: str, limit: int = 20, offset: int = 0, raw: bool = False) -> List[Dict[str, Any]]:
+        """
+        Поиск страниц
+
+        Args:
+            query: Слова для поиска или выражение FTS5 (raw)
+            limit: Максимум результатов
+            offset: Смещение (постраничная выдача)
+            raw: query - выражение FTS5 (AND, OR, NOT, "фраза", префикс*)
+
+        Raises:
+            SearchQueryError: Некорректное выражение FTS5
+        """
+        expression = query if raw else plain_query(query)
+        if not expression:
+            return []
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT d.digest, d.filename, p.page, "
+                    "snippet(page_text, 0, '<b>', '</b>', '…', ?), bm25(page_text) "
+                    "FROM page_text p JOIN documents d ON d.id = p.document_id "
+                    "WHERE page_text MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                    (self.snippet_tokens, expression, limit, offset),
+                ).fetchall()
+        except sqlite3.OperationalError as e:
+            raise SearchQueryError(str(e))
+        return [
+            {"digest": digest, "filename": filename, "page": page, "snippet": snippet, "score": -score}
+            for digest, filename, page, snippet, score in rows
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {"documents": documents}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Индексация сохраненных результатов извлечения текста")
+    parser.add_argument("directory", type=Path, help="Директория с JSON результатами (например, output/ после test.py)")
+    parser.add_argument("--db", default=os.getenv("SEARCH_DB", "search.db"), help="Файл индекса")
+    args = parser.parse_args()
+
+    from cache import content_key
+
+    index = SearchIndex(args.db)
+    added = 0
+    for path in sorted(args.directory.glob("*.json")):
+        try:
+            result = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        pages = result_pages(result)
+        if not pages:
+            continue
+        # Исходный файл недоступен - ключ по содержимому результата
+        digest = content_key(path.read_bytes())
+        if index.add(digest, result.get("filename", path.name), pages):
+            added += 1
+    print(f"Добавлено документов: {added}, всего в индексе: {index.stats()['documents']}")
+
+
+if __name__ == "__main__":
+    main()
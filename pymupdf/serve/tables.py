@@ -0,0 +1,108 @@
+"""
+Извлечение таблиц (page.find_tables) с быстрым пропуском страниц без таблиц
+
+find_tables анализирует векторную графику страницы и заметно дороже
+извлечения текста. Поэтому сначала по page.get_cdrawings() считаются
+горизонтальные и вертикальные отрезки (линии и границы прямоугольников):
+таблицы ищутся только на страницах, где линий достаточно для сетки.
+Таблицы без линий разметки при этом пропускаются.
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF (импортируется как fitz)
+
+# Минимум горизонтальных и вертикальных отрезков для поиска таблиц на странице
+MIN_HORIZONTAL = int(os.getenv("TABLES_MIN_HORIZONTAL", "3"))
+MIN_VERTICAL = int(os.getenv("TABLES_MIN_VERTICAL", "2"))
+# Отрезок короче (в пунктах) не учитывается
+MIN_SEGMENT = 10.0
+# Толщина прямоугольника, который считается линией
+LINE_THICKNESS = 2.0
+
+
+def _count_segments(page: fitz.Page) -> Tuple[int, int]:
+    horizontal = vertical = 0
+    for path in page.get_cdrawings():
+        for item in path["items"]:
+            kind = item[0]
+            if kind == "l":
+                (x0, y0), (x1, y1) = item[1], item[2]
+                if abs(y0 - y1) < 1 and abs(x0 - x1) >= MIN_SEGMENT:
+                    horizontal += 1
+                elif abs(x0 - x1) < 1 and abs(y0 - y1) >= MIN_SEGMENT:
+                    vertical += 1
+            elif kind == "re":
+                x0, y0, x1, y1 = item[1]
+                width, height = abs(x1 - x0), abs(y1 - y0)
+                if height <= LINE_THICKNESS and width >= MIN_SEGMENT:
+                    horizontal += 1
+                elif width <= LINE_THICKNESS and height >= MIN_SEGMENT:
+                    vertical += 1
+                elif width >= MIN_SEGMENT and height >= MIN_SEGMENT:
+                    # Ячейка с рамкой
+                    horizontal += 2
+                    vertical += 2
+        if horizontal >= MIN_HORIZONTAL and vertical >= MIN_VERTICAL:
+            break
+    return horizontal, vertical
+
+
+def may_have_tables(page: fitz.Page) -> bool:
+    """Достаточно ли на странице линий для таблицы"""
+    horizontal, vertical = _count_segments(page)
+    return horizontal >= MIN_HORIZONTAL and vertical >= MIN_VERTICAL
+
+
+def _table(table) -> Dict[str, Any]:
+    rows = table.extract()
+    header: Optional[List[str]] = None
+    if table.header is not None and not table.header.external:
+        header = table.header.names
+        rows = rows[1:]
+    return {
+        "bbox": [round(value, 1) for value in table.bbox],
+        "rows": len(rows),
+        "cols": table.col_count,
+        "header": header,
+        "cells": rows,
+    }
+
+
+class TableStats:
+    """Статистика поиска таблиц по документу"""
+
+    def __init__(self):
+        self.pages_scanned = 0
+        self.pages_skipped = 0
+        self.tables = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pages_scanned": self.pages_scanned,
+            "pages_skipped": self.pages_skipped,
+            "tables": self.tables,
+            "seconds": round(self.seconds, 4),
+        }
+
+
+def page_tables(page: fitz.Page, stats: TableStats) -> List[Dict[str, Any]]:
+    """
+    Таблицы страницы: {"bbox", "rows", "cols", "header", "cells": [[...], ...]}
+
+    Заголовок (header) - имена столбцов, если первая строка таблицы распознана
+    как заголовок; cells содержит строки данных без нее.
+    """
+    started = time.perf_counter()
+    try:
+        if not may_have_tables(page):
+            stats.pages_skipped += 1
+            return []
+        stats.pages_scanned += 1
+        tables = [_table(table) for table in page.find_tables().tables]
+        stats.tables += len(tables)
+        return tables
+    finally:
+        stats.seconds += time.perf_counter() - started
@@ -1,15 +1,48 @@
 """
 Примеры использования PyMuPDF REST API
+
+Входные файлы и результаты - в локальных папках input/ и output/ или в
+S3/MinIO (INPUT_LOCATION, OUTPUT_LOCATION, см. storage/readme.md).
 """
 import requests
-import json
+import os
+import sys
 from pathlib import Path
 from typing import Optional, Dict, Any
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "storage"))
+from storage import InputFiles, map_parallel, open_storage
+
 
 BASE_URL = "http://localhost:8000"
 INPUT_DIR = Path(__file__).parent / "input"
 OUTPUT_DIR = Path(__file__).parent / "output"
+# Расположение входных файлов и результатов: путь или s3://bucket/префикс
+INPUT_LOCATION = os.getenv("INPUT_LOCATION", str(INPUT_DIR))
+OUTPUT_LOCATION = os.getenv("OUTPUT_LOCATION", str(OUTPUT_DIR))
+# Формат результатов: json (компактный), json-pretty, json.gz, msgpack
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "json")
+# 1 - передавать сервису ссылку на файл в хранилище вместо содержимого
+BY_URL = os.getenv("BY_URL", "0") == "1"
+# Число одновременно обрабатываемых файлов
+JOBS = int(os.getenv("CLIENT_JOBS", "4"))
+
+# Формат ответа: application/json, application/msgpack или application/cbor
+ACCEPT = os.getenv("PYMUPDF_ACCEPT", "application/json")
+
+
+def decode_response(response: requests.Response) -> Dict[str, Any]:
+    """
+    Декодирование ответа по Content-Type (JSON, MessagePack, CBOR)
+    """
+    content_type = response.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == "application/msgpack":
+        import msgpack
+        return msgpack.unpackb(response.content, raw=False)
+    if content_type == "application/cbor":
+        import cbor2
+        return cbor2.loads(response.content)
+    return response.json()
 
 
 def check_health() -> bool:
@@ -27,7 +60,7 @@ def check_health() -> bool:
         return False
 
 
-def extract_text(file_path: Path) -> Dict[str, Any]:
+def extract_text(file_path: Path, accept: str = ACCEPT) -> Dict[str, Any]:
     """
     Извлечение текста из PDF
     """
@@ -38,14 +71,14 @@ def extract_text(file_path: Path) -> Dict[str, Any]:
     files = {"file": (file_path.name, open(file_path, "rb"), "application/pdf")}
     
     print(f"Извлечение текста из: {file_path.name}")
-    response = requests.post(url, files=files)
+    response = requests.post(url, files=files, headers={"Accept": accept})
     files["file"][1].close()
     
     response.raise_for_status()
-    return response.json()
+    return decode_response(response)
 
 
-def extract_metadata(file_path: Path) -> Dict[str, Any]:
+def extract_metadata(file_path: Path, accept: str = ACCEPT) -> Dict[str, Any]:
     """
     Извлечение метаданных из PDF
     """
@@ -56,14 +89,14 @@ def extract_metadata(file_path: Path) -> Dict[str, Any]:
     files = {"file": (file_path.name, open(file_path, "rb"), "application/pdf")}
     
     print(f"Извлечение метаданных из: {file_path.name}")
-    response = requests.post(url, files=files)
+    response = requests.post(url, files=files, headers={"Accept": accept})
     files["file"][1].close()
     
     response.raise_for_status()
-    return response.json()
+    return decode_response(response)
 
 
-def extract_images(file_path: Path) -> Dict[str, Any]:
+def extract_images(file_path: Path, accept: str = ACCEPT) -> Dict[str, Any]:
     """
     Извлечение информации об изображениях из PDF
     """
@@ -74,14 +107,14 @@ def extract_images(file_path: Path) -> Dict[str, Any]:
     files = {"file": (file_path.name, open(file_path, "rb"), "application/pdf")}
     
     print(f"Извлечение информации об изображениях из: {file_path.name}")
-    response = requests.post(url, files=files)
+    response = requests.post(url, files=files, headers={"Accept": accept})
     files["file"][1].close()
     
     response.raise_for_status()
-    return response.json()
+    return decode_response(response)
 
 
-def extract_all(file_path: Path) -> Dict[str, Any]:
+def extract_all(file_path: Path, accept: str = ACCEPT) -> Dict[str, Any]:
     """
     Извлечение всего содержимого из PDF
     """
@@ -92,23 +125,48 @@ def extract_all(file_path: Path) -> Dict[str, Any]:
     files = {"file": (file_path.name, open(file_path, "rb"), "application/pdf")}
     
     print(f"Извлечение всего содержимого из: {file_path.name}")
-    response = requests.post(url, files=files)
+    response = requests.post(url, files=files, headers={"Accept": accept})
     files["file"][1].close()
     
     response.raise_for_status()
-    return response.json()
+    return decode_response(response)
 
 
-def save_result(result: Dict[str, Any], output_file: Path):
+def extract_all_by_url(url: str, accept: str = ACCEPT) -> Dict[str, Any]:
     """
-    Сохранение результата в файл
+    Извлечение всего содержимого документа по ссылке (сервис скачивает файл сам)
     """
-    OUTPUT_DIR.mkdir(exist_ok=True)
-    
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
-    
-    print(f"Результат сохранен: {output_file}")
+    response = requests.post(f"{BASE_URL}/extract_all", data={"url": url}, headers={"Accept": accept})
+    response.raise_for_status()
+    return decode_response(response)
+
+
+def save_result(result: Dict[str, Any], name: str, storage=None):
+    """
+    Сохранение результата для входного файла name в хранилище результатов
+    """
+    storage = storage or open_storage(OUTPUT_LOCATION)
+    key = storage.save_result(name, result, OUTPUT_FORMAT)
+    print(f"Результат сохранен: {storage}/{key}")
+
+
+def print_summary(result: Dict[str, Any]):
+    """
+    Вывод краткой информации о результате
+    """
+    print(f"Страниц: {result.get('pages', 0)}")
+    if "metadata" in result:
+        metadata = result["metadata"]
+        if metadata.get("title"):
+            print(f"Название: {metadata['title']}")
+        if metadata.get("author"):
+            print(f"Автор: {metadata['author']}")
+
+    if "pages_data" in result:
+        total_text_length = sum(len(page.get("text", "")) for page in result["pages_data"])
+        total_images = sum(page.get("images_count", 0) for page in result["pages_data"])
+        print(f"Общий объем текста: {total_text_length} символов")
+        print(f"Всего изображений: {total_images}")
 
 
 def main():
@@ -125,47 +183,34 @@ def main():
     
     print()
     
-    # Поиск PDF файлов в папке input
-    input_files = list(INPUT_DIR.glob("*.pdf"))
-    
-    if not input_files:
-        print(f"PDF файлы не найдены в папке: {INPUT_DIR}")
-        print("Добавьте PDF файлы в папку input/")
+    input_storage = open_storage(INPUT_LOCATION)
+    output_storage = open_storage(OUTPUT_LOCATION)
+    keys = input_storage.list()
+
+    if not keys:
+        print(f"Файлы не найдены: {input_storage}")
+        print("Добавьте документы в папку input/")
         return
-    
-    # Обработка каждого файла
-    for file_path in input_files:
-        print(f"\n{'=' * 60}")
-        print(f"Обработка: {file_path.name}")
-        print(f"{'=' * 60}")
-        
+
+    def process(key: str, file_path: Optional[Path] = None):
         try:
-            # Извлечение всего содержимого
-            result = extract_all(file_path)
-            
-            # Сохранение результата
-            output_file = OUTPUT_DIR / f"{file_path.stem}_result.json"
-            save_result(result, output_file)
-            
-            # Вывод краткой информации
-            print(f"Страниц: {result.get('pages', 0)}")
-            if "metadata" in result:
-                metadata = result["metadata"]
-                if metadata.get("title"):
-                    print(f"Название: {metadata['title']}")
-                if metadata.get("author"):
-                    print(f"Автор: {metadata['author']}")
-            
-            if "pages_data" in result:
-                total_text_length = sum(len(page.get("text", "")) for page in result["pages_data"])
-                total_images = sum(page.get("images_count", 0) for page in result["pages_data"])
-                print(f"Общий объем текста: {total_text_length} символов")
-                print(f"Всего изображений: {total_images}")
-            
+            # Извлечение всего содержимого: по ссылке или загрузкой файла
+            url = input_storage.url(key) if BY_URL else None
+            result = extract_all_by_url(url) if url else extract_all(file_path)
+            save_result(result, key, output_storage)
+            print_summary(result)
         except Exception as e:
-            print(f"Ошибка при обработке {file_path.name}: {e}")
+            print(f"Ошибка при обработке {key}: {e}")
             import traceback
             traceback.print_exc()
+
+    print(f"Файлов: {len(keys)}, одновременно: {JOBS}, результаты: {output_storage} ({OUTPUT_FORMAT})")
+    if BY_URL and input_storage.url(keys[0]):
+        map_parallel(process, keys, JOBS)
+    else:
+        # Из S3 файлы загружаются параллельно во временную директорию
+        with InputFiles(input_storage, keys, JOBS) as paths:
+            map_parallel(lambda key: process(key, paths[key]), keys, JOBS)
     
     print(f"\n{'=' * 60}")
     print("Обработка завершена")
@@ -0,0 +1,433 @@
+"""
+Пул рабочих процессов для разбора PDF
+
+Разбор выполняется вне event loop в отдельных процессах. Для каждого запроса
+действует бюджет по времени (wall-clock) и процессорному времени; при
+отключении клиента обработка прерывается между страницами, а зависший в
+MuPDF процесс убивается и заменяется новым. Большие загрузки и результаты
+передаются через разделяемую память (handoff.py), по pipe - только ссылки.
+"""
+import asyncio
+import inspect
+import logging
+import multiprocessing
+import os
+import time
+from contextlib import aclosing
+from multiprocessing.reduction import ForkingPickler
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import handoff
+
+_log = logging.getLogger(__name__)
+
+# spawn: рабочие процессы не наследуют event loop и потоки сервера
+_mp = multiprocessing.get_context("spawn")
+
+
+class WorkerTimeout(Exception):
+    """Превышен бюджет времени запроса"""
+
+
+class WorkerCancelled(Exception):
+    """Обработка прервана (клиент отключился)"""
+
+
+class WorkerError(Exception):
+    """Ошибка разбора в рабочем процессе или его аварийное завершение"""
+
+
+def _send(conn, message: Tuple[str, Any], shm_min_size: int):
+    """Отправка сообщения; от shm_min_size байт - через разделяемую память"""
+    data = ForkingPickler.dumps(message)
+    if shm_min_size and len(data) >= shm_min_size and handoff.fits(len(data)):
+        conn.send(("shared", handoff.put(data)))
+    else:
+        conn.send_bytes(data)
+
+
+def _worker_main(conn, cancel_event, cpu_limit: float, shm_min_size: int):
+    """Цикл рабочего процесса: задача -> результат"""
+    # Загрузка PyMuPDF до сигнала готовности
+    import extraction
+
+    # PyMuPDF загружен - процесс готов принимать задачи
+    conn.send(("ready", None))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        task, content, filename, options = message
+        if isinstance(content, handoff.SharedBuffer):
+            # Разбор прямо из сегмента; сегмент загрузки удаляет процесс сервиса
+            with handoff.view(content) as data:
+                _run(conn, cancel_event, cpu_limit, shm_min_size, task, data, filename, options)
+        else:
+            _run(conn, cancel_event, cpu_limit, shm_min_size, task, content, filename, options)
+
+
+def _run(conn, cancel_event, cpu_limit: float, shm_min_size: int, task: str, content, filename: str, options):
+    """Выполнение задачи и отправка результата"""
+    from extraction import TASKS, Cancelled
+    from preflight import PreflightError
+
+    cancel_event.clear()
+    cpu_start = time.process_time()
+
+    def check():
+        if cancel_event.is_set():
+            raise Cancelled("cancelled")
+        if cpu_limit and time.process_time() - cpu_start > cpu_limit:
+            raise Cancelled("cpu_limit")
+
+    try:
+        result = TASKS[task](content, filename, check, **options)
+        if inspect.isgenerator(result):
+            # Потоковая задача: элементы отправляются по мере готовности
+            for item in result:
+                _send(conn, ("item", item), shm_min_size)
+            result = None
+        _send(conn, ("ok", result), shm_min_size)
+    except Cancelled as e:
+        conn.send((str(e), None))
+    except PreflightError as e:
+        conn.send(("rejected", e))
+    except Exception as e:
+        conn.send(("error", str(e)))
+
+
+class Worker:
+    """Рабочий процесс с каналом задач и флагом отмены"""
+
+    def __init__(self, cpu_limit: float, shm_min_size: int = 0):
+        self.conn, child_conn = _mp.Pipe()
+        self.cancel_event = _mp.Event()
+        self.process = _mp.Process(
+            target=_worker_main, args=(child_conn, self.cancel_event, cpu_limit, shm_min_size), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+        # Результаты, отправленные через разделяемую память, но не прочитанные
+        removed = handoff.cleanup(self.process.pid)
+        if removed:
+            _log.warning(f"Removed {removed} shared memory segments of worker {self.process.pid}")
+
+
+def default_processes() -> int:
+    """Число рабочих процессов по умолчанию: CPU поровну между процессами сервиса (WEB_CONCURRENCY)"""
+    web_workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, (os.cpu_count() or 1) // web_workers)
+
+
+class WorkerPool:
+    """
+    Пул рабочих процессов с бюджетом времени и отменой запросов
+
+    Args:
+        size: Число рабочих процессов
+        timeout: Максимальное время обработки запроса, секунд
+        cpu_limit: Максимальное процессорное время запроса, секунд (0 - без лимита)
+        cancel_grace: Время на прерывание между страницами до убийства процесса, секунд
+        max_tasks: Перезапуск процесса после указанного числа задач (0 - без перезапуска)
+        poll_interval: Период проверки отключения клиента, секунд
+        start_timeout: Время на загрузку рабочего процесса, секунд; не загрузившийся
+            процесс убивается и запускается снова с нарастающей паузой
+        shm_min_size: Загрузки и результаты от указанного размера в байтах передаются
+            через разделяемую память (0 - всегда через pipe)
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        timeout: float = 120.0,
+        cpu_limit: float = 60.0,
+        cancel_grace: float = 2.0,
+        max_tasks: int = 0,
+        poll_interval: float = 0.5,
+        start_timeout: float = 60.0,
+        shm_min_size: int = 1 << 20,
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.cpu_limit = cpu_limit
+        self.cancel_grace = cancel_grace
+        self.max_tasks = max_tasks
+        self.poll_interval = poll_interval
+        self.start_timeout = start_timeout
+        self.shm_min_size = shm_min_size
+        self.shared = 0
+        self.recycled = 0
+        self.ready = 0
+        self._idle: Optional[asyncio.Queue] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+
+    @classmethod
+    def from_env(cls) -> "WorkerPool":
+        """Настройки из переменных окружения WORKER_* и REQUEST_*"""
+        return cls(
+            size=int(os.getenv("WORKER_PROCESSES", str(default_processes()))),
+            timeout=float(os.getenv("REQUEST_TIMEOUT", "120")),
+            cpu_limit=float(os.getenv("REQUEST_CPU_LIMIT", "60")),
+            cancel_grace=float(os.getenv("CANCEL_GRACE", "2")),
+            max_tasks=int(os.getenv("WORKER_MAX_TASKS", "0")),
+            start_timeout=float(os.getenv("WORKER_START_TIMEOUT", "60")),
+            shm_min_size=int(os.getenv("WORKER_SHM_MIN_SIZE", str(1 << 20))),
+        )
+
+    async def start(self):
+        """
+        Запуск рабочих процессов в фоне
+
+        Не ждет загрузки PyMuPDF: сервис сразу отвечает на /health, а запросы
+        на разбор ждут первого готового процесса. Готовность пула - is_ready().
+        """
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._background(self._spawn())
+
+    def is_ready(self) -> bool:
+        """Загружен хотя бы один рабочий процесс (свободный или занятый)"""
+        return self._idle is not None and self.ready > 0
+
+    def _background(self, coro):
+        # Запуск и замена процессов в фоне: не задерживают ответ на запрос
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _spawn(self):
+        """Запуск рабочего процесса; при любой ошибке - повтор с паузой до успеха или закрытия пула"""
+        loop = asyncio.get_running_loop()
+        backoff = 1.0
+        while not self._closing:
+            worker = None
+            try:
+                worker = await loop.run_in_executor(None, Worker, self.cpu_limit, self.shm_min_size)
+                status = None
+                if await self._wait_readable(worker, self.start_timeout):
+                    try:
+                        status, _ = await loop.run_in_executor(None, worker.conn.recv)
+                    except (EOFError, OSError):
+                        pass
+                if status == "ready":
+                    self.ready += 1
+                    self._idle.put_nowait(worker)
+                    return
+                _log.error(f"Worker {worker.process.pid} failed to start, retry in {backoff:g} s")
+            except asyncio.CancelledError:
+                if worker is not None:
+                    worker.kill()
+                raise
+            except Exception:
+                # Не только OSError: ошибка pickle аргументов, исчерпание ресурсов и т.п.
+                _log.exception(f"Worker failed to start, retry in {backoff:g} s")
+            if worker is not None:
+                try:
+                    await loop.run_in_executor(None, worker.kill)
+                except Exception:
+                    _log.exception(f"Failed to kill worker {worker.process.pid}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    async def close(self):
+        self._closing = True
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        while self._idle is not None and not self._idle.empty():
+            self._idle.get_nowait().kill()
+            self.ready -= 1
+
+    async def _retire(self, worker: Worker):
+        loop = asyncio.get_running_loop()
+        self.ready -= 1
+        self.recycled += 1
+        try:
+            await loop.run_in_executor(None, worker.kill)
+        except Exception:
+            _log.exception(f"Failed to kill worker {worker.process.pid}")
+
+    async def _replace(self, worker: Worker):
+        """Замена неисправного процесса (таймаут, отмена, аварийное завершение)"""
+        try:
+            await self._retire(worker)
+        finally:
+            # Замена запускается, даже если остановка не удалась или прервана
+            if not self._closing:
+                self._background(self._spawn())
+
+    async def _recycle(self, worker: Worker):
+        """Плановый перезапуск (WORKER_MAX_TASKS): новый процесс запускается до остановки старого"""
+        try:
+            await self._spawn()
+        finally:
+            await self._retire(worker)
+
+    async def _wait_readable(self, worker: Worker, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = worker.conn.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(True))
+        try:
+            await asyncio.wait_for(ready, timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    async def _messages(
+        self,
+        task: str,
+        content: bytes,
+        filename: str,
+        timeout: Optional[float],
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]],
+        options: Optional[Dict[str, Any]],
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Сообщения рабочего процесса по задаче: ("item", ...) и завершающее"""
+        loop = asyncio.get_running_loop()
+        timeout = min(timeout or self.timeout, self.timeout)
+        deadline = loop.time() + timeout
+
+        try:
+            # Ожидание свободного процесса входит в бюджет времени запроса
+            worker = await asyncio.wait_for(self._idle.get(), timeout=max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            raise WorkerTimeout(f"Нет свободного рабочего процесса за {timeout:g} с")
+        healthy = False
+        upload = None
+        try:
+            if self.shm_min_size and len(content) >= self.shm_min_size and handoff.fits(len(content)):
+                upload = await loop.run_in_executor(None, handoff.put, content)
+                self.shared += 1
+            await loop.run_in_executor(
+                None, worker.conn.send, (task, upload if upload is not None else content, filename, options or {})
+            )
+
+            cancelled = False
+            while True:
+                while True:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        if cancelled:
+                            raise WorkerCancelled("Клиент отключился")
+                        raise WorkerTimeout(f"Превышено время обработки: {timeout:g} с")
+                    if await self._wait_readable(worker, min(self.poll_interval, remaining)):
+                        break
+                    if not cancelled and is_disconnected is not None and await is_disconnected():
+                        # Прерывание между страницами; если процесс завис внутри
+                        # MuPDF - он будет убит по истечении cancel_grace
+                        worker.cancel_event.set()
+                        cancelled = True
+                        deadline = min(deadline, loop.time() + self.cancel_grace)
+
+                try:
+                    status, payload = await loop.run_in_executor(None, worker.conn.recv)
+                except (EOFError, OSError):
+                    raise WorkerError("Рабочий процесс аварийно завершился")
+                if status == "shared":
+                    status, payload = await loop.run_in_executor(None, handoff.load, payload)
+                    self.shared += 1
+
+                if status == "item":
+                    # Если потребитель прекратит чтение, процесс не освободится: healthy = False
+                    yield status, payload
+                    continue
+                healthy = True
+                yield status, payload
+                return
+        finally:
+            if upload is not None:
+                handoff.release(upload)
+            worker.tasks += 1
+            if not healthy:
+                _log.warning(f"Recycling worker {worker.process.pid} after {task} {filename}")
+                await self._replace(worker)
+            elif self.max_tasks and worker.tasks >= self.max_tasks:
+                self._background(self._recycle(worker))
+            else:
+                self._idle.put_nowait(worker)
+
+    def _result(self, status: str, payload: Any) -> Any:
+        if status == "ok":
+            return payload
+        if status == "cancelled":
+            raise WorkerCancelled("Клиент отключился")
+        if status == "cpu_limit":
+            raise WorkerTimeout(f"Превышено процессорное время: {self.cpu_limit:g} с")
+        if status == "rejected":
+            # preflight.PreflightError: файл отклонен при открытии
+            raise payload
+        raise WorkerError(payload)
+
+    async def run(
+        self,
+        task: str,
+        content: bytes,
+        filename: str,
+        timeout: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """
+        Выполнение задачи разбора в свободном рабочем процессе
+
+        Args:
+            task: Имя задачи из extraction.TASKS
+            content: Содержимое файла
+            filename: Имя файла
+            timeout: Бюджет времени запроса (не больше настроенного в пуле)
+            is_disconnected: Проверка отключения клиента
+            options: Дополнительные параметры задачи
+
+        Raises:
+            WorkerTimeout, WorkerCancelled, WorkerError, preflight.PreflightError
+        """
+        async with aclosing(self._messages(task, content, filename, timeout, is_disconnected, options)) as messages:
+            async for status, payload in messages:
+                if status != "item":
+                    return self._result(status, payload)
+        raise WorkerError("Рабочий процесс не вернул результат")
+
+    async def stream(
+        self,
+        task: str,
+        content: bytes,
+        filename: str,
+        timeout: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[Any]:
+        """
+        Потоковое выполнение задачи-генератора: элементы отдаются по мере готовности
+
+        Бюджет времени действует на весь поток. Если потребитель прекращает
+        чтение, рабочий процесс заменяется новым.
+
+        Raises:
+            WorkerTimeout, WorkerCancelled, WorkerError, preflight.PreflightError
+        """
+        async with aclosing(self._messages(task, content, filename, timeout, is_disconnected, options)) as messages:
+            async for status, payload in messages:
+                if status == "item":
+                    yield payload
+                else:
+                    self._result(status, payload)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "ready": self.ready,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "recycled": self.recycled,
+            "shared_transfers": self.shared,
+        }
@@ -0,0 +1,313 @@
+"""
+Хранилища входных документов и результатов для клиентов сервисов
+
+Расположение задается строкой:
+- путь или file:///путь - локальная директория (LocalStorage);
+- s3://bucket/префикс - S3-совместимое хранилище (S3Storage), например MinIO
+  из docker-compose.yaml этой папки.
+
+Файлы больше S3_PART_SIZE передаются в S3 частями (multipart) в несколько
+потоков; несколько файлов - параллельно (download_many, upload_many).
+
+Режим ссылок: storage.url(key) возвращает подписанную ссылку на объект, и
+клиент передает сервису ссылку вместо содержимого файла - сервис скачивает
+документ сам, байты не проходят через клиента. У локального хранилища ссылок
+нет, файл отправляется как обычно.
+
+Результаты сохраняются компактно (encode_result): JSON без отступов,
+JSON + gzip или MessagePack.
+"""
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Форматы результатов: имя -> (расширение, Content-Type)
+OUTPUT_FORMATS = {
+    "json": (".json", "application/json"),
+    "json-pretty": (".json", "application/json"),
+    "json.gz": (".json.gz", "application/gzip"),
+    "msgpack": (".msgpack", "application/msgpack"),
+}
+
+
+def encode_result(result: Any, output_format: str = "json") -> bytes:
+    """
+    Сериализация результата
+
+    json - без отступов и пробелов (в 1.5-2 раза меньше json-pretty),
+    json.gz - то же со сжатием, msgpack - двоичный формат.
+    """
+    if output_format == "json-pretty":
+        return json.dumps(result, ensure_ascii=False, indent=2).encode("utf-8")
+    if output_format in ("json", "json.gz"):
+        data = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return gzip.compress(data, compresslevel=6) if output_format == "json.gz" else data
+    if output_format == "msgpack":
+        import msgpack
+        return msgpack.packb(result, use_bin_type=True)
+    raise ValueError(f"Неизвестный формат результата: {output_format}. Доступны: {', '.join(OUTPUT_FORMATS)}")
+
+
+def result_key(name: str, output_format: str = "json") -> str:
+    """
+    Ключ результата: ключ входного файла без расширения + расширение формата
+
+    Путь сохраняется (a/x.pdf -> a/x_result.json), чтобы файлы с одинаковыми
+    именами в разных директориях не перезаписывали результаты друг друга.
+    """
+    return f"{PurePosixPath(name).with_suffix('')}_result{OUTPUT_FORMATS[output_format][0]}"
+
+
+def map_parallel(function: Callable[[Any], Any], items: Iterable[Any], jobs: int) -> List[Any]:
+    """Параллельное выполнение function для элементов (порядок результатов сохраняется)"""
+    items = list(items)
+    if jobs <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(function, items))
+
+
+class Storage:
+    """Общий интерфейс хранилища; ключи - относительные пути через /"""
+
+    def list(self, suffixes: Optional[Tuple[str, ...]] = None) -> List[str]:
+        raise NotImplementedError
+
+    def read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def write(self, key: str, data: bytes, content_type: str = "application/octet-stream"):
+        raise NotImplementedError
+
+    def download(self, key: str, path: Path):
+        path.write_bytes(self.read(key))
+
+    def upload(self, path: Path, key: str, content_type: str = "application/octet-stream"):
+        self.write(key, path.read_bytes(), content_type)
+
+    def url(self, key: str) -> Optional[str]:
+        """Ссылка, по которой сервис может скачать объект сам (None - нет)"""
+        return None
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Путь к файлу, если объект уже на локальном диске"""
+        return None
+
+    def download_many(self, keys: Iterable[str], directory: Path, jobs: int = 8) -> List[Path]:
+        """Параллельная загрузка объектов в директорию"""
+        directory.mkdir(parents=True, exist_ok=True)
+
+        def fetch(key: str) -> Path:
+            path = directory / key
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.download(key, path)
+            return path
+
+        return map_parallel(fetch, keys, jobs)
+
+    def upload_many(self, files: Iterable[Tuple[Path, str]], jobs: int = 8):
+        """Параллельная выгрузка файлов: (путь, ключ)"""
+        map_parallel(lambda item: self.upload(*item), files, jobs)
+
+    def save_result(self, name: str, result: Any, output_format: str = "json") -> str:
+        """Сохранение результата для входного файла name; возвращает ключ"""
+        key = result_key(name, output_format)
+        self.write(key, encode_result(result, output_format), OUTPUT_FORMATS[output_format][1])
+        return key
+
+
+class LocalStorage(Storage):
+    """Локальная директория; запись атомарная (временный файл + os.replace)"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def __str__(self) -> str:
+        return str(self.root)
+
+    def list(self, suffixes: Optional[Tuple[str, ...]] = None) -> List[str]:
+        if not self.root.is_dir():
+            return []
+        keys = [
+            path.relative_to(self.root).as_posix()
+            for path in sorted(self.root.rglob("*"))
+            if path.is_file() and not path.name.startswith(".")
+        ]
+        if suffixes:
+            keys = [key for key in keys if key.lower().endswith(suffixes)]
+        return keys
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self.root / key
+
+    def read(self, key: str) -> bytes:
+        return (self.root / key).read_bytes()
+
+    def write(self, key: str, data: bytes, content_type: str = "application/octet-stream"):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def download(self, key: str, path: Path):
+        shutil.copyfile(self.root / key, path)
+
+    def upload(self, path: Path, key: str, content_type: str = "application/octet-stream"):
+        target = self.root / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, target)
+
+
+class S3Storage(Storage):
+    """
+    S3-совместимое хранилище (AWS S3, MinIO)
+
+    Args:
+        bucket: Имя бакета
+        prefix: Префикс ключей внутри бакета
+        endpoint_url: Адрес S3 API для клиента (None - AWS)
+        presign_endpoint_url: Адрес S3 API, доступный сервисам, для подписанных
+            ссылок (например, http://minio:9000 внутри сети docker)
+        part_size: Размер части multipart загрузки, байт
+        concurrency: Потоков на одну multipart загрузку
+        url_expires: Время жизни подписанной ссылки, секунд
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        presign_endpoint_url: Optional[str] = None,
+        part_size: int = 8 << 20,
+        concurrency: int = 8,
+        url_expires: int = 3600,
+    ):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.url_expires = url_expires
+        # Пул соединений на параллельные части и параллельные файлы
+        config = Config(max_pool_connections=max(10, concurrency * 4), s3={"addressing_style": "path"})
+        self._client = boto3.client("s3", endpoint_url=endpoint_url, config=config)
+        self._presign_client = (
+            boto3.client("s3", endpoint_url=presign_endpoint_url, config=config)
+            if presign_endpoint_url and presign_endpoint_url != endpoint_url
+            else self._client
+        )
+        self._transfer = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=concurrency,
+        )
+
+    @classmethod
+    def from_location(cls, location: str) -> "S3Storage":
+        """s3://bucket/префикс; адреса и параметры из переменных окружения S3_*"""
+        parsed = urlparse(location)
+        return cls(
+            bucket=parsed.netloc,
+            prefix=parsed.path,
+            endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+            presign_endpoint_url=os.getenv("S3_PRESIGN_ENDPOINT_URL") or None,
+            part_size=int(os.getenv("S3_PART_SIZE", str(8 << 20))),
+            concurrency=int(os.getenv("S3_CONCURRENCY", "8")),
+            url_expires=int(os.getenv("S3_URL_EXPIRES", "3600")),
+        )
+
+    def __str__(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def list(self, suffixes: Optional[Tuple[str, ...]] = None) -> List[str]:
+        paginator = self._client.get_paginator("list_objects_v2")
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        keys = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                key = item["Key"][len(prefix):]
+                if key and not key.endswith("/"):
+                    keys.append(key)
+        if suffixes:
+            keys = [key for key in keys if key.lower().endswith(suffixes)]
+        return sorted(keys)
+
+    def read(self, key: str) -> bytes:
+        buffer = io.BytesIO()
+        self._client.download_fileobj(self.bucket, self._key(key), buffer, Config=self._transfer)
+        return buffer.getvalue()
+
+    def write(self, key: str, data: bytes, content_type: str = "application/octet-stream"):
+        self._client.upload_fileobj(
+            io.BytesIO(data), self.bucket, self._key(key),
+            ExtraArgs={"ContentType": content_type}, Config=self._transfer,
+        )
+
+    def download(self, key: str, path: Path):
+        self._client.download_file(self.bucket, self._key(key), str(path), Config=self._transfer)
+
+    def upload(self, path: Path, key: str, content_type: str = "application/octet-stream"):
+        self._client.upload_file(
+            str(path), self.bucket, self._key(key), ExtraArgs={"ContentType": content_type}, Config=self._transfer
+        )
+
+    def url(self, key: str) -> Optional[str]:
+        return self._presign_client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=self.url_expires
+        )
+
+
+def open_storage(location: str) -> Storage:
+    """Хранилище по строке расположения (путь, file:///путь или s3://bucket/префикс)"""
+    if location.startswith("s3://"):
+        return S3Storage.from_location(location)
+    if location.startswith("file://"):
+        location = urlparse(location).path
+    return LocalStorage(Path(location))
+
+
+class InputFiles:
+    """
+    Входные файлы хранилища как локальные пути
+
+    Для локального хранилища - сами файлы; для остальных - параллельная
+    загрузка во временную директорию, которая удаляется при выходе из with.
+    """
+
+    def __init__(self, storage: Storage, keys: List[str], jobs: int = 8):
+        self.storage = storage
+        self.keys = keys
+        self.jobs = jobs
+        self._tmp: Optional[str] = None
+
+    def __enter__(self) -> Dict[str, Path]:
+        paths = {key: self.storage.local_path(key) for key in self.keys}
+        missing = [key for key, path in paths.items() if path is None]
+        if missing:
+            self._tmp = tempfile.mkdtemp(prefix="inputs-")
+            for key, path in zip(missing, self.storage.download_many(missing, Path(self._tmp), self.jobs)):
+                paths[key] = path
+        return paths
+
+    def __exit__(self, *exc):
+        if self._tmp:
+            shutil.rmtree(self._tmp, ignore_errors=True)
@@ -0,0 +1,415 @@
+"""
+Общая очередь заданий в Redis для нескольких узлов обработки
+
+Задание - хэш workqueue:{очередь}:job:<id> с полями: вход (location, key),
+задача, параметры, выход, статус и число попыток. Списки и множества очереди:
+- pending - ожидающие задания (LPUSH при добавлении, RPOP при выдаче);
+- inflight - выданные задания, оценка - срок аренды (visibility timeout);
+- delayed - повторы после ошибки, оценка - время повтора (экспоненциальная пауза);
+- dead - задания, исчерпавшие попытки или с постоянной ошибкой;
+- stats - счетчики (enqueued, done, retried, expired, dead).
+
+Все переходы выполняются Lua-скриптами атомарно, время берется с сервера Redis
+(TIME), поэтому часы узлов не обязаны совпадать. Выдача задания возвращает
+токен аренды; продление, подтверждение и возврат с другим токеном отклоняются:
+если аренда истекла и задание выдано другому узлу, результат первого узла не
+записывается. Гарантия - "хотя бы один раз": задача сервиса должна быть
+идемпотентной (извлечение из документа - идемпотентно).
+
+Работает с Redis и совместимыми серверами с поддержкой Lua (Valkey, KeyDB) в
+режиме одного экземпляра.
+
+Управление из командной строки:
+    python jobqueue.py stats --queue pymupdf
+    python jobqueue.py dead --queue pymupdf
+    python jobqueue.py retry-dead --queue pymupdf
+"""
+import argparse
+import asyncio
+import json
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+
+# Время сервера Redis в миллисекундах
+_NOW = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+"""
+
+# KEYS: pending, inflight, delayed, dead, stats
+# ARGV: префикс ключей заданий, аренда (мс), максимум попыток, узел, токен
+_RESERVE = _NOW + """
+local due = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now, 'LIMIT', 0, 100)
+for _, id in ipairs(due) do
+    redis.call('ZREM', KEYS[3], id)
+    redis.call('HSET', ARGV[1] .. id, 'status', 'pending')
+    redis.call('LPUSH', KEYS[1], id)
+end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, 100)
+for _, id in ipairs(expired) do
+    local key = ARGV[1] .. id
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('HINCRBY', KEYS[5], 'expired', 1)
+    redis.call('HSET', key, 'lease', '', 'error', 'visibility timeout expired')
+    if tonumber(redis.call('HGET', key, 'attempts') or '0') >= tonumber(ARGV[3]) then
+        redis.call('HSET', key, 'status', 'dead', 'finished_at', now)
+        redis.call('LPUSH', KEYS[4], id)
+        redis.call('HINCRBY', KEYS[5], 'dead', 1)
+    else
+        -- В начало очереди: повтор выдается следующим
+        redis.call('HSET', key, 'status', 'pending')
+        redis.call('RPUSH', KEYS[1], id)
+    end
+end
+while true do
+    local id = redis.call('RPOP', KEYS[1])
+    if not id then
+        return false
+    end
+    local key = ARGV[1] .. id
+    -- Задание могло быть удалено (purge) - пропускается
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), id)
+        redis.call('HINCRBY', key, 'attempts', 1)
+        redis.call('HSET', key, 'status', 'running', 'node', ARGV[4], 'lease', ARGV[5], 'started_at', now)
+        return {id, redis.call('HGETALL', key)}
+    end
+end
+"""
+
+# KEYS: inflight; ARGV: ключ задания, id, токен, аренда (мс)
+_EXTEND = _NOW + """
+if redis.call('HGET', ARGV[1], 'lease') ~= ARGV[3] then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[4]), ARGV[2])
+return 1
+"""
+
+# KEYS: inflight, stats; ARGV: ключ задания, id, токен, срок хранения (с), затем пары поле-значение
+_ACK = _NOW + """
+if redis.call('HGET', ARGV[1], 'lease') ~= ARGV[3] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[2])
+redis.call('HSET', ARGV[1], 'status', 'done', 'lease', '', 'finished_at', now)
+for i = 5, #ARGV, 2 do
+    redis.call('HSET', ARGV[1], ARGV[i], ARGV[i + 1])
+end
+if tonumber(ARGV[4]) > 0 then
+    redis.call('EXPIRE', ARGV[1], ARGV[4])
+end
+redis.call('HINCRBY', KEYS[2], 'done', 1)
+return 1
+"""
+
+# KEYS: inflight, delayed, dead, stats
+# ARGV: ключ задания, id, токен, ошибка, повторять (0/1), максимум попыток, пауза (мс), максимальная пауза (мс)
+_NACK = _NOW + """
+if redis.call('HGET', ARGV[1], 'lease') ~= ARGV[3] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[2])
+redis.call('HSET', ARGV[1], 'lease', '', 'error', ARGV[4])
+local attempts = tonumber(redis.call('HGET', ARGV[1], 'attempts') or '0')
+if ARGV[5] == '1' and attempts < tonumber(ARGV[6]) then
+    local delay = math.floor(math.min(tonumber(ARGV[7]) * 2 ^ (attempts - 1), tonumber(ARGV[8])))
+    redis.call('HSET', ARGV[1], 'status', 'retry', 'retry_at', now + delay)
+    redis.call('ZADD', KEYS[2], now + delay, ARGV[2])
+    redis.call('HINCRBY', KEYS[4], 'retried', 1)
+    return 1
+end
+redis.call('HSET', ARGV[1], 'status', 'dead', 'finished_at', now)
+redis.call('LPUSH', KEYS[3], ARGV[2])
+redis.call('HINCRBY', KEYS[4], 'dead', 1)
+return 2
+"""
+
+# KEYS: pending, inflight; ARGV: ключ задания, id, токен
+# Возврат без траты попытки (остановка узла)
+_RELEASE = """
+if redis.call('HGET', ARGV[1], 'lease') ~= ARGV[3] then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('HINCRBY', ARGV[1], 'attempts', -1)
+redis.call('HSET', ARGV[1], 'status', 'pending', 'lease', '')
+redis.call('RPUSH', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS: dead, pending; ARGV: префикс ключей заданий, затем id (без id - все)
+_RETRY_DEAD = """
+local ids = {}
+for i = 2, #ARGV do
+    ids[#ids + 1] = ARGV[i]
+end
+if #ids == 0 then
+    ids = redis.call('LRANGE', KEYS[1], 0, -1)
+end
+local moved = 0
+for _, id in ipairs(ids) do
+    if redis.call('LREM', KEYS[1], 0, id) > 0 then
+        redis.call('HSET', ARGV[1] .. id, 'status', 'pending', 'attempts', 0, 'error', '')
+        redis.call('LPUSH', KEYS[2], id)
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+
+class Job:
+    """Выданное задание: id, токен аренды и поля хэша"""
+
+    __slots__ = ("id", "token", "fields")
+
+    def __init__(self, id: str, token: str, fields: Dict[str, str]):
+        self.id = id
+        self.token = token
+        self.fields = fields
+
+    @property
+    def attempts(self) -> int:
+        return int(self.fields.get("attempts", 0))
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return json.loads(self.fields.get("params") or "{}")
+
+
+class JobQueue:
+    """
+    Очередь заданий одного вида (например, pymupdf или docling)
+
+    Args:
+        redis: Клиент redis.asyncio (decode_responses=True)
+        name: Имя очереди
+        visibility_timeout: Срок аренды задания, секунд; узел продлевает аренду,
+            пока обрабатывает задание, иначе задание выдается снова
+        max_attempts: Максимум попыток, после - в dead
+        retry_backoff: Пауза перед первым повтором, секунд (удваивается с каждой попыткой)
+        retry_backoff_max: Максимальная пауза перед повтором, секунд
+        result_ttl: Время хранения выполненного задания, секунд (0 - без срока)
+    """
+
+    def __init__(
+        self,
+        redis,
+        name: str,
+        visibility_timeout: float = 300,
+        max_attempts: int = 3,
+        retry_backoff: float = 5,
+        retry_backoff_max: float = 300,
+        result_ttl: int = 7 * 24 * 3600,
+    ):
+        self.redis = redis
+        self.name = name
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.result_ttl = result_ttl
+        # Хэш-тег {name}: все ключи очереди в одном слоте
+        prefix = f"workqueue:{{{name}}}"
+        self.pending = f"{prefix}:pending"
+        self.inflight = f"{prefix}:inflight"
+        self.delayed = f"{prefix}:delayed"
+        self.dead_letters = f"{prefix}:dead"
+        self.counters = f"{prefix}:stats"
+        self.job_prefix = f"{prefix}:job:"
+        self._reserve = redis.register_script(_RESERVE)
+        self._extend = redis.register_script(_EXTEND)
+        self._ack = redis.register_script(_ACK)
+        self._nack = redis.register_script(_NACK)
+        self._release = redis.register_script(_RELEASE)
+        self._retry_dead = redis.register_script(_RETRY_DEAD)
+
+    @classmethod
+    def from_env(cls, name: Optional[str] = None) -> "JobQueue":
+        """Настройки из переменных окружения REDIS_URL и QUEUE_*"""
+        import redis.asyncio
+
+        client = redis.asyncio.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        return cls(
+            client,
+            name or os.getenv("QUEUE_NAME", "pymupdf"),
+            visibility_timeout=float(os.getenv("QUEUE_VISIBILITY_TIMEOUT", "300")),
+            max_attempts=int(os.getenv("QUEUE_MAX_ATTEMPTS", "3")),
+            retry_backoff=float(os.getenv("QUEUE_RETRY_BACKOFF", "5")),
+            retry_backoff_max=float(os.getenv("QUEUE_RETRY_BACKOFF_MAX", "300")),
+            result_ttl=int(os.getenv("QUEUE_RESULT_TTL", str(7 * 24 * 3600))),
+        )
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.job_prefix}{job_id}"
+
+    async def enqueue(
+        self,
+        location: str,
+        key: str,
+        task: str = "",
+        params: Optional[Dict[str, Any]] = None,
+        output: str = "",
+        output_format: str = "json",
+        job_id: Optional[str] = None,
+    ) -> str:
+        """
+        Добавление задания
+
+        Args:
+            location: Хранилище входного файла, доступное узлам (путь или s3://, см. storage)
+            key: Ключ файла в хранилище
+            task: Задача сервиса (для PyMuPDF - эндпоинт, например extract_all)
+            params: Параметры запроса к сервису
+            output: Хранилище результатов (пусто - результат сохраняется в задании)
+            output_format: Формат результата в хранилище (см. storage.OUTPUT_FORMATS)
+            job_id: Идентификатор (по умолчанию - случайный)
+
+        Returns:
+            Идентификатор задания
+        """
+        job_id = job_id or uuid.uuid4().hex
+        fields = {
+            "location": location,
+            "key": key,
+            "task": task,
+            "params": json.dumps(params or {}),
+            "output": output,
+            "format": output_format,
+            "status": "pending",
+            "attempts": 0,
+        }
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key(job_id), mapping=fields)
+            pipe.lpush(self.pending, job_id)
+            pipe.hincrby(self.counters, "enqueued", 1)
+            await pipe.execute()
+        return job_id
+
+    async def reserve(self, node: str) -> Optional[Job]:
+        """Следующее задание с арендой на visibility_timeout (None - очередь пуста)"""
+        token = uuid.uuid4().hex
+        reply = await self._reserve(
+            keys=[self.pending, self.inflight, self.delayed, self.dead_letters, self.counters],
+            args=[self.job_prefix, int(self.visibility_timeout * 1000), self.max_attempts, node, token],
+        )
+        if not reply:
+            return None
+        job_id, flat = reply
+        return Job(job_id, token, dict(zip(flat[::2], flat[1::2])))
+
+    async def extend(self, job: Job) -> bool:
+        """Продление аренды (False - аренда потеряна, задание выдано снова)"""
+        return bool(await self._extend(
+            keys=[self.inflight], args=[self._key(job.id), job.id, job.token, int(self.visibility_timeout * 1000)]
+        ))
+
+    async def ack(self, job: Job, fields: Optional[Dict[str, Any]] = None) -> bool:
+        """Задание выполнено; fields - поля результата (False - аренда потеряна)"""
+        args = [self._key(job.id), job.id, job.token, self.result_ttl]
+        for name, value in (fields or {}).items():
+            args.extend((name, value))
+        return bool(await self._ack(keys=[self.inflight, self.counters], args=args))
+
+    async def nack(self, job: Job, error: str, retry: bool = True) -> str:
+        """
+        Ошибка обработки
+
+        Returns:
+            retry - повтор после паузы, dead - в dead, lost - аренда потеряна
+        """
+        result = await self._nack(
+            keys=[self.inflight, self.delayed, self.dead_letters, self.counters],
+            args=[
+                self._key(job.id), job.id, job.token, error[:2000], int(retry), self.max_attempts,
+                int(self.retry_backoff * 1000), int(self.retry_backoff_max * 1000),
+            ],
+        )
+        return {0: "lost", 1: "retry", 2: "dead"}[int(result)]
+
+    async def release(self, job: Job) -> bool:
+        """Возврат задания в начало очереди без траты попытки (остановка узла)"""
+        return bool(await self._release(keys=[self.pending, self.inflight], args=[self._key(job.id), job.id, job.token]))
+
+    async def get(self, job_id: str) -> Optional[Dict[str, str]]:
+        """Поля задания (None - нет или срок хранения истек)"""
+        fields = await self.redis.hgetall(self._key(job_id))
+        return fields or None
+
+    async def statuses(self, job_ids: List[str]) -> List[Optional[str]]:
+        """Статусы заданий одним запросом"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hget(self._key(job_id), "status")
+            return await pipe.execute()
+
+    async def stats(self) -> Dict[str, Any]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self.pending)
+            pipe.zcard(self.inflight)
+            pipe.zcard(self.delayed)
+            pipe.llen(self.dead_letters)
+            pipe.hgetall(self.counters)
+            pending, inflight, delayed, dead, counters = await pipe.execute()
+        return {
+            "queue": self.name,
+            "pending": pending,
+            "inflight": inflight,
+            "delayed": delayed,
+            "dead": dead,
+            "counters": {name: int(value) for name, value in counters.items()},
+        }
+
+    async def dead(self, limit: int = 100) -> List[Dict[str, str]]:
+        """Задания в dead (последние сначала)"""
+        ids = await self.redis.lrange(self.dead_letters, 0, limit - 1)
+        jobs = []
+        for job_id in ids:
+            fields = await self.get(job_id) or {}
+            jobs.append({"id": job_id, **fields})
+        return jobs
+
+    async def retry_dead(self, job_ids: Optional[List[str]] = None) -> int:
+        """Возврат заданий из dead в очередь с обнулением попыток (без ids - все)"""
+        return int(await self._retry_dead(keys=[self.dead_letters, self.pending], args=[self.job_prefix, *(job_ids or [])]))
+
+    async def purge_dead(self) -> int:
+        """Удаление заданий из dead"""
+        ids = await self.redis.lrange(self.dead_letters, 0, -1)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for job_id in ids:
+                pipe.delete(self._key(job_id))
+            pipe.delete(self.dead_letters)
+            await pipe.execute()
+        return len(ids)
+
+
+async def _command(args):
+    queue = JobQueue.from_env(args.queue)
+    try:
+        if args.command == "stats":
+            print(json.dumps(await queue.stats(), ensure_ascii=False, indent=2))
+        elif args.command == "dead":
+            for job in await queue.dead(args.limit):
+                print(f"{job['id']}  {job.get('key', '')}  попыток: {job.get('attempts', '')}  {job.get('error', '')}")
+        elif args.command == "retry-dead":
+            print(f"Возвращено в очередь: {await queue.retry_dead(args.ids)}")
+        elif args.command == "purge-dead":
+            print(f"Удалено: {await queue.purge_dead()}")
+    finally:
+        await queue.redis.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Управление очередью заданий")
+    parser.add_argument("command", choices=("stats", "dead", "retry-dead", "purge-dead"))
+    parser.add_argument("ids", nargs="*", help="Идентификаторы заданий для retry-dead (по умолчанию: все)")
+    parser.add_argument("--queue", default=os.getenv("QUEUE_NAME", "pymupdf"), help="Имя очереди")
+    parser.add_argument("--limit", type=int, default=100, help="Число заданий в выводе dead")
+    asyncio.run(_command(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Пример использования общей очереди заданий
+
+Ставит в очередь задания на все файлы из INPUT_LOCATION и ждет, пока узлы их
+выполнят. Узлы читают файлы из JOB_INPUT_LOCATION - то же хранилище, как его
+видят узлы (в docker-compose.yaml папка input/ смонтирована в /data/input;
+для нескольких машин - s3://, см. storage/readme.md). Результаты узлы пишут в
+JOB_OUTPUT_LOCATION; при пустом значении результат хранится в задании и
+сохраняется клиентом в output/.
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+from jobqueue import JobQueue
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "storage"))
+from storage import open_storage, result_key
+
+
+INPUT_DIR = Path(__file__).parent / "input"
+OUTPUT_DIR = Path(__file__).parent / "output"
+INPUT_LOCATION = os.getenv("INPUT_LOCATION", str(INPUT_DIR))
+JOB_INPUT_LOCATION = os.getenv("JOB_INPUT_LOCATION", "/data/input")
+JOB_OUTPUT_LOCATION = os.getenv("JOB_OUTPUT_LOCATION", "/data/output")
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "json")
+QUEUE_NAME = os.getenv("QUEUE_NAME", "pymupdf")
+# Задача сервиса: для PyMuPDF - эндпоинт (extract_all, extract_text, ...)
+TASK = os.getenv("TASK", "extract_all")
+
+
+async def main():
+    print("=" * 60)
+    print(f"Очередь заданий: {QUEUE_NAME}")
+    print("=" * 60)
+
+    queue = JobQueue.from_env(QUEUE_NAME)
+    try:
+        keys = open_storage(INPUT_LOCATION).list()
+        if not keys:
+            print(f"Файлы не найдены: {INPUT_LOCATION}")
+            return
+
+        started = time.perf_counter()
+        ids = {
+            await queue.enqueue(JOB_INPUT_LOCATION, key, TASK, output=JOB_OUTPUT_LOCATION, output_format=OUTPUT_FORMAT): key
+            for key in keys
+        }
+        print(f"Заданий: {len(ids)}")
+
+        # Ожидание выполнения: done или dead у всех заданий
+        while True:
+            statuses = dict(zip(ids, await queue.statuses(list(ids))))
+            finished = sum(status in ("done", "dead", None) for status in statuses.values())
+            print(f"\rВыполнено: {finished}/{len(ids)}  {await queue.stats()}", end="", flush=True)
+            if finished == len(ids):
+                break
+            await asyncio.sleep(1)
+        elapsed = time.perf_counter() - started
+        print(f"\nВремя: {elapsed:.1f} с ({len(ids) / elapsed:.2f} файлов/с)")
+
+        for job_id, key in ids.items():
+            job = await queue.get(job_id) or {}
+            if job.get("status") != "done":
+                print(f"✗ {key}: {job.get('error', 'задание не найдено')}")
+            elif job.get("result_key"):
+                print(f"✓ {key} -> {JOB_OUTPUT_LOCATION}/{job['result_key']} ({job['node']}, {job['elapsed']} с)")
+            else:
+                output_file = OUTPUT_DIR / result_key(key)
+                output_file.parent.mkdir(parents=True, exist_ok=True)
+                output_file.write_text(job["result"], encoding="utf-8")
+                print(f"✓ {key} -> {output_file} ({job['node']}, {job['elapsed']} с)")
+    finally:
+        await queue.redis.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,294 @@
+"""
+Рабочий узел очереди заданий (сайдкар рядом с сервисом)
+
+Берет задания из общей очереди (jobqueue.py), читает входной файл из
+хранилища (storage), отправляет его локальному сервису (PyMuPDF или Docling)
+и сохраняет результат. Узел берет новое задание, только когда освобождается
+один из WORKER_CONCURRENCY слотов, поэтому задания распределяются по
+свободным узлам и добавление узла увеличивает пропускную способность без
+настройки клиентов.
+
+Пока задание обрабатывается, аренда продлевается каждые visibility_timeout / 3.
+Ответы 408, 500, 502, 504 и обрывы соединения - повтор с паузой; остальные 4xx
+(поврежденный файл, неподдерживаемый формат) - сразу в dead. Если сервис узла
+недоступен или перегружен (нет соединения, 429, 503), задание возвращается в
+очередь без траты попытки, а узел делает паузу (до WORKER_MAX_BACKOFF секунд) -
+неработающий узел не забирает задания у остальных. При остановке
+(SIGTERM) узел перестает брать задания, дожидается текущих в течение
+WORKER_SHUTDOWN_GRACE секунд и возвращает незавершенные в очередь.
+
+Запуск:
+    REDIS_URL=redis://localhost:6379/0 WORKER_BACKEND=pymupdf python worker.py
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import httpx
+
+from jobqueue import Job, JobQueue
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "storage"))
+from storage import Storage, open_storage
+
+logger = logging.getLogger("workqueue")
+
+# Ответы сервиса, после которых задание повторяется
+RETRY_STATUSES = {408, 500, 502, 504}
+# Сервис перегружен: задание возвращается в очередь, узел делает паузу
+UNAVAILABLE_STATUSES = {429, 503}
+
+
+class PermanentError(Exception):
+    """Ошибка, которая не исправится повтором (задание сразу в dead)"""
+
+
+class BackendUnavailable(Exception):
+    """Сервис узла недоступен или перегружен - проблема узла, а не задания"""
+
+
+async def call_pymupdf(client: httpx.AsyncClient, url: str, task: str, filename: str, content: bytes,
+                       params: Dict[str, Any]) -> httpx.Response:
+    """Задача - эндпоинт PyMuPDF сервиса (по умолчанию: extract_all), params - параметры запроса"""
+    return await client.post(
+        f"{url}/{task or 'extract_all'}",
+        params=params,
+        files={"file": (filename, content, "application/octet-stream")},
+        headers={"Accept": "application/json"},
+    )
+
+
+async def call_docling(client: httpx.AsyncClient, url: str, task: str, filename: str, content: bytes,
+                       params: Dict[str, Any]) -> httpx.Response:
+    """Конвертация файла в docling-serve, params - поля формы (например, to_formats)"""
+    return await client.post(
+        f"{url}/convert/file",
+        data=params,
+        files={"files": (filename, content, "application/octet-stream")},
+    )
+
+
+# Бэкенд -> функция запроса и адрес сервиса по умолчанию
+BACKENDS = {
+    "pymupdf": (call_pymupdf, "http://localhost:8000"),
+    "docling": (call_docling, "http://localhost:5001/v1"),
+}
+
+
+class Worker:
+    """
+    Рабочий узел
+
+    Args:
+        queue: Очередь заданий
+        backend: Имя бэкенда (pymupdf, docling)
+        url: Базовый URL сервиса
+        concurrency: Одновременно обрабатываемых заданий на узле
+        request_timeout: Таймаут запроса к сервису, секунд
+        poll_interval: Пауза опроса пустой очереди, секунд
+        shutdown_grace: Ожидание текущих заданий при остановке, секунд
+        max_backoff: Максимальная пауза узла при недоступном сервисе, секунд
+        node: Имя узла в заданиях (по умолчанию: имя хоста и pid)
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        backend: str = "pymupdf",
+        url: Optional[str] = None,
+        concurrency: int = 4,
+        request_timeout: float = 600,
+        poll_interval: float = 0.5,
+        shutdown_grace: float = 30,
+        max_backoff: float = 30,
+        node: Optional[str] = None,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд: {backend}. Доступны: {', '.join(BACKENDS)}")
+        self.queue = queue
+        self.backend = backend
+        self._call, default_url = BACKENDS[backend]
+        self.url = (url or default_url).rstrip("/")
+        self.concurrency = concurrency
+        self.request_timeout = request_timeout
+        self.poll_interval = poll_interval
+        self.shutdown_grace = shutdown_grace
+        self.max_backoff = max_backoff
+        self.node = node or f"{socket.gethostname()}-{os.getpid()}"
+        self._storages: Dict[str, Storage] = {}
+        self._stopping = asyncio.Event()
+        self.done = 0
+        self.failed = 0
+        self.in_flight = 0
+        # Текущая пауза узла (0 - сервис доступен)
+        self._backoff = 0.0
+
+    @classmethod
+    def from_env(cls) -> "Worker":
+        """Настройки из переменных окружения WORKER_* и очереди (REDIS_URL, QUEUE_*)"""
+        backend = os.getenv("WORKER_BACKEND", "pymupdf")
+        return cls(
+            JobQueue.from_env(os.getenv("QUEUE_NAME") or backend),
+            backend=backend,
+            url=os.getenv("WORKER_BACKEND_URL") or None,
+            concurrency=int(os.getenv("WORKER_CONCURRENCY", "4")),
+            request_timeout=float(os.getenv("WORKER_REQUEST_TIMEOUT", "600")),
+            poll_interval=float(os.getenv("WORKER_POLL_INTERVAL", "0.5")),
+            shutdown_grace=float(os.getenv("WORKER_SHUTDOWN_GRACE", "30")),
+            max_backoff=float(os.getenv("WORKER_MAX_BACKOFF", "30")),
+            node=os.getenv("WORKER_NODE") or None,
+        )
+
+    def _storage(self, location: str) -> Storage:
+        if location not in self._storages:
+            self._storages[location] = open_storage(location)
+        return self._storages[location]
+
+    def stop(self):
+        """Прекратить выдачу новых заданий"""
+        self._stopping.set()
+
+    async def run(self):
+        """Слоты обработки до остановки"""
+        logger.info(
+            "Узел %s: очередь %s, бэкенд %s (%s), слотов: %d",
+            self.node, self.queue.name, self.backend, self.url, self.concurrency,
+        )
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(timeout=self.request_timeout, limits=limits) as client:
+            await asyncio.gather(*(self._slot(client) for _ in range(self.concurrency)))
+        logger.info("Узел %s остановлен: выполнено %d, ошибок %d", self.node, self.done, self.failed)
+
+    async def _wait(self, seconds: float):
+        """Пауза, прерываемая остановкой узла"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _slot(self, client: httpx.AsyncClient):
+        while not self._stopping.is_set():
+            if self._backoff:
+                await self._wait(self._backoff)
+                if self._stopping.is_set():
+                    break
+            try:
+                job = await self.queue.reserve(self.node)
+            except Exception as e:
+                logger.warning("Очередь недоступна: %s", e)
+                job = None
+            if job is None:
+                await self._wait(self.poll_interval)
+                continue
+            await self._run_job(client, job)
+
+    async def _run_job(self, client: httpx.AsyncClient, job: Job):
+        self.in_flight += 1
+        task = asyncio.create_task(self._process(client, job))
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        stopping = asyncio.create_task(self._stopping.wait())
+        try:
+            await asyncio.wait({task, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            if not task.done():
+                # Остановка узла: время на завершение, затем возврат в очередь
+                done, _ = await asyncio.wait({task}, timeout=self.shutdown_grace)
+                if not done:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    await self.queue.release(job)
+                    logger.info("Задание %s возвращено в очередь", job.id)
+                    return
+            await self._finish(job, task)
+        except Exception as e:
+            # Очередь недоступна: задание вернется в очередь по истечении аренды,
+            # слот продолжает работу
+            logger.warning("Задание %s: очередь недоступна (%s), задание вернется по истечении аренды", job.id, e)
+        finally:
+            stopping.cancel()
+            heartbeat.cancel()
+            self.in_flight -= 1
+
+    async def _finish(self, job: Job, task: "asyncio.Task"):
+        name = job.fields.get("key", job.id)
+        error = task.exception()
+        if isinstance(error, BackendUnavailable):
+            self._backoff = min(max(self._backoff * 2, 1.0), self.max_backoff)
+            await self.queue.release(job)
+            logger.warning("Сервис недоступен (%s): задание %s возвращено, пауза %.0f с", error, job.id, self._backoff)
+            return
+        self._backoff = 0.0
+        if error is None:
+            if await self.queue.ack(job, task.result()):
+                self.done += 1
+                logger.info("Задание %s (%s) выполнено", job.id, name)
+            else:
+                logger.warning("Задание %s (%s): аренда потеряна, результат отброшен", job.id, name)
+            return
+        self.failed += 1
+        state = await self.queue.nack(job, f"{type(error).__name__}: {error}", retry=not isinstance(error, PermanentError))
+        logger.warning("Задание %s (%s), попытка %d: %s -> %s", job.id, name, job.attempts, error, state)
+
+    async def _heartbeat(self, job: Job):
+        interval = max(self.queue.visibility_timeout / 3, 0.1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self.queue.extend(job):
+                    logger.warning("Задание %s: аренда потеряна", job.id)
+                    return
+            except Exception as e:
+                logger.warning("Задание %s: не удалось продлить аренду: %s", job.id, e)
+
+    async def _process(self, client: httpx.AsyncClient, job: Job) -> Dict[str, Any]:
+        """Обработка задания; возвращает поля результата для задания"""
+        key = job.fields["key"]
+        try:
+            content = await asyncio.to_thread(self._storage(job.fields["location"]).read, key)
+        except FileNotFoundError as e:
+            raise PermanentError(f"Входной файл не найден: {key}") from e
+
+        started = time.perf_counter()
+        try:
+            response = await self._call(client, self.url, job.fields.get("task", ""), Path(key).name, content, job.params)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            raise BackendUnavailable(str(e) or type(e).__name__) from e
+        if response.status_code in UNAVAILABLE_STATUSES:
+            raise BackendUnavailable(f"HTTP {response.status_code}")
+        if response.status_code in RETRY_STATUSES:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:500]}")
+        if response.status_code != 200:
+            raise PermanentError(f"HTTP {response.status_code}: {response.text[:500]}")
+        result = response.json()
+
+        fields = {"elapsed": f"{time.perf_counter() - started:.3f}"}
+        output = job.fields.get("output")
+        if output:
+            fields["result_key"] = await asyncio.to_thread(
+                self._storage(output).save_result, key, result, job.fields.get("format") or "json"
+            )
+        else:
+            fields["result"] = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+        return fields
+
+
+async def main():
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(message)s")
+    worker = Worker.from_env()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await worker.queue.redis.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())